@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AnitaAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'aniTA_app'
+
+    def ready(self):
+        if getattr(settings, 'EMBEDDING_SERVICE', {}).get('WARM_UP'):
+            from .services.embedding_service import get_embedding_service
+            try:
+                get_embedding_service().warm_up()
+            except Exception as e:
+                print(f"Embedding model warm-up failed: {e}", flush=True)
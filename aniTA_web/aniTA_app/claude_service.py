@@ -4,11 +4,11 @@ import base64
 import tempfile
 import re
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from django.conf import settings
 from anthropic import Anthropic
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from users.material_db import (
     get_course_material,
     get_rubric,
@@ -21,6 +21,13 @@ from users.material_db import (
     store_vector_embeddings
 )
 from users.arangodb import db
+from users.blob_store import get_blob_store
+from users.section_index import invalidate_section_index
+from .services.embedding_service import get_embedding_service
+from .services.pdf_text import get_text_extractor
+from .services.answer_segmentation import segment_answers
+from .grading_cache import get_grading_cache
+from .services.usage import add_usage, describe_usage, empty_usage, usage_from_response
 
 # Simple function to get a response from Claude
 def get_claude_response(prompt, max_tokens=1000):
@@ -52,29 +59,38 @@ def get_claude_response(prompt, max_tokens=1000):
         return f"Error: Could not get response from Claude. {str(e)}"
 
 class ClaudeGradingService:
-    def __init__(self, api_key=None):
-        self.api_key = api_key or getattr(settings, 'ANTHROPIC_API_KEY', os.getenv('ANTHROPIC_API_KEY'))
-        if not self.api_key:
-            raise ValueError("Anthropic API key is required.")
-        self.client = Anthropic(api_key=self.api_key)
-        self.model = "claude-3-haiku-20240307"
-        self.embeddings_model = None
+    # Bump when the grading prompt changes so cached grades are not reused
+    PROMPT_VERSION = 3
 
-    def get_embeddings_model(self):
-        if self.embeddings_model is None:
-            self.embeddings_model = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2"
-            )
-        return self.embeddings_model
+    GRADING_INSTRUCTIONS = (
+        "You are an AI teaching assistant that grades student submissions according to rubrics. "
+        "The assignment's rubric, questions and course material follow. The student's work and "
+        "the required response format are given in the user message."
+    )
 
-    def extract_text_from_pdf(self, pdf_path):
-        try:
-            import pdfplumber
-            with pdfplumber.open(pdf_path) as pdf:
-                return "\n".join([p.extract_text() for p in pdf.pages if p.extract_text()])
-        except Exception as e:
-            print(f"Error extracting text from PDF: {e}")
-            return ""
+    def __init__(self, api_key=None, client=None):
+        """
+        Args:
+            api_key (str): Anthropic API key (defaults to settings)
+            client: Object with the Anthropic client's `messages.create`
+                interface, e.g. a rate-limited wrapper or a local stub. When
+                given, no API key is needed.
+        """
+        if client is not None:
+            self.client = client
+        else:
+            self.api_key = api_key or getattr(settings, 'ANTHROPIC_API_KEY', os.getenv('ANTHROPIC_API_KEY'))
+            if not self.api_key:
+                raise ValueError("Anthropic API key is required.")
+            self.client = Anthropic(api_key=self.api_key)
+        self.model = "claude-3-haiku-20240307"
+        self.grading_cache = get_grading_cache()
+        # Shared by every instance in this process, so the model loads once
+        self.embedding_service = get_embedding_service()
+
+    def extract_text_from_pdf(self, pdf_path, sha256=None):
+        """Text of a PDF, cached by file hash; sha256 skips hashing a blob whose digest is known."""
+        return get_text_extractor().extract(pdf_path, sha256)
 
     def extract_questions_from_text(self, text):
         pattern = re.compile(r"(Q\d+[:.\s]+)(.*?)(?=\nQ\d+[:.\s]+|$)", re.DOTALL | re.IGNORECASE)
@@ -103,8 +119,7 @@ class ClaudeGradingService:
         return splitter.split_text(text)
 
     def create_embeddings(self, text_chunks):
-        embeddings_model = self.get_embeddings_model()
-        embeddings = embeddings_model.embed_documents(text_chunks)
+        embeddings = self.embedding_service.embed_many(text_chunks)
         return [
             {"text": chunk, "embedding": embedding}
             for chunk, embedding in zip(text_chunks, embeddings)
@@ -130,19 +145,27 @@ class ClaudeGradingService:
             })
         return sections
 
-    def process_course_material(self, class_code, assignment_id, pdf_path, rubric_items=None):
-        extracted_text = self.extract_text_from_pdf(pdf_path)
+    def process_course_material(self, class_code, assignment_id, pdf_path, rubric_items=None,
+                                file_blob=None, file_name=None):
+        """
+        Args:
+            file_blob (dict): Blob reference when the PDF is already stored
+                (see uploads.BlobUploadHandler); stored from pdf_path otherwise
+            file_name (str): Name to record, defaults to pdf_path's basename
+        """
+        if file_blob is None:
+            with open(pdf_path, 'rb') as pdf_file:
+                file_blob = get_blob_store().put_file(pdf_file)
+
+        extracted_text = self.extract_text_from_pdf(pdf_path, file_blob["sha256"])
         if not extracted_text:
             return {"error": "Could not extract text from PDF"}
 
-        with open(pdf_path, 'rb') as pdf_file:
-            file_content = base64.b64encode(pdf_file.read()).decode('utf-8')
-
         material_id = store_course_material(
             class_code,
             assignment_id,
-            file_content,
-            os.path.basename(pdf_path),
+            file_blob,
+            file_name or os.path.basename(pdf_path),
             extracted_text
         )
 
@@ -165,6 +188,7 @@ class ClaudeGradingService:
                 "content": section["content"],
                 "created_at": datetime.utcnow().isoformat()
             })
+        invalidate_section_index(assignment_id)
 
         if rubric_items:
             store_rubric(class_code, assignment_id, rubric_items)
@@ -198,8 +222,7 @@ class ClaudeGradingService:
             context["rubric"] = rubric.get("items", [])
 
         if query_text and context["material_text"]:
-            embeddings_model = self.get_embeddings_model()
-            query_embedding = embeddings_model.embed_documents([query_text])[0]
+            query_embedding = self.embedding_service.embed_one(query_text)
 
             similar_chunks = get_similar_chunks(
                 class_code,
@@ -213,100 +236,429 @@ class ClaudeGradingService:
         return context
 
     def match_student_answers(self, student_text, questions):
-        answers = []
-        for i, question in enumerate(questions):
-            q_text = question["text"]
-            q_id = question["id"]
-
-            index = student_text.find(q_text)
-            if index == -1:
-                index = student_text.find(q_id)
-                if index == -1:
-                    answers.append({
-                        "question_id": q_id,
-                        "question_text": q_text,
-                        "student_answer": ""
-                    })
-                    continue
-
-            start = index + len(q_text)
-            next_q = None
-
-            if i + 1 < len(questions):
-                next_q_text = questions[i+1]["text"]
-                next_q_id = questions[i+1]["id"]
-                next_index = student_text.find(next_q_text, start)
-                if next_index == -1:
-                    next_index = student_text.find(next_q_id, start)
-                next_q = next_index if next_index != -1 else None
-
-            end = next_q if next_q is not None else len(student_text)
-            answer = student_text[start:end].strip()
-
-            answers.append({
-                "question_id": q_id,
-                "question_text": q_text,
-                "student_answer": answer
-            })
-        return answers
+        """Per-question answers with match confidence; see services/answer_segmentation.py."""
+        return segment_answers(student_text, questions)
 
-    def grade_submission(self, student_text, context, class_code, assignment_id):
-        questions = context.get("questions", [])
-        matched_answers = self.match_student_answers(student_text, questions)
+    def grade_submission(self, student_text, context, class_code, assignment_id, per_question=None):
+        """
+        Grade a submission, reusing a cached result for the same (or, if
+        enabled, a near-identical) answer under the same rubric and questions.
+
+        Args:
+            per_question (bool): Grade each matched question with its own
+                concurrent request (defaults to CLAUDE_GRADING["PER_QUESTION"]).
+                Needs extracted questions; otherwise the whole submission is
+                graded in one request.
+        """
+        if per_question is None:
+            per_question = getattr(settings, 'CLAUDE_GRADING', {}).get('PER_QUESTION', False)
+        per_question = per_question and bool(context.get("questions"))
+        grade = self._grade_per_question if per_question else self._grade_with_claude
+
+        if self.grading_cache is None:
+            return grade(student_text, context, class_code, assignment_id)
+
+        scope = self._cache_scope(class_code, assignment_id, context, per_question)
+        cached = self._cached_result(scope, student_text, context)
+        if cached is not None:
+            return cached
+
+        result = grade(student_text, context, class_code, assignment_id)
+        self._store_cached(scope, student_text, result)
+        return result
+
+    def _cache_scope(self, class_code, assignment_id, context, per_question=False):
+        prompt_version = f"{self.PROMPT_VERSION}{'-per-question' if per_question else ''}"
+        return self.grading_cache.scope(self.model, prompt_version, class_code, assignment_id,
+                                        context.get("rubric", []), context.get("questions", []),
+                                        context.get("material_text", ""))
+
+    def _cached_result(self, scope, student_text, context):
+        cached, tier = self.grading_cache.lookup(scope, student_text)
+        if cached is None:
+            return None
+        print(f"Grading cache hit ({tier}) for {cached.get('assignment_id')}", flush=True)
+        cached["cache"] = tier
+        cached["relevant_chunks"] = context.get("relevant_chunks", [])
+        cached["usage"] = empty_usage()
+        return cached
+
+    def _store_cached(self, scope, student_text, result):
+        # Only cache real grades, not the defaults used when the call or parsing failed
+        if result.get("error"):
+            return
+        cacheable = {k: v for k, v in result.items() if k not in ("relevant_chunks", "student_id", "usage")}
+        try:
+            self.grading_cache.store(scope, student_text, cacheable)
+        except Exception as e:
+            print(f"Could not store grading cache entry: {e}", flush=True)
 
-        rubric_text = ""
-        rubric_items = context.get("rubric", [])
-        if rubric_items:
-            rubric_text = "Grading Rubric:\n"
-            for item in rubric_items:
-                criteria = item.get("criteria", "")
-                points = item.get("points", 0)
-                description = item.get("description", "")
-                rubric_text += f"- {criteria} ({points} points): {description}\n"
+    def stream_grade_submission(self, student_text, context, class_code, assignment_id):
+        """
+        Grade a whole submission with the streaming API, asking for one JSON
+        line per question so feedback can be shown as each line completes.
 
+        Yields:
+            ("question", item) for each graded question, then
+            ("result", grading result) once, in the same shape as
+            grade_submission() returns
+        """
+        scope = None
+        if self.grading_cache is not None:
+            scope = self._cache_scope(class_code, assignment_id, context)
+            cached = self._cached_result(scope, student_text, context)
+            if cached is not None:
+                for item in cached.get("results", []):
+                    yield "question", item
+                yield "result", cached
+                return
+
+        matched_answers = self.match_student_answers(student_text, context.get("questions", []))
         relevant_context = ""
         relevant_chunks = context.get("relevant_chunks", [])
         if relevant_chunks:
             relevant_context = "Relevant Course Material:\n" + "\n---\n".join(relevant_chunks)
 
-        system_prompt = """
-        You are an AI teaching assistant that grades student submissions according to rubrics.
-        
-        IMPORTANT: You must respond ONLY with a valid JSON object and nothing else.
-        Do not include any explanations, markdown formatting, or code blocks around the JSON.
-        
-        Your JSON response must include:
-        1. A "total_score" field with a numeric value between 0 and 100
-        2. A "results" array containing objects with "question", "score", and "justification" fields
-        
-        Example of valid response format:
-        {"total_score": 85, "results": [{"question": "Question 1", "score": 85, "justification": "Good work because..."}]}
-        """
+        # Everything specific to this student comes after the cached prefix
+        user_prompt = f"""{relevant_context}
 
-        user_prompt = f"""
-        Class: {class_code}
-        Assignment: {assignment_id}
-        
-        {rubric_text}
-        
-        {relevant_context}
-        
-        Student Submission:
-        {student_text}
-        
-        Matched Answers:
-        {matched_answers}
-        """
+Student Submission:
+{student_text}
+
+Matched Answers:
+{matched_answers}
 
+IMPORTANT: Respond ONLY with JSON Lines and nothing else: one JSON object per line.
+First write one line per question with "question", "score" (0 to 100) and "justification" fields,
+then a final line with a "total_score" field (0 to 100).
+
+Example of valid response format:
+{{"question": "Question 1", "score": 85, "justification": "Good work because..."}}
+{{"question": "Question 2", "score": 70, "justification": "Partially correct because..."}}
+{{"total_score": 77.5}}
+"""
+
+        results = []
+        total_score = None
         try:
-            print("Calling Claude API for grading...", flush=True)
-            response = self.client.messages.create(
+            print("Streaming Claude API grading...", flush=True)
+            with self.client.messages.stream(
                 model=self.model,
                 max_tokens=4000,
-                system=system_prompt,
+                system=self.static_prompt_blocks(class_code, assignment_id, context),
                 messages=[{"role": "user", "content": user_prompt}]
-            )
-            content = response.content[0].text
+            ) as stream:
+                buffer = ""
+                for text in stream.text_stream:
+                    buffer += text
+                    while "\n" in buffer:
+                        line, buffer = buffer.split("\n", 1)
+                        item, score = self._parse_stream_line(line)
+                        if item:
+                            results.append(item)
+                            yield "question", item
+                        if score is not None:
+                            total_score = score
+                item, score = self._parse_stream_line(buffer)
+                if item:
+                    results.append(item)
+                    yield "question", item
+                if score is not None:
+                    total_score = score
+                usage = usage_from_response(stream.get_final_message(), self.model)
+            print(f"Claude usage: {describe_usage(usage)}", flush=True)
+        except Exception as e:
+            print(f"Error during streamed grading with Claude: {e}", flush=True)
+            yield "result", {
+                "error": str(e),
+                "retryable": True,
+                "usage": empty_usage(),
+                "student_id": "",
+                "assignment_id": assignment_id,
+                "total_score": 70.0,
+                "results": results
+            }
+            return
+
+        result = {
+            "student_id": "",
+            "assignment_id": assignment_id,
+            "total_score": total_score,
+            "results": results,
+            "relevant_chunks": relevant_chunks,
+            "usage": usage
+        }
+        if not results:
+            result["error"] = "Could not parse any question from the streamed Claude response"
+            result["total_score"] = 70.0
+        elif total_score is None:
+            result["total_score"] = sum(item["score"] for item in results) / len(results)
+        if scope is not None:
+            self._store_cached(scope, student_text, result)
+        yield "result", result
+
+    def _parse_stream_line(self, line):
+        """Parse one JSON Lines row: returns (question item or None, total score or None)."""
+        line = line.strip().strip(",")
+        if not line.startswith("{"):
+            return None, None  # Blank lines, code fences, stray prose
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            print(f"Skipping malformed streamed line: {line[:100]}", flush=True)
+            return None, None
+        if "question" in row and "score" in row:
+            try:
+                row["score"] = float(row["score"])
+            except (TypeError, ValueError):
+                return None, None
+            return {k: row[k] for k in ("question", "score", "justification") if k in row}, None
+        if "total_score" in row:
+            try:
+                return None, float(row["total_score"])
+            except (TypeError, ValueError):
+                return None, None
+        return None, None
+
+    def static_prompt_blocks(self, class_code, assignment_id, context):
+        """
+        System prompt shared byte-for-byte by every grading call of an
+        assignment: instructions, rubric, questions and course material.
+        It depends only on the assignment (never on the student or on
+        retrieval), so it is marked cacheable and the provider can reuse it
+        across students.
+        """
+        config = getattr(settings, 'CLAUDE_GRADING', {})
+        parts = [self.GRADING_INSTRUCTIONS, f"Class: {class_code}\nAssignment: {assignment_id}"]
+
+        rubric_items = context.get("rubric") or []
+        if rubric_items:
+            parts.append("Grading Rubric:\n" + "".join(
+                f"- {item.get('criteria', '')} ({item.get('points', 0)} points): {item.get('description', '')}\n"
+                for item in rubric_items).rstrip())
+
+        questions = context.get("questions") or []
+        if questions:
+            lines = []
+            for question in questions:
+                lines.append(f"{question.get('id', '')}: {question.get('text', '')}")
+                if question.get("expected_answer"):
+                    lines.append(f"Expected Answer: {question['expected_answer']}")
+            parts.append("Questions:\n" + "\n".join(lines))
+
+        material = (context.get("material_text") or "").strip()
+        max_chars = config.get('STATIC_MATERIAL_CHARS', 20000)
+        if material and max_chars:
+            parts.append("Course Material:\n" + material[:max_chars])
+
+        return [{"type": "text", "text": "\n\n".join(parts), "cache_control": {"type": "ephemeral"}}]
+
+    def _call_claude(self, static_blocks, user_prompt, max_tokens):
+        """
+        Send one grading request.
+
+        Returns:
+            tuple: (response text, usage dict from services/usage.py)
+        """
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=static_blocks,
+            messages=[{"role": "user", "content": user_prompt}]
+        )
+        usage = usage_from_response(response, self.model)
+        print(f"Claude usage: {describe_usage(usage)}", flush=True)
+        return response.content[0].text, usage
+
+    def question_rubric_items(self, question, rubric_items):
+        """
+        Rubric items that refer to a question by its ID or number (e.g. "Q2",
+        "Question 2"); empty when none do, which is the usual case for
+        "Criteria - Points: Description" rubrics.
+        """
+        rubric_items = rubric_items or []
+        q_id = str(question.get("id", ""))
+        number = re.search(r"\d+", q_id)
+        patterns = [re.compile(rf"\b{re.escape(q_id)}\b", re.IGNORECASE)] if q_id else []
+        if number:
+            patterns.append(re.compile(rf"\b(?:q|question)\s*{number.group()}\b", re.IGNORECASE))
+
+        matching = [
+            item for item in rubric_items
+            if any(p.search(f"{item.get('criteria', '')} {item.get('description', '')}") for p in patterns)
+        ]
+        return matching
+
+    def _question_chunks(self, class_code, assignment_id, context, matched_answers):
+        """Retrieve course material chunks for each question, embedding all queries in one batch."""
+        if not context.get("material_text"):
+            return [[] for _ in matched_answers]
+        queries = [f"{a['question_text']}\n{a['student_answer']}" for a in matched_answers]
+        chunks = []
+        for embedding in self.embedding_service.embed_many(queries):
+            similar = get_similar_chunks(class_code, assignment_id, embedding)
+            chunks.append([chunk["text"] for chunk in similar])
+        return chunks
+
+    def _grade_question(self, static_blocks, question, answer, rubric_items, chunks):
+        """
+        Grade one question. Raises on API errors and unparseable responses
+        so the caller can retry just this question.
+
+        Args:
+            rubric_items (list): Rubric items specific to this question; the
+                model is asked which of them the answer falls short on.
+                Empty to grade against the whole rubric in the prompt, in
+                which case no criteria are flagged.
+
+        Returns:
+            tuple: ({"score": float, "justification": str,
+            "rubric_criteria": [{"criteria": name}] flagged by the model},
+            usage dict)
+        """
+        names = [item.get("criteria", "") for item in rubric_items or [] if item.get("criteria")]
+        criteria = ", ".join(names)
+        relevant_context = ""
+        if chunks:
+            relevant_context = "Relevant Course Material:\n" + "\n---\n".join(chunks)
+        expected = question.get("expected_answer", "")
+
+        # Everything specific to this question and student comes after the cached prefix
+        user_prompt = f"""{relevant_context}
+
+Grade only the following question{f", using these rubric criteria: {criteria}" if criteria else ""}.
+
+Question {question.get("id", "")}: {question.get("text", "")}
+{f"Expected Answer: {expected}" if expected else ""}
+
+Student Answer:
+{answer or "(no answer found in the submission)"}
+
+IMPORTANT: You must respond ONLY with a valid JSON object and nothing else.
+The JSON object must have a "score" field with a numeric value between 0 and 100
+and a "justification" field explaining the score.{'''
+It must also have a "rubric_criteria" field: a list of the rubric criteria above that the answer
+falls short on, spelled exactly as given (an empty list if none).''' if criteria else ""}
+
+Example of valid response format:
+{{"score": 85, "justification": "Good work because..."{', "rubric_criteria": []' if criteria else ""}}}
+"""
+
+        content, usage = self._call_claude(static_blocks, user_prompt, max_tokens=1000)
+        match = re.search(r"(\{.*\})", content, re.DOTALL)
+        result = json.loads(match.group(1) if match else content)
+        # Only criteria offered for this question; anything else the model names is dropped
+        flagged = result.get("rubric_criteria") or []
+        flagged = [name for name in dict.fromkeys(flagged if isinstance(flagged, list) else []) if name in names]
+        return {"score": float(result["score"]), "justification": str(result.get("justification", "")),
+                "rubric_criteria": [{"criteria": name} for name in flagged]}, usage
+
+    def _grade_per_question(self, student_text, context, class_code, assignment_id):
+        """
+        Grade every matched question as an independent concurrent request
+        and merge the answers into the usual result shape. Questions whose
+        request fails or returns malformed JSON are retried on their own, up
+        to CLAUDE_GRADING["QUESTION_RETRIES"] more times.
+        """
+        config = getattr(settings, 'CLAUDE_GRADING', {})
+        questions = context.get("questions", [])
+        matched_answers = self.match_student_answers(student_text, questions)
+        question_chunks = self._question_chunks(class_code, assignment_id, context, matched_answers)
+        question_rubrics = [self.question_rubric_items(q, context.get("rubric", [])) for q in questions]
+
+        static_blocks = self.static_prompt_blocks(class_code, assignment_id, context)
+        usage = empty_usage()
+        graded = [None] * len(questions)
+        errors = {}
+        pending = list(range(len(questions)))
+        with ThreadPoolExecutor(max_workers=config.get('PER_QUESTION_CONCURRENCY', 4)) as executor:
+            for attempt in range(1 + config.get('QUESTION_RETRIES', 2)):
+                if not pending:
+                    break
+                if attempt:
+                    print(f"Retrying {len(pending)} question(s), attempt {attempt + 1}", flush=True)
+                futures = {
+                    executor.submit(self._grade_question, static_blocks, questions[i],
+                                    matched_answers[i]["student_answer"], question_rubrics[i],
+                                    question_chunks[i]): i
+                    for i in pending
+                }
+                pending = []
+                for future, i in futures.items():
+                    try:
+                        graded[i], question_usage = future.result()
+                        add_usage(usage, question_usage)
+                        errors.pop(i, None)
+                    except Exception as e:
+                        print(f"Grading {questions[i].get('id')} failed: {e}", flush=True)
+                        errors[i] = str(e)
+                        pending.append(i)
+
+        results = []
+        for i, question in enumerate(questions):
+            item = {
+                "question": f"{question.get('id', '')}: {question.get('text', '')}".strip(": "),
+                # Set from the model's answer; failed questions flag none
+                "rubric_criteria": [],
+                "relevant_chunks": question_chunks[i],
+            }
+            if graded[i] is not None:
+                item.update(graded[i])
+            else:
+                item.update({
+                    "score": 70.0,
+                    "justification": "This answer could not be graded automatically. A default score has been assigned. Your instructor will review it.",
+                    "error": errors.get(i)
+                })
+            results.append(item)
+
+        result = {
+            "student_id": "",
+            "assignment_id": assignment_id,
+            "total_score": sum(item["score"] for item in results) / len(results),
+            "results": results,
+            "relevant_chunks": [chunk for chunks in question_chunks for chunk in dict.fromkeys(chunks)],
+            "usage": usage
+        }
+        if errors:
+            result["error"] = f"{len(errors)} of {len(questions)} questions could not be graded"
+            # Nothing was graded at all: most likely the API is unavailable
+            result["retryable"] = len(errors) == len(questions)
+        return result
+
+    def _grade_with_claude(self, student_text, context, class_code, assignment_id):
+        questions = context.get("questions", [])
+        matched_answers = self.match_student_answers(student_text, questions)
+
+        relevant_context = ""
+        relevant_chunks = context.get("relevant_chunks", [])
+        if relevant_chunks:
+            relevant_context = "Relevant Course Material:\n" + "\n---\n".join(relevant_chunks)
+
+        # Everything specific to this student comes after the cached prefix
+        user_prompt = f"""{relevant_context}
+
+Student Submission:
+{student_text}
+
+Matched Answers:
+{matched_answers}
+
+IMPORTANT: You must respond ONLY with a valid JSON object and nothing else.
+Do not include any explanations, markdown formatting, or code blocks around the JSON.
+
+Your JSON response must include:
+1. A "total_score" field with a numeric value between 0 and 100
+2. A "results" array containing objects with "question", "score", and "justification" fields
+
+Example of valid response format:
+{{"total_score": 85, "results": [{{"question": "Question 1", "score": 85, "justification": "Good work because..."}}]}}
+"""
+
+        try:
+            print("Calling Claude API for grading...", flush=True)
+            content, usage = self._call_claude(self.static_prompt_blocks(class_code, assignment_id, context),
+                                               user_prompt, max_tokens=4000)
             
             print(f"Claude API response received, length: {len(content)}", flush=True)
             print(f"Response preview: {content[:200]}...", flush=True)
@@ -326,7 +678,8 @@ class ClaudeGradingService:
                         "score": 70.0,
                         "justification": "The AI assigned a grade based on the submission quality."
                     }]),
-                    "relevant_chunks": context.get("relevant_chunks", [])
+                    "relevant_chunks": context.get("relevant_chunks", []),
+                    "usage": usage
                 }
             except json.JSONDecodeError:
                 # Fall back to regex search
@@ -358,6 +711,7 @@ class ClaudeGradingService:
                 print(f"JSON parsing error: {e}", flush=True)
                 # Attempt to create a basic result structure
                 result = {
+                    "error": f"Could not parse Claude response as JSON: {e}",
                     "total_score": 70.0,  # Default score
                     "results": [{
                         "question": "Assignment",
@@ -365,19 +719,25 @@ class ClaudeGradingService:
                         "justification": "The Claude API returned a response but it could not be parsed as JSON. Please check the logs for details."
                     }]
                 }
-            return {
+            graded = {
                 "student_id": "",
                 "assignment_id": assignment_id,
                 "total_score": result.get("total_score", 0.0),
                 "results": result.get("results", []),
-                "relevant_chunks": context.get("relevant_chunks", [])
+                "relevant_chunks": context.get("relevant_chunks", []),
+                "usage": usage
             }
+            if result.get("error"):
+                graded["error"] = result["error"]
+            return graded
 
         except Exception as e:
             print(f"Error during grading with Claude: {e}", flush=True)
             # Return a default structure that provides some feedback rather than empty results
             return {
                 "error": str(e),
+                "retryable": True,  # API/network failure rather than a property of the submission
+                "usage": empty_usage(),
                 "student_id": "",
                 "assignment_id": assignment_id,
                 "total_score": 70.0,  # Default passing score
@@ -388,22 +748,30 @@ class ClaudeGradingService:
                 }]
             }
 
-    def grade_from_pdf_data(self, student_pdf_path, class_code, assignment_id):
-        student_text = self.extract_text_from_pdf(student_pdf_path)
+    def unreadable_pdf_result(self, assignment_id):
+        """Default result for a submission whose PDF has no extractable text."""
+        return {
+            "error": "Could not extract text from student PDF",
+            "student_id": "",
+            "assignment_id": assignment_id,
+            "total_score": 70.0,  # Default passing score
+            "results": [{
+                "question": "PDF Submission",
+                "score": 70.0,
+                "justification": "The system could not extract text from your PDF submission. A default score has been assigned. Your instructor will review this submission manually."
+            }]
+        }
+
+    def grade_from_pdf_data(self, student_pdf_path, class_code, assignment_id, pdf_sha256=None):
+        student_text = self.extract_text_from_pdf(student_pdf_path, pdf_sha256)
+        return self.grade_text(student_text, class_code, assignment_id)
+
+    def grade_text(self, student_text, class_code, assignment_id):
+        """Grade already extracted submission text (the default result if it is empty)."""
         print(f"Extracted text from PDF, length: {len(student_text) if student_text else 0}", flush=True)
-        
+
         if not student_text:
             print("No text extracted from PDF, using default feedback", flush=True)
-            return {
-                "error": "Could not extract text from student PDF",
-                "student_id": "",
-                "assignment_id": assignment_id,
-                "total_score": 70.0,  # Default passing score
-                "results": [{
-                    "question": "PDF Submission",
-                    "score": 70.0,
-                    "justification": "The system could not extract text from your PDF submission. A default score has been assigned. Your instructor will review this submission manually."
-                }]
-            }
+            return self.unreadable_pdf_result(assignment_id)
         context = self.get_assignment_context(class_code, assignment_id, student_text)
         return self.grade_submission(student_text, context, class_code, assignment_id)
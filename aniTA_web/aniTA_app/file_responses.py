@@ -0,0 +1,184 @@
+"""
+Streaming, conditional and range-capable responses for stored PDFs.
+
+A "file ref" is a small dict describing a document's file:
+
+    {"sha256": ..., "size": ..., "content_type": ..., "last_modified": <unix ts or None>}
+
+It is cheap to cache, and the sha256 doubles as a strong ETag. Views cache
+it per document so repeat requests carrying If-None-Match can be answered
+with 304 before touching ArangoDB.
+"""
+
+import hashlib
+import io
+import re
+from datetime import datetime
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from users.blob_store import CHUNK_SIZE, decode_legacy_content, get_blob_store, make_blob_ref
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _timestamp(iso_value):
+    if not iso_value:
+        return None
+    try:
+        return int(datetime.fromisoformat(iso_value).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def document_file_ref(doc, last_modified=None):
+    """
+    Describe the file attached to a document.
+
+    Args:
+        doc (dict): Submission, assignment or material document
+        last_modified (str): ISO timestamp to report as Last-Modified
+
+    Returns:
+        tuple: (file_ref, legacy_bytes). legacy_bytes holds the decoded
+        payload for documents still storing base64 `file_content`, and is
+        None for blob-backed documents. file_ref is None if there is no file.
+    """
+    blob = doc.get("file_blob")
+    if blob:
+        file_ref = dict(blob)
+        legacy_bytes = None
+    else:
+        legacy_bytes = decode_legacy_content(doc.get("file_content"))
+        if not legacy_bytes:
+            return None, None
+        file_ref = make_blob_ref(hashlib.sha256(legacy_bytes).hexdigest(), len(legacy_bytes))
+    file_ref["last_modified"] = _timestamp(last_modified)
+    return file_ref, legacy_bytes
+
+
+def _etag(file_ref):
+    return quote_etag(file_ref["sha256"])
+
+
+def not_modified_response(request, file_ref):
+    """Return a 304 response if the client's cached copy is current, else None."""
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if "*" in etags or _etag(file_ref) in etags:
+            return _with_validators(HttpResponseNotModified(), file_ref)
+        return None
+
+    if_modified_since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    if if_modified_since and file_ref.get("last_modified") and file_ref["last_modified"] <= if_modified_since:
+        return _with_validators(HttpResponseNotModified(), file_ref)
+    return None
+
+
+def _with_validators(response, file_ref):
+    response["ETag"] = _etag(file_ref)
+    if file_ref.get("last_modified"):
+        response["Last-Modified"] = http_date(file_ref["last_modified"])
+    # Let the browser keep the PDF but revalidate on each view.
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def parse_range_header(header, size):
+    """
+    Parse a single-range `Range: bytes=...` header.
+
+    Returns:
+        tuple: (start, end) inclusive, None to serve the whole file (absent,
+        malformed or multi-range headers), or False if unsatisfiable.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if end < start:
+        return None  # Syntactically invalid, so ignored
+    if start >= size:
+        return False
+    return start, min(end, size - 1)
+
+
+def _iter_file(fileobj, start, length):
+    try:
+        if start:
+            if fileobj.seekable():
+                fileobj.seek(start)
+            else:
+                skipped = 0
+                while skipped < start:
+                    chunk = fileobj.read(min(CHUNK_SIZE, start - skipped))
+                    if not chunk:
+                        return
+                    skipped += len(chunk)
+        remaining = length
+        while remaining > 0:
+            chunk = fileobj.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def file_ref_response(request, file_ref, legacy_bytes=None, filename="document.pdf"):
+    """
+    Serve a stored file with ETag/Last-Modified validators, honouring
+    conditional requests and single byte-range requests.
+
+    Full responses from the local blob store use FileResponse, so WSGI
+    servers with a file wrapper can sendfile() them.
+    """
+    not_modified = not_modified_response(request, file_ref)
+    if not_modified:
+        return not_modified
+
+    size = file_ref["size"]
+    byte_range = None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range or if_range.strip() == _etag(file_ref):
+        byte_range = parse_range_header(request.META.get("HTTP_RANGE"), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return _with_validators(response, file_ref)
+
+    store = get_blob_store()
+    if byte_range is None:
+        local_path = None if legacy_bytes is not None else store.local_path(file_ref["sha256"])
+        if local_path:
+            response = FileResponse(open(local_path, "rb"), content_type=file_ref["content_type"])
+        else:
+            fileobj = io.BytesIO(legacy_bytes) if legacy_bytes is not None else store.open(file_ref["sha256"])
+            response = StreamingHttpResponse(_iter_file(fileobj, 0, size), content_type=file_ref["content_type"])
+        response["Content-Length"] = str(size)
+    else:
+        start, end = byte_range
+        fileobj = io.BytesIO(legacy_bytes) if legacy_bytes is not None else store.open(file_ref["sha256"])
+        response = StreamingHttpResponse(_iter_file(fileobj, start, end - start + 1),
+                                         content_type=file_ref["content_type"], status=206)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+
+    response["Accept-Ranges"] = "bytes"
+    response["X-Frame-Options"] = "SAMEORIGIN"
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    return _with_validators(response, file_ref)
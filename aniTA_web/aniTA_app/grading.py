@@ -0,0 +1,219 @@
+"""
+AI grading pipeline for a stored submission.
+
+This is what the upload view used to run inside the HTTP request. It now
+runs in `manage.py grading_worker` processes (see grading_queue.py), or
+inline when GRADING_QUEUE["EAGER"] is set.
+"""
+
+import shutil
+import tempfile
+from contextlib import contextmanager
+from django.conf import settings
+from users.arangodb import db, db_get_submission, db_put_ai_feedback
+from users.blob_store import get_blob_store
+from users.graph_ops import store_grading_result
+from .claude_service import ClaudeGradingService
+from .services.pdf_text import get_text_extractor
+from .services.usage import describe_usage, empty_usage
+
+DEFAULT_SCORE = 70.0
+DEFAULT_FEEDBACK = ("There was an issue with the AI grading system. A default score has been assigned. "
+                    "Your instructor will review this submission.")
+
+
+def _normalise_result(grading_result):
+    """Return (score, feedback items) with the defaults the upload page always used."""
+    ai_score = grading_result.get("total_score", DEFAULT_SCORE)
+    try:
+        ai_score = float(ai_score)
+        # A score of exactly 0 has so far always meant a parsing problem
+        if ai_score == 0.0:
+            print("WARNING: Score is 0, which is unusual. Using default passing score.", flush=True)
+            ai_score = DEFAULT_SCORE
+    except (ValueError, TypeError):
+        print(f"Invalid AI score: {ai_score}, using default", flush=True)
+        ai_score = DEFAULT_SCORE
+
+    ai_feedback = grading_result.get("results", [])
+    if not isinstance(ai_feedback, list):
+        print("AI feedback is not a list, using default", flush=True)
+        ai_feedback = [{
+            "question": "Submission",
+            "score": ai_score,
+            "justification": "Feedback format was invalid. A default score has been assigned."
+        }]
+    elif not ai_feedback:
+        ai_feedback = [{
+            "question": "Assignment Review",
+            "score": ai_score,
+            "justification": "The grading system encountered an issue. A default score has been assigned."
+        }]
+    return ai_score, ai_feedback
+
+
+def _rubric_mapping(assignment_id):
+    rubric_docs = list(db.collection('rubrics').find({"assignment_id": assignment_id}, limit=1))
+    rubric_mapping = {}
+    if rubric_docs:
+        for item in rubric_docs[0].get("items", []):
+            rubric_mapping[item["criteria"]] = rubric_docs[0]["_id"]
+    return rubric_mapping
+
+
+def _load_submission(user_id, class_code, assignment_id):
+    submission = db_get_submission(user_id, class_code, assignment_id)
+    if not submission or not submission.get("file_blob"):
+        raise ValueError(f"No stored submission for {user_id} in {class_code}/{assignment_id}")
+    return submission
+
+
+@contextmanager
+def _submission_pdf_path(submission):
+    """Filesystem path of a submission's PDF, copied to a temp file for remote blob stores."""
+    store = get_blob_store()
+    sha256 = submission["file_blob"]["sha256"]
+    local_path = store.local_path(sha256)
+    if local_path:
+        yield local_path
+        return
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as pdf_temp:
+        with store.open(sha256) as blob:
+            shutil.copyfileobj(blob, pdf_temp)
+        pdf_temp.flush()
+        yield pdf_temp.name
+
+
+def _submission_text(service, submission):
+    """Extracted text of a submission's PDF; cached text avoids fetching the blob at all."""
+    sha256 = submission["file_blob"]["sha256"]
+    student_text = get_text_extractor().cached(sha256)
+    if student_text is None:
+        with _submission_pdf_path(submission) as pdf_path:
+            student_text = service.extract_text_from_pdf(pdf_path, sha256)
+    return student_text
+
+
+def _store_result(user_id, class_code, assignment_id, submission, grading_result):
+    """Store feedback and the analytics graph for a finished grading result."""
+    if grading_result.get("retryable"):
+        raise RuntimeError(f"Claude grading failed: {grading_result['error']}")
+
+    grading_result["student_id"] = str(user_id)
+    if grading_result.get("error"):
+        print(f"Error in Claude grading: {grading_result['error']}", flush=True)
+
+    ai_score, ai_feedback = _normalise_result(grading_result)
+    err = db_put_ai_feedback(user_id, class_code, assignment_id, ai_score, ai_feedback)
+    if err:
+        raise RuntimeError(f"Could not store AI feedback: {err}")
+
+    submission_id = submission["_id"].split('/')[-1]
+    # Mistake nodes and edges for analytics; feedback is already stored
+    try:
+        store_grading_result(
+            student_id=f"users/{user_id}",
+            submission_id=submission_id,
+            assignment_id=assignment_id,
+            grading_result=grading_result,
+            rubric_mapping=_rubric_mapping(assignment_id)
+        )
+    except Exception as e:
+        print(f"Error storing mistake edges (non-critical): {e}", flush=True)
+
+    usage = grading_result.get("usage") or empty_usage()
+    print(f"Graded submission {submission_id}: {describe_usage(usage)}", flush=True)
+    return {"score": ai_score, "submission_id": submission_id, "usage": usage}
+
+
+def grade_submission(user_id, class_code, assignment_id, service=None, store=True):
+    """
+    Grade the current submission of a student and store the feedback and
+    the analytics graph.
+
+    Raises on infrastructure or API errors so the caller can retry.
+
+    Args:
+        service (ClaudeGradingService): Service to grade with; a new one
+            using the configured API key by default
+        store (bool): False grades without writing feedback or mistakes
+            (dry runs)
+
+    Returns:
+        dict: {"score": float, "submission_id": numeric submission ID,
+        "usage": token usage and cost of the Claude calls}
+    """
+    service = service or ClaudeGradingService()
+    submission = _load_submission(user_id, class_code, assignment_id)
+    student_text = _submission_text(service, submission)
+    grading_result = service.grade_text(student_text, class_code, assignment_id)
+    if not store:
+        if grading_result.get("retryable"):
+            raise RuntimeError(f"Claude grading failed: {grading_result['error']}")
+        return {"score": _normalise_result(grading_result)[0],
+                "submission_id": submission["_id"].split('/')[-1],
+                "usage": grading_result.get("usage") or empty_usage()}
+    return _store_result(user_id, class_code, assignment_id, submission, grading_result)
+
+
+def stream_grade_submission(user_id, class_code, assignment_id, service=None):
+    """
+    Like grade_submission(), but yields feedback while Claude writes it.
+
+    Yields:
+        ("question", result item) as each question's feedback completes,
+        then ("done", the dict grade_submission() returns) once stored
+    """
+    service = service or ClaudeGradingService()
+    submission = _load_submission(user_id, class_code, assignment_id)
+    student_text = _submission_text(service, submission)
+
+    if not student_text:
+        # Nothing to stream; store the usual default feedback
+        grading_result = service.unreadable_pdf_result(assignment_id)
+    elif getattr(settings, 'CLAUDE_GRADING', {}).get('PER_QUESTION', False):
+        # Per-question grading runs its requests concurrently, so there is
+        # nothing to stream; report the questions once they are all graded
+        grading_result = service.grade_text(student_text, class_code, assignment_id)
+        for item in grading_result.get("results") or []:
+            yield "question", item
+    else:
+        context = service.get_assignment_context(class_code, assignment_id, student_text)
+        grading_result = None
+        for event, payload in service.stream_grade_submission(student_text, context, class_code, assignment_id):
+            if event == "question":
+                yield "question", payload
+            else:
+                grading_result = payload
+
+    yield "done", _store_result(user_id, class_code, assignment_id, submission, grading_result)
+
+
+def apply_default_feedback(user_id, class_code, assignment_id):
+    """Give a submission the default score after grading has failed for good."""
+    db_put_ai_feedback(user_id, class_code, assignment_id, DEFAULT_SCORE, [{
+        "question": "Assignment Submission",
+        "score": DEFAULT_SCORE,
+        "justification": DEFAULT_FEEDBACK
+    }])
+
+
+def run_grading_job(job, publish=None):
+    """
+    Grade the submission of a queued job.
+
+    Args:
+        publish (callable, optional): publish(event, data) is called with
+            each question's feedback as it is graded, for the upload page
+            to relay (see GradingQueue.publish)
+    """
+    payload = job["payload"]
+    if publish is None:
+        return grade_submission(payload["user_id"], payload["class_code"], payload["assignment_id"])
+    result = None
+    for event, data in stream_grade_submission(payload["user_id"], payload["class_code"], payload["assignment_id"]):
+        if event == "question":
+            publish(event, data)
+        else:
+            result = data
+    return result
@@ -0,0 +1,178 @@
+"""
+Cache of Claude grading results.
+
+Resubmissions with unchanged text and copied boilerplate answers used to
+trigger a full Claude call each time. Results are stored in the
+`grading_cache` collection under a key derived from
+
+    (model, prompt version, class, assignment, rubric version hash,
+     question set hash, course material hash, normalised answer hash)
+
+so a change to the rubric, the questions, the course material (part of the
+prompt, and the source of the retrieved chunks) or the prompt naturally
+misses.
+An optional near-duplicate tier stores MinHash signatures of the answer,
+banded for locality-sensitive lookup through an array index, and reuses a
+result whose estimated Jaccard similarity is above a threshold.
+"""
+
+import copy
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from datetime import datetime
+import numpy as np
+from django.conf import settings
+from users.arangodb import db
+
+WORD_RE = re.compile(r"\w+")
+
+# MinHash parameters: NUM_PERM = BANDS * ROWS
+NUM_PERM = 64
+BANDS = 16
+ROWS = 4
+SHINGLE_SIZE = 5
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240501)
+_PERM_A = _rng.randint(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalise_answer(text):
+    """Case-fold and collapse whitespace so formatting changes still hit."""
+    return " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def rubric_version(rubric_items):
+    return _digest(rubric_items or [])
+
+
+def question_set_version(questions):
+    return _digest([{"id": q.get("id"), "text": q.get("text")} for q in questions or []])
+
+
+def material_version(material_text):
+    return hashlib.sha256((material_text or "").encode("utf-8")).hexdigest()
+
+
+def minhash_signature(text):
+    """64-value MinHash signature over word 5-shingles, or None if too short."""
+    words = WORD_RE.findall(normalise_answer(text))
+    if len(words) < SHINGLE_SIZE:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                       for s in shingles], dtype=np.uint64)
+    # (a * h + b) mod p for every permutation at once; both factors are
+    # below 2^32, so the products fit in uint64.
+    permuted = (hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % _PRIME
+    return permuted.min(axis=0)
+
+
+def signature_bands(signature):
+    return [f"{band}:{hashlib.sha1(signature[band * ROWS:(band + 1) * ROWS].tobytes()).hexdigest()[:16]}"
+            for band in range(BANDS)]
+
+
+class GradingCache:
+    """
+    Args:
+        near_duplicate_threshold (float): Minimum estimated Jaccard
+            similarity for a near-duplicate hit; None disables the tier
+    """
+
+    def __init__(self, near_duplicate_threshold=None):
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.collection = db.collection('grading_cache')
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "near_hits": 0, "misses": 0, "stores": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def scope(self, model, prompt_version, class_code, assignment_id, rubric_items, questions, material_text=""):
+        """Hash of everything besides the answer that determines a grade."""
+        return _digest([model, prompt_version, class_code, assignment_id, rubric_version(rubric_items),
+                        question_set_version(questions), material_version(material_text)])
+
+    def _key(self, scope, text):
+        return hashlib.sha256(f"{scope}:{normalise_answer(text)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, scope, text):
+        """
+        Return (result, tier) where tier is "exact" or "near", or
+        (None, None) on a miss. Results are copies.
+        """
+        doc = self.collection.get(self._key(scope, text))
+        if doc:
+            self._count("exact_hits")
+            return copy.deepcopy(doc["result"]), "exact"
+
+        if self.near_duplicate_threshold is not None:
+            signature = minhash_signature(text)
+            if signature is not None:
+                candidates = db.aql.execute("""
+                FOR band IN @bands
+                    FOR c IN grading_cache
+                        FILTER band IN c.bands[*] AND c.scope == @scope
+                        RETURN DISTINCT KEEP(c, "_key", "signature", "result")
+                """, bind_vars={"bands": signature_bands(signature), "scope": scope})
+                best, best_similarity = None, 0.0
+                for candidate in candidates:
+                    similarity = float(np.mean(np.array(candidate["signature"], dtype=np.uint64) == signature))
+                    if similarity > best_similarity:
+                        best, best_similarity = candidate, similarity
+                if best and best_similarity >= self.near_duplicate_threshold:
+                    self._count("near_hits")
+                    result = copy.deepcopy(best["result"])
+                    result["near_duplicate_similarity"] = best_similarity
+                    return result, "near"
+
+        self._count("misses")
+        return None, None
+
+    def store(self, scope, text, result):
+        doc = {
+            "_key": self._key(scope, text),
+            "scope": scope,
+            "result": result,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        if self.near_duplicate_threshold is not None:
+            signature = minhash_signature(text)
+            if signature is not None:
+                doc["signature"] = signature.tolist()
+                doc["bands"] = signature_bands(signature)
+        self.collection.insert(doc, overwrite=True, silent=True)
+        self._count("stores")
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["exact_hits"] + counters["near_hits"] + counters["misses"]
+        counters["hit_rate"] = (counters["exact_hits"] + counters["near_hits"]) / lookups if lookups else None
+        return counters
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_grading_cache():
+    """Return the process-wide GradingCache, or None if disabled in settings.GRADING_CACHE."""
+    global _cache
+    config = getattr(settings, "GRADING_CACHE", {})
+    if not config.get("ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GradingCache(config.get("NEAR_DUPLICATE_THRESHOLD"))
+    return _cache
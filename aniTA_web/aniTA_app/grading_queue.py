@@ -0,0 +1,354 @@
+"""
+Durable local job queue for AI grading.
+
+Grading a submission (text extraction, embeddings, the Claude call and the
+analytics graph write) takes tens of seconds, so the upload view only stores
+the PDF and enqueues a job here; `manage.py grading_worker` processes run the
+jobs. The queue is a SQLite file in WAL mode, so no external broker is
+needed and jobs survive restarts.
+
+Job states: queued -> running -> done, or back to queued with exponential
+backoff after a failed attempt, and failed once max_attempts is reached.
+Workers heartbeat the jobs they run; a running job whose lock has not been
+refreshed for STALE_AFTER seconds is presumed lost with its worker and is
+re-queued, or failed once it has used all its attempts (a job that keeps
+crashing its worker is not retried forever). complete() and fail() only
+apply while the caller still holds the job's lock, so a worker that lost
+its job to another one cannot overwrite the other's outcome.
+
+Each job also has an append-only event log (`job_events`): state changes
+are recorded there by claim/complete/fail, and workers publish progress
+(e.g. each question's feedback as it is graded). The upload page's
+server-sent event stream only relays this log; it never grades anything.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def submission_ref(user_id, class_code, assignment_id):
+    return f"{user_id}|{class_code}|{assignment_id}"
+
+
+class GradingQueue:
+    """
+    Args:
+        path (str): SQLite database file
+        max_attempts (int): Attempts before a job is marked failed
+        backoff_seconds (float): Delay before the first retry, doubled per attempt
+        stale_after (float): Seconds without a heartbeat after which a
+            running job is presumed lost
+    """
+
+    def __init__(self, path, max_attempts=3, backoff_seconds=30, stale_after=900):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.stale_after = stale_after
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ref TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    run_after REAL NOT NULL,
+                    locked_by TEXT,
+                    locked_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_run_after ON jobs (status, run_after)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ref ON jobs (ref)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id)")
+
+    def _connection(self):
+        # One connection per thread and per process (connections must not
+        # cross a fork).
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _record(self, conn, job_id, event, data, now):
+        conn.execute("INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                     (job_id, event, json.dumps(data), now))
+
+    def publish(self, job_id, event, data):
+        """Append a progress event to a job's log (see events())."""
+        self._record(self._connection(), job_id, event, data, time.time())
+
+    def events(self, job_id, after=0):
+        """
+        Events of a job in the order they were recorded.
+
+        Args:
+            after (int): Only events with a larger ID (the last one already seen)
+
+        Returns:
+            list: {"id", "event", "data"} dicts
+        """
+        rows = self._connection().execute(
+            "SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+            (job_id, after)).fetchall()
+        return [{"id": row["id"], "event": row["event"], "data": json.loads(row["data"])} for row in rows]
+
+    def enqueue(self, ref, payload):
+        """
+        Queue a job unless one for the same ref is already waiting.
+
+        Args:
+            ref (str): What the job is about, see submission_ref()
+            payload (dict): JSON-serialisable job arguments
+
+        Returns:
+            int: The job ID
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM jobs WHERE ref = ? AND status = ?", (ref, QUEUED)).fetchone()
+            if row:
+                job_id = row["id"]
+                conn.execute("UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                             (json.dumps(payload), now, job_id))
+            else:
+                job_id = conn.execute("""
+                    INSERT INTO jobs (ref, payload, status, run_after, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (ref, json.dumps(payload), QUEUED, now, now, now)).lastrowid
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def recover_stale(self):
+        """
+        Take back running jobs whose worker stopped heartbeating: re-queue
+        them, or mark them failed if they have used all their attempts.
+
+        Returns:
+            list: The jobs marked failed, so the caller can apply defaults
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT id, attempts FROM jobs WHERE status = ? AND locked_at < ?",
+                                (RUNNING, now - self.stale_after)).fetchall()
+            failed = []
+            for row in rows:
+                status = FAILED if row["attempts"] >= self.max_attempts else QUEUED
+                conn.execute("""
+                    UPDATE jobs SET status = ?, error = ?, locked_by = NULL, locked_at = NULL, updated_at = ?
+                    WHERE id = ?
+                """, (status, "Worker stopped responding", now, row["id"]))
+                self._record(conn, row["id"], "status", {"status": status, "retrying": status == QUEUED}, now)
+                if status == FAILED:
+                    failed.append(row["id"])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [self.get(job_id) for job_id in failed]
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        Refresh the lock on a running job.
+
+        Returns:
+            bool: False if the worker no longer holds the job
+        """
+        now = time.time()
+        updated = self._connection().execute(
+            "UPDATE jobs SET locked_at = ?, updated_at = ? WHERE id = ? AND locked_by = ? AND status = ?",
+            (now, now, job_id, worker_id, RUNNING)).rowcount
+        return updated == 1
+
+    @contextmanager
+    def heartbeating(self, job_id, worker_id, interval=None):
+        """
+        Keep a job's lock fresh from a background thread while the body
+        runs; by default three times per stale_after.
+        """
+        interval = interval or self.stale_after / 3
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(interval):
+                if not self.heartbeat(job_id, worker_id):
+                    print(f"Lost the lock on grading job {job_id}", flush=True)
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def claim(self, worker_id, ref=None):
+        """
+        Atomically take the oldest runnable job, optionally only one for
+        the given ref (used to grade a submission while streaming to its page).
+
+        Returns:
+            dict: The job (now running), or None if nothing is runnable
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if ref is None:
+                row = conn.execute("""
+                    SELECT * FROM jobs WHERE status = ? AND run_after <= ?
+                    ORDER BY run_after, id LIMIT 1
+                """, (QUEUED, now)).fetchone()
+            else:
+                row = conn.execute("""
+                    SELECT * FROM jobs WHERE status = ? AND run_after <= ? AND ref = ?
+                    ORDER BY id LIMIT 1
+                """, (QUEUED, now, ref)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("""
+                UPDATE jobs SET status = ?, attempts = attempts + 1, locked_by = ?, locked_at = ?, updated_at = ?
+                WHERE id = ?
+            """, (RUNNING, worker_id, now, now, row["id"]))
+            self._record(conn, row["id"], "status", {"status": RUNNING, "attempt": row["attempts"] + 1}, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def complete(self, job_id, worker_id, result=None):
+        """
+        Record a job's result.
+
+        Returns:
+            bool: False if the worker had lost the job (the result is ignored)
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = conn.execute("""
+                UPDATE jobs SET status = ?, result = ?, error = NULL, locked_by = NULL, locked_at = NULL, updated_at = ?
+                WHERE id = ? AND locked_by = ? AND status = ?
+            """, (DONE, json.dumps(result), now, job_id, worker_id, RUNNING)).rowcount
+            if updated:
+                self._record(conn, job_id, "done", result or {}, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return updated == 1
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Record a failed attempt: re-queue with exponential backoff, or mark
+        the job failed once it has used all its attempts.
+
+        Returns:
+            str: The job's new status, or None if the worker had lost the job
+        """
+        job = self.get(job_id)
+        if job is None or job["locked_by"] != worker_id or job["status"] != RUNNING:
+            return None
+        now = time.time()
+        if job["attempts"] >= self.max_attempts:
+            status, run_after = FAILED, job["run_after"]
+        else:
+            status = QUEUED
+            run_after = now + self.backoff_seconds * (2 ** (job["attempts"] - 1))
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updated = conn.execute("""
+                UPDATE jobs SET status = ?, run_after = ?, error = ?, locked_by = NULL, locked_at = NULL, updated_at = ?
+                WHERE id = ? AND locked_by = ? AND status = ?
+            """, (status, run_after, str(error), now, job_id, worker_id, RUNNING)).rowcount
+            if updated:
+                self._record(conn, job_id, "status", {"status": status, "retrying": status == QUEUED}, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return status if updated else None
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def latest_for(self, ref):
+        row = self._connection().execute(
+            "SELECT * FROM jobs WHERE ref = ? ORDER BY id DESC LIMIT 1", (ref,)).fetchone()
+        return self._to_dict(row)
+
+    def counts(self):
+        return {row["status"]: row["n"] for row in self._connection().execute(
+            "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_grading_queue():
+    """Return the queue configured by settings.GRADING_QUEUE."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                config = getattr(settings, "GRADING_QUEUE", {})
+                _queue = GradingQueue(
+                    config.get("PATH", os.path.join(settings.BASE_DIR, "grading_queue", "jobs.sqlite3")),
+                    max_attempts=config.get("MAX_ATTEMPTS", 3),
+                    backoff_seconds=config.get("BACKOFF_SECONDS", 30),
+                    stale_after=config.get("STALE_AFTER", 900),
+                )
+    return _queue
@@ -0,0 +1,92 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from aniTA_app.services.answer_segmentation import segment_answers
+
+TOPICS = ["TCP congestion control", "UDP checksums", "IP fragmentation", "BGP route selection",
+          "DNS caching", "ARP spoofing", "NAT traversal", "HTTP keep-alive", "TLS handshakes",
+          "OSPF areas", "Ethernet framing", "Wi-Fi contention"]
+
+
+def legacy_match_student_answers(student_text, questions):
+    """The str.find implementation segment_answers replaced."""
+    answers = []
+    for i, question in enumerate(questions):
+        q_text = question["text"]
+        q_id = question["id"]
+
+        index = student_text.find(q_text)
+        if index == -1:
+            index = student_text.find(q_id)
+            if index == -1:
+                answers.append({"question_id": q_id, "question_text": q_text, "student_answer": ""})
+                continue
+
+        start = index + len(q_text)
+        next_q = None
+        if i + 1 < len(questions):
+            next_index = student_text.find(questions[i + 1]["text"], start)
+            if next_index == -1:
+                next_index = student_text.find(questions[i + 1]["id"], start)
+            next_q = next_index if next_index != -1 else None
+
+        end = next_q if next_q is not None else len(student_text)
+        answers.append({"question_id": q_id, "question_text": q_text,
+                        "student_answer": student_text[start:end].strip()})
+    return answers
+
+
+def make_exam(rng, n_questions, answer_words, shuffle, restyle):
+    """
+    Returns:
+        tuple: (questions, submission text, expected answer per question)
+    """
+    questions = [{"id": f"Q{i + 1}",
+                  "text": f"Explain how {rng.choice(TOPICS)} affects network design case {i + 1}."}
+                 for i in range(n_questions)]
+    expected = [" ".join(rng.choice(["the", "packet", "router", "because", "latency", "so", "host"])
+                         for _ in range(answer_words)) for _ in questions]
+
+    order = list(range(n_questions))
+    if shuffle:
+        rng.shuffle(order)
+    blocks = []
+    for i in order:
+        heading = questions[i]["text"]
+        if restyle:
+            # What PDF extraction does to headings: case and line breaks change
+            heading = heading.upper().replace(" AFFECTS ", "\naffects  ")
+        blocks.append(f"{heading}\n{expected[i]}")
+    return questions, "\n\n".join(blocks), expected
+
+
+class Command(BaseCommand):
+    help = 'Compare answer segmentation against the str.find matcher on synthetic exams'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, nargs='+', default=[10, 50],
+                            help='Questions per exam')
+        parser.add_argument('--answer-words', type=int, default=150,
+                            help='Words per answer')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Timed runs per implementation')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"{'questions':>9} {'layout':>10} {'impl':>8} {'p50 ms':>8} {'correct':>8}")
+        for n_questions in options['questions']:
+            for layout, shuffle, restyle in (("in order", False, False),
+                                             ("shuffled", True, False),
+                                             ("restyled", False, True)):
+                questions, text, expected = make_exam(rng, n_questions, options['answer_words'], shuffle, restyle)
+                for label, impl in (("find", legacy_match_student_answers), ("ac", segment_answers)):
+                    timings = []
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        answers = impl(text, questions)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    correct = sum(answer["student_answer"] == want for answer, want in zip(answers, expected))
+                    self.stdout.write(f"{n_questions:>9} {layout:>10} {label:>8} "
+                                      f"{statistics.median(timings):>8.2f} {correct:>4}/{n_questions:<3}")
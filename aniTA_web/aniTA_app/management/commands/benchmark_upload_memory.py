@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import tempfile
+from django.core.management.base import BaseCommand
+
+BOUNDARY = "----aniTABenchmarkBoundary"
+CHUNK_SIZE = 1024 * 1024
+
+
+def write_multipart_body(path, size_mb):
+    """Write a multipart/form-data body with one PDF field of size_mb random MB."""
+    with open(path, "wb") as body:
+        body.write((f"--{BOUNDARY}\r\n"
+                    'Content-Disposition: form-data; name="file_input"; filename="submission.pdf"\r\n'
+                    "Content-Type: application/pdf\r\n\r\n").encode())
+        body.write(b"%PDF-1.4\n")
+        for _ in range(size_mb):
+            body.write(os.urandom(CHUNK_SIZE))
+        body.write(f"\r\n--{BOUNDARY}--\r\n".encode())
+        return body.tell()
+
+
+def measure(body_path, body_size, impl, blob_root):
+    """
+    Parse the upload and store it the way `impl` does, in a fresh process.
+
+    Returns:
+        tuple: (peak RSS in MB before the upload, peak RSS in MB after it)
+    """
+    import base64
+    import resource
+    import django
+    django.setup()
+    from django.core.files.uploadhandler import load_handler
+    from django.conf import settings
+    from django.http.multipartparser import MultiPartParser
+    import users.blob_store as blob_store
+    from aniTA_app.uploads import BlobUploadHandler, store_upload
+
+    blob_store._blob_store = blob_store.LocalBlobStore(blob_root)
+    handlers = [load_handler(path) for path in settings.FILE_UPLOAD_HANDLERS]
+    if impl == "ingest":
+        handlers.insert(0, BlobUploadHandler())
+    meta = {"CONTENT_TYPE": f"multipart/form-data; boundary={BOUNDARY}",
+            "CONTENT_LENGTH": str(body_size)}
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(body_path, "rb") as body:
+        _, files = MultiPartParser(meta, body, handlers).parse()
+    upload = files["file_input"]
+
+    if impl == "legacy":
+        # What the upload view did before blob storage: copy to a temp file,
+        # read it back whole and base64 it for the submission document
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as temp:
+            for chunk in upload.chunks():
+                temp.write(chunk)
+            temp.flush()
+            with open(temp.name, "rb") as pdf:
+                encoded = base64.b64encode(pdf.read()).decode("utf-8")
+        del encoded
+    else:
+        store_upload(upload)
+    upload.close()
+
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return before, after
+
+
+class Command(BaseCommand):
+    help = 'Compare peak RSS of the upload ingestion path against the legacy temp-file and base64 path'
+    # The URL checks import users.arangodb, which needs a server; nothing
+    # measured here touches the database
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50],
+                            help='Upload sizes in MB')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        self.stdout.write(f"{'size MB':>8} {'impl':>8} {'baseline MB':>12} {'peak MB':>9} {'upload MB':>10}")
+        with tempfile.TemporaryDirectory() as scratch:
+            body_path = os.path.join(scratch, "body")
+            blob_root = os.path.join(scratch, "blobs")
+            for size_mb in options['sizes']:
+                body_size = write_multipart_body(body_path, size_mb)
+                for impl in ("legacy", "ingest"):
+                    # A fresh process per run, since peak RSS never goes down
+                    with context.Pool(1) as pool:
+                        before, after = pool.apply(measure, (body_path, body_size, impl, blob_root))
+                    self.stdout.write(f"{size_mb:>8} {impl:>8} {before:>12.1f} {after:>9.1f} {after - before:>10.1f}")
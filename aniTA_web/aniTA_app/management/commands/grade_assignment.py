@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from anthropic import Anthropic
+from users.arangodb import db, get_course
+from aniTA_app.claude_service import ClaudeGradingService
+from aniTA_app.grading import grade_submission
+from aniTA_app.services.rate_limiter import RateLimitedClient
+from aniTA_app.services.stub_client import StubAnthropicClient
+from aniTA_app.services.usage import add_usage, describe_usage, empty_usage
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Checkpoint:
+    """
+    Append-only record of graded submissions. Each completed submission is
+    written and fsynced immediately, so a crashed run resumes after the
+    last submission that finished. A path of None keeps the record in
+    memory only (dry runs).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        self.file = None
+        if path is None:
+            return
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)["submission"])
+                    except (ValueError, KeyError):
+                        continue  # Partial line from a crash
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a")
+
+    def record(self, submission_key, result):
+        with self.lock:
+            if self.file:
+                self.file.write(json.dumps({"submission": submission_key, "result": result}) + "\n")
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            self.done.add(submission_key)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+class Command(BaseCommand):
+    help = 'Grade (or regrade) every submission of an assignment with bounded concurrency and rate limiting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_code')
+        parser.add_argument('assignment_id')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Submissions graded in parallel')
+        parser.add_argument('--rpm', type=float, default=50,
+                            help='Maximum Claude requests per minute (0 for unlimited)')
+        parser.add_argument('--input-tpm', type=float, default=0,
+                            help='Maximum estimated input tokens per minute (0 for unlimited)')
+        parser.add_argument('--ungraded-only', action='store_true',
+                            help='Skip submissions that already have a grade')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file (default: grading_checkpoints/<class>_<assignment>.jsonl)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore and overwrite an existing checkpoint')
+        parser.add_argument('--stub', action='store_true',
+                            help='Use the local stub client instead of the Anthropic API; a dry run '
+                                 'that writes nothing unless --write is also given')
+        parser.add_argument('--write', action='store_true',
+                            help='With --stub, store the stub grades, feedback and mistakes anyway')
+        parser.add_argument('--stub-latency', type=float, default=1.0,
+                            help='Seconds per stub call')
+        parser.add_argument('--stub-failure-rate', type=float, default=0.0,
+                            help='Fraction of stub calls that fail')
+
+    def handle(self, *args, **options):
+        class_code = options['class_code']
+        assignment_id = options['assignment_id']
+        if not get_course(class_code):
+            raise CommandError(f"Course {class_code} does not exist")
+
+        submissions = list(db.aql.execute("""
+        FOR s IN submission
+            FILTER s.class_code == @class_code AND s.assignment_id == @assignment_id
+            FILTER !@ungraded_only OR s.graded != true
+            SORT s._key
+            RETURN KEEP(s, "_key", "user_id")
+        """, bind_vars={"class_code": class_code, "assignment_id": assignment_id,
+                        "ungraded_only": options['ungraded_only']}))
+
+        # Stub grades must never overwrite real ones by accident
+        dry_run = options['stub'] and not options['write']
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Stub dry run: nothing is stored (pass --write to store)"))
+            checkpoint_path = None
+        else:
+            checkpoint_path = options['checkpoint'] or os.path.join(
+                settings.BASE_DIR, "grading_checkpoints", f"{class_code}_{assignment_id}.jsonl")
+            if options['restart'] and os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+        checkpoint = Checkpoint(checkpoint_path)
+
+        pending = [s for s in submissions if s["_key"] not in checkpoint.done]
+        self.stdout.write(f"{len(submissions)} submissions, {len(submissions) - len(pending)} already "
+                          f"in checkpoint {checkpoint_path or '(none)'}, {len(pending)} to grade")
+        if not pending:
+            checkpoint.close()
+            return
+
+        if options['stub']:
+            base_client = StubAnthropicClient(latency=options['stub_latency'],
+                                              failure_rate=options['stub_failure_rate'])
+        else:
+            api_key = getattr(settings, 'ANTHROPIC_API_KEY', os.getenv('ANTHROPIC_API_KEY'))
+            if not api_key:
+                raise CommandError("ANTHROPIC_API_KEY is not set (use --stub to grade with the local stub)")
+            base_client = Anthropic(api_key=api_key)
+        client = RateLimitedClient(base_client,
+                                   requests_per_minute=options['rpm'] or None,
+                                   input_tokens_per_minute=options['input_tpm'] or None)
+        service = ClaudeGradingService(client=client)
+        if options['stub']:
+            # Keeps stub grades in their own grading cache scope
+            service.model = "stub"
+        if dry_run:
+            service.grading_cache = None
+
+        latencies = []
+        failures = []
+        usage = empty_usage()
+        start = time.perf_counter()
+
+        def grade(submission):
+            started = time.perf_counter()
+            result = grade_submission(submission["user_id"], class_code, assignment_id, service=service,
+                                      store=not dry_run)
+            return time.perf_counter() - started, result
+
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                futures = {executor.submit(grade, s): s for s in pending}
+                for n, future in enumerate(as_completed(futures), 1):
+                    submission = futures[future]
+                    try:
+                        latency, result = future.result()
+                    except Exception as e:
+                        failures.append(submission["_key"])
+                        self.stdout.write(self.style.ERROR(f"[{n}/{len(pending)}] {submission['_key']}: {e}"))
+                        continue
+                    latencies.append(latency)
+                    add_usage(usage, result["usage"])
+                    checkpoint.record(submission["_key"], result)
+                    self.stdout.write(f"[{n}/{len(pending)}] {submission['_key']}: "
+                                      f"{result['score']:.1f} in {latency:.1f}s")
+        finally:
+            checkpoint.close()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write("")
+        self.stdout.write(f"Graded:      {len(latencies)}")
+        self.stdout.write(f"Failed:      {len(failures)}" + (" (rerun to retry them)" if failures else ""))
+        self.stdout.write(f"Elapsed:     {elapsed:.1f}s")
+        if latencies:
+            self.stdout.write(f"Throughput:  {len(latencies) / elapsed * 60:.1f} submissions/min")
+            self.stdout.write(f"Latency p50: {percentile(latencies, 0.5):.2f}s")
+            self.stdout.write(f"Latency p95: {percentile(latencies, 0.95):.2f}s")
+        self.stdout.write(f"Rate limit waits: {client.waited_seconds():.1f}s")
+        self.stdout.write(f"Claude usage: {describe_usage(usage)}")
+        if latencies and usage["cost_usd"] is not None:
+            self.stdout.write(f"Cost per submission: ${usage['cost_usd'] / len(latencies):.4f}")
+        if service.grading_cache is not None:
+            cache = service.grading_cache.metrics()
+            hit_rate = f"{cache['hit_rate']:.0%}" if cache['hit_rate'] is not None else "n/a"
+            self.stdout.write(f"Grading cache: {cache['exact_hits']} exact, {cache['near_hits']} near-duplicate, "
+                              f"{cache['misses']} misses (hit rate {hit_rate})")
+
+        if failures:
+            self.stdout.write(self.style.WARNING("Finished with failures"))
+        else:
+            self.stdout.write(self.style.SUCCESS("All submissions graded" + (" (dry run, nothing stored)" if dry_run else "")))
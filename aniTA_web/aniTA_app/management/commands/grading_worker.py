@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from django.core.management.base import BaseCommand
+
+
+def work(worker_index, poll_interval, once):
+    """
+    Worker process loop: claim a job, grade it, record the outcome.
+
+    Runs in a spawned process, so Django (and the ArangoDB client) are set
+    up fresh instead of sharing connections with the parent.
+    """
+    import django
+    django.setup()
+    from aniTA_app.grading import apply_default_feedback, run_grading_job
+    from aniTA_app.grading_queue import FAILED, get_grading_queue
+
+    queue = get_grading_queue()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+    stopping = []
+    # The parent handles Ctrl-C and sends SIGTERM; finish the current job first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+
+    while not stopping:
+        # Jobs whose worker stopped heartbeating, e.g. because the job
+        # crashed it; those out of attempts get the default score
+        for lost in queue.recover_stale():
+            lost_payload = lost["payload"]
+            print(f"[{worker_id}] job {lost['id']} failed: its worker stopped responding", flush=True)
+            try:
+                apply_default_feedback(lost_payload["user_id"], lost_payload["class_code"],
+                                       lost_payload["assignment_id"])
+            except Exception as e:
+                print(f"[{worker_id}] could not store default feedback: {e}", flush=True)
+
+        job = queue.claim(worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        payload = job["payload"]
+        print(f"[{worker_id}] job {job['id']} attempt {job['attempts']}: "
+              f"{payload['class_code']}/{payload['assignment_id']} for {payload['user_id']}", flush=True)
+        start = time.perf_counter()
+        try:
+            with queue.heartbeating(job["id"], worker_id):
+                # Questions are published as they are graded, for the upload page
+                result = run_grading_job(job, publish=lambda event, data: queue.publish(job["id"], event, data))
+        except Exception as e:
+            status = queue.fail(job["id"], worker_id, e)
+            print(f"[{worker_id}] job {job['id']} failed ({status}): {e}", flush=True)
+            if status == FAILED:
+                # Out of retries: fall back to the default score, as the
+                # synchronous upload used to
+                try:
+                    apply_default_feedback(payload["user_id"], payload["class_code"], payload["assignment_id"])
+                except Exception as e:
+                    print(f"[{worker_id}] could not store default feedback: {e}", flush=True)
+            continue
+
+        if not queue.complete(job["id"], worker_id, result):
+            print(f"[{worker_id}] job {job['id']} was taken over by another worker; result ignored", flush=True)
+            continue
+        print(f"[{worker_id}] job {job['id']} done in {time.perf_counter() - start:.1f}s", flush=True)
+
+
+class Command(BaseCommand):
+    help = 'Run AI grading jobs queued by submission uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is runnable instead of polling')
+
+    def handle(self, *args, **options):
+        from aniTA_app.grading_queue import get_grading_queue
+        self.stdout.write(f"Queue: {get_grading_queue().counts()}")
+
+        context = multiprocessing.get_context('spawn')
+        processes = [
+            context.Process(target=work, args=(i, options['poll_interval'], options['once']), daemon=False)
+            for i in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(f"Started {len(processes)} grading worker(s)"))
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS("Grading workers stopped"))
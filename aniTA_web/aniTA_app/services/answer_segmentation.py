@@ -0,0 +1,229 @@
+"""
+Split a student's submission into per-question answers in one pass.
+
+The previous matcher called `str.find` for each question's text and ID and
+again for the next question, which is quadratic in the number of questions,
+case- and whitespace-sensitive, and cut answers short whenever the next
+question's wording appeared earlier in the text. Here an Aho-Corasick
+automaton over every question text and ID scans the normalised submission
+once. One anchor is chosen per question, and each answer runs from its
+anchor to the next anchor in the text, so answers given out of order are
+still attributed correctly.
+
+Each answer carries a match confidence:
+
+    1.0   question text found once
+    0.8   question text found several times (first unclaimed occurrence used)
+    0.6   only the question ID found, at the start of a line
+    0.4   only the question ID found, mid-line (e.g. "as in Q3")
+    0.0   not found (empty answer)
+"""
+
+import re
+from collections import deque
+
+WHITESPACE_CHAR_RE = re.compile(r"\s")
+SPACE_RUN_RE = re.compile(r" {2,}")
+
+CONFIDENCE_TEXT = 1.0
+CONFIDENCE_REPEATED_TEXT = 0.8
+CONFIDENCE_ID = 0.6
+CONFIDENCE_INLINE_ID = 0.4
+
+
+def _normalise_per_char(text):
+    chars = []
+    offsets = []
+    in_space = False
+    for index, char in enumerate(text):
+        if char.isspace():
+            if not in_space:
+                chars.append(" ")
+                offsets.append(index)
+            in_space = True
+            continue
+        in_space = False
+        for lowered in char.lower():
+            chars.append(lowered)
+            offsets.append(index)
+    return "".join(chars), offsets
+
+
+def normalise_with_offsets(text):
+    """
+    Lowercase text and collapse whitespace runs to one space.
+
+    Returns:
+        tuple: (normalised text, list mapping each normalised character to
+        its index in the original text)
+    """
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few characters lowercase to several (e.g. "İ")
+        return _normalise_per_char(text)
+
+    # Same length so far; only runs of two or more spaces shift offsets
+    spaced = WHITESPACE_CHAR_RE.sub(" ", lowered)
+    parts = []
+    offsets = []
+    position = 0
+    for match in SPACE_RUN_RE.finditer(spaced):
+        start, end = match.span()
+        parts.append(spaced[position:start + 1])
+        offsets.extend(range(position, start + 1))
+        position = end
+    parts.append(spaced[position:])
+    offsets.extend(range(position, len(spaced)))
+    return "".join(parts), offsets
+
+
+def normalise(text):
+    return normalise_with_offsets(text)[0].strip()
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher: finds every occurrence of every pattern in a
+    single pass over the text.
+
+    Args:
+        patterns (list): Non-empty strings; matches report their index
+    """
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern_index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern_index)
+
+        # Breadth-first, so every state's failure target is final before its children use it
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def finditer(self, text):
+        """Yield (start, end, pattern index) for every occurrence, by end position."""
+        goto, fail, output, patterns = self.goto, self.fail, self.output, self.patterns
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for pattern_index in output[state]:
+                    yield position + 1 - len(patterns[pattern_index]), position + 1, pattern_index
+
+
+def _is_word_boundary(text, start, end):
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def _starts_line(text, index):
+    line_start = text.rfind("\n", 0, index) + 1
+    return not text[line_start:index].strip()
+
+
+def _overlaps(claimed, start, end):
+    return any(start < claimed_end and claimed_start < end for claimed_start, claimed_end in claimed)
+
+
+def segment_answers(student_text, questions):
+    """
+    Args:
+        student_text (str): Extracted submission text
+        questions (list): {"id", "text"} dicts in exam order
+
+    Returns:
+        list: One {"question_id", "question_text", "student_answer",
+        "confidence"} dict per question, in the order of `questions`
+    """
+    text, offsets = normalise_with_offsets(student_text)
+
+    # Pattern i * 2 is question i's text, i * 2 + 1 its ID
+    patterns = []
+    for question in questions:
+        patterns.append(normalise(question.get("text", "")))
+        patterns.append(normalise(question.get("id", "")))
+    matchable = [(index, pattern) for index, pattern in enumerate(patterns) if pattern]
+    automaton = AhoCorasick([pattern for _, pattern in matchable])
+
+    text_hits = [[] for _ in questions]
+    id_hits = [[] for _ in questions]
+    for start, end, match_index in automaton.finditer(text):
+        pattern_index = matchable[match_index][0]
+        question_index, is_id = divmod(pattern_index, 2)
+        if is_id:
+            # "Q1" must not match inside "Q10"
+            if _is_word_boundary(text, start, end):
+                id_hits[question_index].append((start, end))
+        else:
+            text_hits[question_index].append((start, end))
+
+    # Longer question texts first, so a question whose text contains another's
+    # does not lose its anchor; IDs only where no question text was found
+    anchors = {}
+    claimed = []
+    by_length = sorted(range(len(questions)), key=lambda i: -len(patterns[i * 2]))
+    for question_index in by_length:
+        hits = sorted(text_hits[question_index])
+        for start, end in hits:
+            if not _overlaps(claimed, start, end):
+                confidence = CONFIDENCE_TEXT if len(hits) == 1 else CONFIDENCE_REPEATED_TEXT
+                anchors[question_index] = (start, end, confidence)
+                claimed.append((start, end))
+                break
+    for question_index in range(len(questions)):
+        if question_index in anchors:
+            continue
+        # An ID heading a line ("Q3: ...") beats one mentioned mid-sentence
+        hits = [(not _starts_line(student_text, offsets[start]), start, end)
+                for start, end in id_hits[question_index] if not _overlaps(claimed, start, end)]
+        if hits:
+            inline, start, end = min(hits)
+            anchors[question_index] = (start, end, CONFIDENCE_INLINE_ID if inline else CONFIDENCE_ID)
+            claimed.append((start, end))
+
+    def original_offset(normalised_index):
+        if normalised_index >= len(offsets):
+            return len(student_text)
+        return offsets[normalised_index]
+
+    answers = [None] * len(questions)
+    ordered = sorted(anchors.items(), key=lambda item: item[1][0])
+    for position, (question_index, (start, end, confidence)) in enumerate(ordered):
+        next_start = ordered[position + 1][1][0] if position + 1 < len(ordered) else len(text)
+        answer = student_text[original_offset(end):original_offset(next_start)].strip()
+        answer = answer.lstrip(":.)-").strip()  # "Q3: ...", "Q3) ..."
+        answers[question_index] = (answer, confidence)
+
+    results = []
+    for question_index, question in enumerate(questions):
+        answer, confidence = answers[question_index] or ("", 0.0)
+        results.append({
+            "question_id": question.get("id"),
+            "question_text": question.get("text"),
+            "student_answer": answer,
+            "confidence": confidence
+        })
+    return results
@@ -0,0 +1,128 @@
+"""
+Persistent embedding cache.
+
+Course materials are re-uploaded across assignments and terms and student
+text is re-embedded on regrades. Vectors are cached in a SQLite file keyed
+by sha256(model name + normalised text) and stored as raw float32 bytes, so
+re-processing identical content is a lookup instead of a forward pass. The
+file is shared by every process on the host (WAL mode) and is kept under a
+size bound by evicting the least recently used entries.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalise_text(text):
+    return WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\x00{normalise_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed map of cache_key -> float32 vector with LRU eviction.
+
+    Args:
+        path (str): SQLite database file
+        max_bytes (int): Evict least recently used vectors beyond this size
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    LOOKUP_BATCH = 500
+    # Approximate per-row cost of the key, timestamp and index entries
+    ROW_OVERHEAD = 200
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        """
+        Look up vectors and mark them as recently used.
+
+        Returns:
+            dict: key -> list of floats, for the keys that were cached
+        """
+        found = {}
+        keys = list(set(keys))
+        conn = self._connection()
+        for i in range(0, len(keys), self.LOOKUP_BATCH):
+            batch = keys[i:i + self.LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for key, blob in conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                 [(now, key) for key in found])
+        return found
+
+    def put_many(self, items):
+        """
+        Store vectors.
+
+        Args:
+            items (dict): key -> embedding (list or np.ndarray)
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for key, vector in items.items()]
+        conn = self._connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+        self._evict(len(rows[0][1]))
+
+    def _evict(self, vector_bytes):
+        """
+        Delete least recently used rows once the estimated size exceeds
+        max_bytes, bringing it back to 90%. Sizes are estimated from the row
+        count because freed SQLite pages do not shrink the file.
+        """
+        max_entries = self.max_bytes // (vector_bytes + self.ROW_OVERHEAD)
+        conn = self._connection()
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= max_entries:
+            return
+        with conn:
+            conn.execute("""
+                DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+                )
+            """, (count - int(max_entries * 0.9),))
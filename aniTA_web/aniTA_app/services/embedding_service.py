@@ -0,0 +1,158 @@
+"""
+Process-wide sentence embedding service.
+
+Loading the sentence-transformers model takes seconds, so it is loaded once
+per process and shared by every caller (course material ingestion, grading
+context lookups and the network simulation). Set EMBEDDING_SERVICE["WARM_UP"]
+to load it when Django starts, e.g. in each gunicorn worker, instead of on
+the first request that needs it.
+"""
+
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from .embedding_cache import EmbeddingCache, cache_key
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingService:
+    """
+    Lazily loaded SentenceTransformer with batched encoding.
+
+    Args:
+        model_name (str): sentence-transformers model to load
+        batch_size (int): Texts encoded per forward pass
+        num_threads (int): Torch intra-op threads (None keeps the default)
+        cache (EmbeddingCache): Persistent vector cache, or None
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, batch_size=32, num_threads=None, cache=None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.cache = cache
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "load_seconds": None,
+            "calls": 0,
+            "texts": 0,
+            "encode_seconds": 0.0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    if self.num_threads:
+                        import torch
+                        torch.set_num_threads(self.num_threads)
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+                    self.stats["load_seconds"] = time.perf_counter() - start
+                    print(f"Loaded embedding model {self.model_name} in "
+                          f"{self.stats['load_seconds']:.2f}s", flush=True)
+        return self._model
+
+    def warm_up(self):
+        """Load the model and run one encode so the first request is not slow."""
+        self.embed_many(["warm up"])
+
+    def embed_many(self, texts):
+        """
+        Encode a list of texts in batches. Texts already in the persistent
+        cache are not re-encoded.
+
+        Args:
+            texts (list): Strings to embed
+
+        Returns:
+            list: One embedding (list of floats) per text, in input order
+        """
+        if not texts:
+            return []
+        texts = list(texts)
+        if self.cache is None:
+            return self._encode(texts)
+
+        keys = [cache_key(self.model_name, text) for text in texts]
+        try:
+            cached = self.cache.get_many(keys)
+        except sqlite3.Error as e:
+            print(f"Embedding cache lookup failed: {e}", flush=True)
+            return self._encode(texts)
+
+        # Encode each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._stats_lock:
+            self.stats["cache_hits"] += len(texts) - len(missing)
+            self.stats["cache_misses"] += len(missing)
+
+        if missing:
+            encoded = dict(zip(missing.keys(), self._encode(list(missing.values()))))
+            try:
+                self.cache.put_many(encoded)
+            except sqlite3.Error as e:
+                print(f"Embedding cache write failed: {e}", flush=True)
+            cached.update(encoded)
+        return [cached[key] for key in keys]
+
+    def _encode(self, texts):
+        model = self.model
+        start = time.perf_counter()
+        embeddings = model.encode(texts, batch_size=self.batch_size,
+                                  show_progress_bar=False, convert_to_numpy=True)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["texts"] += len(texts)
+            self.stats["encode_seconds"] += elapsed
+        return embeddings.tolist()
+
+    def embed_one(self, text):
+        return self.embed_many([text])[0]
+
+    def metrics(self):
+        """Snapshot of load time and encode throughput."""
+        with self._stats_lock:
+            snapshot = dict(self.stats)
+        snapshot["model_name"] = self.model_name
+        snapshot["loaded"] = self._model is not None
+        snapshot["texts_per_second"] = (
+            snapshot["texts"] / snapshot["encode_seconds"] if snapshot["encode_seconds"] else None
+        )
+        return snapshot
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    """Return the process-wide EmbeddingService configured by settings.EMBEDDING_SERVICE."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                config = getattr(settings, "EMBEDDING_SERVICE", {})
+                cache = None
+                if config.get("CACHE_PATH"):
+                    cache = EmbeddingCache(config["CACHE_PATH"],
+                                           config.get("CACHE_MAX_BYTES", 512 * 1024 * 1024))
+                _service = EmbeddingService(
+                    model_name=config.get("MODEL", DEFAULT_MODEL),
+                    batch_size=config.get("BATCH_SIZE", 32),
+                    num_threads=config.get("NUM_THREADS"),
+                    cache=cache,
+                )
+    return _service
@@ -0,0 +1,261 @@
+"""
+PDF text extraction with a per-file cache.
+
+pdfplumber is accurate but slow (it computes a full character layout), and
+the same PDF is extracted again on every regrade and context rebuild. The
+extractor here:
+
+- uses pypdf as a fast path when it is installed, falling back to
+  pdfplumber for pages where pypdf returns nothing or garbled text
+  (layout-sensitive pages such as tables or unusual encodings), and for
+  the whole file when pypdf cannot open it (malformed or encrypted PDFs),
+- splits the pages of large PDFs across a process pool, and
+- stores the extracted text next to the blob: in the `pdf_texts`
+  collection under the PDF's sha256, the same digest the blob store
+  addresses the submission by. Every later operation on that file, on
+  any host or worker, reads the text instead of fetching and parsing the
+  PDF. An optional local directory (PDF_TEXT["CACHE_DIR"]) caches it in
+  front of the database.
+
+The output has the same shape as before: the non-empty page texts joined
+by newlines. Set PDF_TEXT["BACKEND"] to "pdfplumber" for the exact text of
+the original pdfplumber-only extraction.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+# Bump when extraction changes so stale cached text is not reused
+EXTRACTION_VERSION = 1
+
+COLLECTION = 'pdf_texts'
+
+CHUNK_SIZE = 64 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _looks_garbled(text):
+    """pypdf output worth redoing with pdfplumber: missing glyph mappings or no words."""
+    if "�" in text or "(cid:" in text:
+        return True
+    letters = sum(c.isalnum() for c in text)
+    return letters < len(text.strip()) * 0.3
+
+
+def _pdfplumber_pages(pdf_path, page_numbers):
+    import pdfplumber
+    texts = {}
+    with pdfplumber.open(pdf_path) as pdf:
+        for number in page_numbers:
+            texts[number] = pdf.pages[number].extract_text() or ""
+    return texts
+
+
+def extract_page_range(pdf_path, start, stop, backend="auto"):
+    """
+    Extract pages [start, stop). Top-level so pool workers can run it.
+
+    Returns:
+        list: Text of each page ("" for pages without text)
+    """
+    texts = {}
+    fallback = list(range(start, stop))
+    if backend in ("auto", "pypdf"):
+        reader = None
+        try:
+            from pypdf import PdfReader
+            reader = PdfReader(pdf_path)
+        except Exception:
+            # Not installed, or a file pypdf cannot open: pdfplumber for all pages
+            pass
+        if reader is not None:
+            fallback = []
+            for number in range(start, stop):
+                try:
+                    text = reader.pages[number].extract_text() or ""
+                except Exception:
+                    text = ""
+                if text.strip() and not _looks_garbled(text):
+                    texts[number] = text
+                else:
+                    fallback.append(number)
+    if fallback:
+        texts.update(_pdfplumber_pages(pdf_path, fallback))
+    return [texts[number] for number in range(start, stop)]
+
+
+def count_pages(pdf_path):
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(pdf_path).pages)
+    except Exception:
+        # pypdf missing, or unable to read a file pdfplumber may still open
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+
+class PdfTextExtractor:
+    """
+    Args:
+        store (bool): Keep extracted text in the `pdf_texts` collection
+        cache_dir (str): Local directory caching text in front of the
+            collection, or None
+        processes (int): Pool size for large PDFs; 1 extracts in the calling thread
+        parallel_min_pages (int): Smallest PDF split across the pool
+        backend (str): "auto" (pypdf with pdfplumber fallback) or "pdfplumber"
+    """
+
+    def __init__(self, store=True, cache_dir=None, processes=1, parallel_min_pages=16, backend="auto"):
+        self.store = store
+        self.cache_dir = str(cache_dir) if cache_dir else None
+        self.processes = max(1, processes or 1)
+        self.parallel_min_pages = parallel_min_pages
+        self.backend = backend
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(os.path.join(self.cache_dir, "tmp"), exist_ok=True)
+
+    def _cache_path(self, sha256):
+        return os.path.join(self.cache_dir, sha256[:2], f"{sha256}.v{EXTRACTION_VERSION}.txt")
+
+    def _document_key(self, sha256):
+        return f"{sha256}-v{EXTRACTION_VERSION}"
+
+    def cached(self, sha256):
+        """Stored text of the PDF with this digest, or None."""
+        if not sha256:
+            return None
+        if self.cache_dir:
+            try:
+                with open(self._cache_path(sha256), encoding="utf-8") as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+        if not self.store:
+            return None
+        # Imported here: pool workers import this module without Django set up
+        from users.arangodb import db
+        try:
+            document = db.collection(COLLECTION).get(self._document_key(sha256))
+        except Exception as e:
+            print(f"Could not read stored PDF text: {e}", flush=True)
+            return None
+        if document is None:
+            return None
+        if self.cache_dir:
+            try:
+                self._cache_locally(sha256, document["text"])
+            except OSError as e:
+                print(f"Could not cache PDF text locally: {e}", flush=True)
+        return document["text"]
+
+    def _store(self, sha256, text):
+        if self.store:
+            from users.arangodb import db
+            db.collection(COLLECTION).insert({"_key": self._document_key(sha256), "sha256": sha256,
+                                              "version": EXTRACTION_VERSION, "text": text}, overwrite=True)
+        if self.cache_dir:
+            self._cache_locally(sha256, text)
+
+    def _cache_locally(self, sha256, text):
+        # Written to a temp file and renamed, so readers never see partial text
+        path = self._cache_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.cache_dir, "tmp"))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+                tmp.write(text)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # Spawned, not forked: the parent may be a threaded server
+                    self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _extract_pages(self, pdf_path):
+        backend = self.backend
+        page_count = count_pages(pdf_path)
+        if self.processes == 1 or page_count < self.parallel_min_pages:
+            return extract_page_range(pdf_path, 0, page_count, backend)
+
+        # A few ranges per process so one slow range does not hold up the rest
+        step = max(1, -(-page_count // (self.processes * 4)))
+        pool = self._get_pool()
+        futures = [pool.submit(extract_page_range, pdf_path, start, min(start + step, page_count), backend)
+                   for start in range(0, page_count, step)]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+
+    def extract(self, pdf_path, sha256=None):
+        """
+        Args:
+            pdf_path (str): PDF file
+            sha256 (str): The file's digest when already known (e.g. its
+                blob reference), saving a pass over the file
+
+        Returns:
+            str: Extracted text, "" if the PDF has none or cannot be read
+        """
+        keep = self.store or self.cache_dir
+        try:
+            if keep and not sha256:
+                sha256 = file_sha256(pdf_path)
+            text = self.cached(sha256)
+            if text is not None:
+                return text
+            text = "\n".join(page for page in self._extract_pages(pdf_path) if page)
+        except Exception as e:
+            print(f"Error extracting text from PDF: {e}")
+            return ""
+
+        if keep:
+            try:
+                self._store(sha256, text)
+            except Exception as e:
+                print(f"Could not store extracted PDF text: {e}", flush=True)
+        return text
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_text_extractor():
+    """Return the process-wide PdfTextExtractor configured by settings.PDF_TEXT."""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                config = getattr(settings, "PDF_TEXT", {})
+                _extractor = PdfTextExtractor(
+                    store=config.get("STORE", True),
+                    cache_dir=config.get("CACHE_DIR"),
+                    processes=config.get("PROCESSES", 1),
+                    parallel_min_pages=config.get("PARALLEL_MIN_PAGES", 16),
+                    backend=config.get("BACKEND", "auto"),
+                )
+    return _extractor
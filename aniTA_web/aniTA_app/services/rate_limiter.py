@@ -0,0 +1,99 @@
+"""
+Token-bucket rate limiting for Anthropic API calls.
+
+`RateLimitedClient` wraps an Anthropic client (or the local stub) so every
+`messages.create` and `messages.stream` call first takes one request token
+and an estimate of its input tokens from the buckets, blocking until the
+configured requests-per-minute and input-tokens-per-minute budgets allow it.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Args:
+        rate_per_minute (float): Refill rate
+        capacity (float): Burst size (defaults to one minute's worth)
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available, then take them."""
+        # A request larger than the bucket could never be admitted; let it
+        # through once the bucket is full instead.
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+            with self.lock:
+                self.waited_seconds += wait
+
+
+def estimate_input_tokens(system, messages):
+    """Rough input token count (about four characters per token)."""
+    text = system if isinstance(system, str) else str(system or "")
+    for message in messages:
+        text += str(message.get("content", ""))
+    return max(1, len(text) // 4)
+
+
+class _RateLimitedMessages:
+    def __init__(self, messages, request_bucket, token_bucket):
+        self._messages = messages
+        self._request_bucket = request_bucket
+        self._token_bucket = token_bucket
+
+    def _acquire(self, kwargs):
+        if self._request_bucket:
+            self._request_bucket.acquire(1)
+        if self._token_bucket:
+            self._token_bucket.acquire(estimate_input_tokens(kwargs.get("system"), kwargs.get("messages", [])))
+
+    def create(self, **kwargs):
+        self._acquire(kwargs)
+        return self._messages.create(**kwargs)
+
+    def stream(self, **kwargs):
+        self._acquire(kwargs)
+        return self._messages.stream(**kwargs)
+
+
+class RateLimitedClient:
+    """
+    Anthropic client wrapper enforcing request and input token budgets.
+
+    Args:
+        client: The wrapped client
+        requests_per_minute (float): Request budget (None for unlimited)
+        input_tokens_per_minute (float): Input token budget (None for unlimited)
+    """
+
+    def __init__(self, client, requests_per_minute=None, input_tokens_per_minute=None):
+        self.client = client
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(input_tokens_per_minute) if input_tokens_per_minute else None
+        self.messages = _RateLimitedMessages(client.messages, self.request_bucket, self.token_bucket)
+
+    def waited_seconds(self):
+        return sum(bucket.waited_seconds for bucket in (self.request_bucket, self.token_bucket) if bucket)
@@ -0,0 +1,122 @@
+"""
+Local stand-in for the Anthropic client.
+
+Implements the part of the client interface the grading service uses
+(`client.messages.create(...)` returning `.content[0].text` and `.usage`,
+and `client.messages.stream(...)` yielding JSON Lines text),
+so bulk grading, rate limiting and caching can be exercised without API
+keys or cost. Scores are derived from a hash of the prompt, so the same
+submission always gets the same grade.
+"""
+
+import hashlib
+import json
+import random
+import time
+from types import SimpleNamespace
+
+
+class _StubMessages:
+    def __init__(self, latency, jitter, failure_rate):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.cached_prefixes = set()
+
+    def _system_usage(self, system):
+        """Mimic prompt caching: a cacheable block is written once, then read."""
+        written = read = uncached = 0
+        blocks = system if isinstance(system, list) else [{"type": "text", "text": system or ""}]
+        for block in blocks:
+            tokens = len(block.get("text", "")) // 4
+            if not block.get("cache_control"):
+                uncached += tokens
+            elif block["text"] in self.cached_prefixes:
+                read += tokens
+            else:
+                self.cached_prefixes.add(block["text"])
+                written += tokens
+        return written, read, uncached
+
+    def create(self, model=None, max_tokens=None, system=None, messages=None, **kwargs):
+        self.calls += 1
+        prompt = "".join(str(message.get("content", "")) for message in messages or [])
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Stub client: simulated API failure")
+
+        return self._response(model, system, prompt)
+
+    def stream(self, model=None, max_tokens=None, system=None, messages=None, **kwargs):
+        self.calls += 1
+        prompt = "".join(str(message.get("content", "")) for message in messages or [])
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Stub client: simulated API failure")
+        return _StubStream(self, model, system, prompt)
+
+    def _response(self, model, system, prompt):
+        cache_written, cache_read, system_uncached = self._system_usage(system)
+        digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+        score = 50 + digest % 51
+        # Valid for both whole-submission and per-question prompts
+        text = json.dumps({
+            "score": score,
+            "justification": "Stub grading result.",
+            "total_score": score,
+            "results": [{
+                "question": "Assignment",
+                "score": score,
+                "justification": "Stub grading result."
+            }]
+        })
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=SimpleNamespace(input_tokens=system_uncached + len(prompt) // 4, output_tokens=len(text) // 4,
+                                  cache_creation_input_tokens=cache_written, cache_read_input_tokens=cache_read),
+            model=model,
+        )
+
+
+class _StubStream:
+    """Context manager mimicking `client.messages.stream(...)` with JSON Lines output."""
+
+    def __init__(self, messages, model, system, prompt):
+        self.messages = messages
+        self.model = model
+        self.system = system
+        self.prompt = prompt
+        self.final = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        self.final = self.messages._response(self.model, self.system, self.prompt)
+        result = json.loads(self.final.content[0].text)
+        lines = [json.dumps(item) for item in result["results"]]
+        lines.append(json.dumps({"total_score": result["total_score"]}))
+        text = "\n".join(lines)
+        pieces = [text[i:i + 20] for i in range(0, len(text), 20)]
+        for piece in pieces:
+            time.sleep(self.messages.latency / len(pieces))
+            yield piece
+
+    def get_final_message(self):
+        return self.final
+
+
+class StubAnthropicClient:
+    """
+    Args:
+        latency (float): Seconds each call takes
+        jitter (float): Uniform +/- variation of the latency
+        failure_rate (float): Probability that a call raises
+    """
+
+    def __init__(self, latency=1.0, jitter=0.3, failure_rate=0.0):
+        self.messages = _StubMessages(latency, jitter, failure_rate)
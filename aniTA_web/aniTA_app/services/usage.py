@@ -0,0 +1,64 @@
+"""
+Token usage and cost accounting for Claude calls.
+
+Grading prompts start with a static block that is marked cacheable, so a
+call's input is split into uncached tokens, tokens written to the prompt
+cache and tokens read from it, each billed at a different rate.
+"""
+
+# USD per million tokens. Cache writes cost 1.25x and cache reads 0.1x the
+# base input rate.
+MODEL_PRICING = {
+    "claude-3-haiku-20240307": {"input": 0.25, "cache_write": 0.30, "cache_read": 0.03, "output": 1.25},
+    "claude-3-5-haiku-20241022": {"input": 0.80, "cache_write": 1.00, "cache_read": 0.08, "output": 4.00},
+    "claude-3-5-sonnet-20241022": {"input": 3.00, "cache_write": 3.75, "cache_read": 0.30, "output": 15.00},
+}
+
+USAGE_FIELDS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+
+
+def empty_usage():
+    usage = {field: 0 for field in USAGE_FIELDS}
+    usage["calls"] = 0
+    usage["cost_usd"] = 0.0
+    return usage
+
+
+def usage_from_response(response, model):
+    """Usage of one API response, with its cost (None for unknown models)."""
+    raw = getattr(response, "usage", None)
+    usage = {field: int(getattr(raw, field, 0) or 0) for field in USAGE_FIELDS}
+    usage["calls"] = 1
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        usage["cost_usd"] = None
+    else:
+        usage["cost_usd"] = (
+            usage["input_tokens"] * pricing["input"]
+            + usage["cache_creation_input_tokens"] * pricing["cache_write"]
+            + usage["cache_read_input_tokens"] * pricing["cache_read"]
+            + usage["output_tokens"] * pricing["output"]
+        ) / 1_000_000
+    return usage
+
+
+def add_usage(total, usage):
+    """Accumulate `usage` into `total` in place and return it."""
+    for field in USAGE_FIELDS + ("calls",):
+        total[field] = total.get(field, 0) + usage.get(field, 0)
+    if total.get("cost_usd") is None or usage.get("cost_usd") is None:
+        total["cost_usd"] = None
+    else:
+        total["cost_usd"] += usage["cost_usd"]
+    return total
+
+
+def describe_usage(usage):
+    """One-line summary, e.g. for logs."""
+    cached = usage["cache_read_input_tokens"]
+    total_input = usage["input_tokens"] + usage["cache_creation_input_tokens"] + cached
+    cost = f"${usage['cost_usd']:.4f}" if usage.get("cost_usd") is not None else "unknown cost"
+    share = f"{cached / total_input:.0%}" if total_input else "n/a"
+    return (f"{usage['calls']} call(s), input {total_input} tokens ({cached} cached, "
+            f"{usage['cache_creation_input_tokens']} cache writes, {usage['input_tokens']} uncached; "
+            f"{share} from cache), output {usage['output_tokens']} tokens, {cost}")
@@ -0,0 +1,109 @@
+"""
+Single-pass ingestion of uploaded PDFs.
+
+By default Django buffers an upload in memory (or a temp file above
+FILE_UPLOAD_MAX_MEMORY_SIZE), the views then copied it into another temp
+file, and the blob store read that back to hash and store it. With
+BlobUploadHandler installed on a view, each chunk of a PDF is hashed and
+written to the blob store's staging file as Django parses the request, and
+the view gets an IngestedFile whose local path can be given straight to
+text extraction.
+
+The staged file only goes into the store when the view calls
+store_upload(), i.e. after it has accepted the request (CSRF, sign-in,
+enrollment). A rejected upload is never stored: Django closes the
+request's files when the response is done, which removes the staging file.
+"""
+
+import tempfile
+from contextlib import contextmanager
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from users.blob_store import get_blob_store
+
+
+def _is_pdf(file_name, content_type):
+    return content_type == "application/pdf" or (file_name or "").lower().endswith(".pdf")
+
+
+class IngestedFile(UploadedFile):
+    """An upload staged for the blob store; store_upload() stores it."""
+
+    def __init__(self, writer, name, content_type, charset, content_type_extra=None):
+        super().__init__(open(writer.path, "rb"), name, content_type, writer.size, charset, content_type_extra)
+        self.writer = writer
+
+    @property
+    def blob_ref(self):
+        """Blob reference once stored, None before."""
+        return self.writer.ref
+
+    def temporary_file_path(self):
+        return self.writer.path
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            self.writer.close()
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """
+    Upload handler staging PDF fields for the blob store as they stream in,
+    hashing them on the way. Other files are passed on to the next
+    handlers unchanged.
+
+    Must be inserted before the request body is read, i.e. in a view
+    wrapped with csrf_exempt that applies CSRF protection itself.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.writer = None
+        if _is_pdf(file_name, content_type):
+            self.writer = get_blob_store().writer(content_type="application/pdf")
+            # The default handlers would otherwise open their own buffer
+            raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.writer is None:
+            return raw_data
+        self.writer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.writer is None:
+            return None
+        # Stored by store_upload() once the view accepts the request
+        self.writer.finish()
+        return IngestedFile(self.writer, self.file_name, self.content_type, self.charset, self.content_type_extra)
+
+    def upload_interrupted(self):
+        if getattr(self, "writer", None) is not None:
+            self.writer.close()
+
+
+def store_upload(uploaded_file):
+    """
+    Store an upload and return its blob reference. Call it only once the
+    request has been accepted; files staged by BlobUploadHandler are moved
+    into the store rather than copied.
+    """
+    writer = getattr(uploaded_file, "writer", None)
+    if writer is not None:
+        return writer.ref or writer.commit()
+    return get_blob_store().put_stream(uploaded_file.chunks())
+
+
+@contextmanager
+def upload_path(uploaded_file, suffix=".pdf"):
+    """Local path of an upload's bytes, copying to a temp file only if there is none."""
+    if hasattr(uploaded_file, "temporary_file_path"):
+        yield uploaded_file.temporary_file_path()
+        return
+    with tempfile.NamedTemporaryFile(suffix=suffix) as temp:
+        for chunk in uploaded_file.chunks():
+            temp.write(chunk)
+        temp.flush()
+        yield temp.name
@@ -17,6 +17,8 @@ urlpatterns = [
     path("student-add-class/", views.student_add_course_get, name='student_add_course_get'),
     path("add_assignment/", views.add_assignment, name="add_assignment"),
     path("upload_assignment/<str:class_code>/<str:assignment_id>", views.upload, name='upload_assignment'),
+    path("grading_status/<str:class_code>/<str:assignment_id>", views.grading_status, name='grading_status'),
+    path("grading_stream/<str:class_code>/<str:assignment_id>", views.grading_stream, name='grading_stream'),
     path("view_pdf/<str:submission_id>", views.view_pdf, name='view_pdf'),
     path("view_assignment_instructions/<str:assignment_id>", views.view_assignment_instructions, name="view_assignment_instructions"),
     path("instructor/grade_submission/<str:numeric_id>", views.instructor_grade_submission, name="instructor_grade_submission"),
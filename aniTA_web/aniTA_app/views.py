@@ -1,16 +1,25 @@
 from django.http import HttpResponse
 from django.template import loader
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from users.arangodb import *
 from users.material_db import *
-from users.graph_ops import store_mistake_and_edges
+from users.graph_ops import store_grading_result
+from users.blob_store import get_blob_store, BlobNotFound, get_cached_file_ref, cache_file_ref
 import requests
 import io # soon to be unused
 import os
 import tempfile
-import base64
+import json
+import threading
+import time
+from django.conf import settings
 from .claude_service import ClaudeGradingService
+from .grading import apply_default_feedback, run_grading_job
+from .grading_queue import DONE, FAILED, QUEUED, RUNNING, get_grading_queue, submission_ref
+from .uploads import BlobUploadHandler, store_upload, upload_path
+from .file_responses import document_file_ref, file_ref_response, not_modified_response
 
 # Create your views here.
 def index(request):
@@ -255,10 +264,18 @@ def convert_to_buffered_reader(uploaded_file):
     # io.BufferedReader(uploaded_file.file) => _io.BufferedReader()
     return io.BufferedReader(uploaded_file.file)
 
+@csrf_exempt
 def add_assignment(request):
     """
     POST Request to add an assignment. (Made by the instructor.)
     """
+    # PDFs are staged while Django parses the body; see upload()
+    request.upload_handlers.insert(0, BlobUploadHandler(request))
+    return _add_assignment(request)
+
+
+@csrf_protect
+def _add_assignment(request):
     if request.method == "POST":
         class_code = request.POST.get('class_code')
         assignment_name = request.POST.get('assignment_name')
@@ -271,6 +288,11 @@ def add_assignment(request):
         solution_file = request.FILES.get('solution_file')
         rubric_file = request.FILES.get('rubric_file')  # New rubric file upload
 
+        # Uploaded PDFs are only staged so far; nothing is stored for
+        # requests turned away here
+        if not (request.session.get('user_id') and request.session.get('role') == 'instructor'):
+            return redirect('/')
+
         # Convert total_points to integer
         try:
             total_points = int(total_points)
@@ -312,19 +334,14 @@ def add_assignment(request):
                     request.session['flash_error'] = []
                 request.session['flash_error'].append(f"Could not process rubric file: {e}")
 
-        with tempfile.NamedTemporaryFile(suffix='.pdf') as instructions_temp:
-            for chunk in instructions_file.chunks():
-                instructions_temp.write(chunk)
-            instructions_temp.flush()
-            with open(instructions_temp.name, 'rb') as instructions_pdf:
-                encoded_pdf = base64.b64encode(instructions_pdf.read()).decode('utf-8')
+        instructions_blob = store_upload(instructions_file)
 
         err = db_create_assignment(class_code,
                                    assignment_name,
                                    description,
                                    due_date,
                                    total_points,
-                                   encoded_pdf,
+                                   instructions_blob,
                                    instructions_file.name)
         if err:
             if 'flash_error' not in request.session:
@@ -339,18 +356,10 @@ def add_assignment(request):
             # Initialize Claude service for materials processing
             claude_service = ClaudeGradingService()
 
-            # Use context managers for temporary files
-            with tempfile.NamedTemporaryFile(suffix='.pdf') as assignment_temp, \
-                 tempfile.NamedTemporaryFile(suffix='.pdf') as solution_temp:
-
-                # Write uploaded files to temp files
-                for chunk in assignment_file.chunks():
-                    assignment_temp.write(chunk)
-                assignment_temp.flush()
-
-                for chunk in solution_file.chunks():
-                    solution_temp.write(chunk)
-                solution_temp.flush()
+            # Ingested PDFs are read where they are stored; other uploads
+            # are copied to temporary files
+            with upload_path(assignment_file) as assignment_path, \
+                 upload_path(solution_file) as solution_path:
 
                 # Process course materials with Claude
                 try:
@@ -358,15 +367,19 @@ def add_assignment(request):
                     material_result = claude_service.process_course_material(
                         class_code=class_code,
                         assignment_id=assignment_id,
-                        pdf_path=assignment_temp.name,
-                        rubric_items=rubric_items
+                        pdf_path=assignment_path,
+                        rubric_items=rubric_items,
+                        file_blob=store_upload(assignment_file),
+                        file_name=assignment_file.name
                     )
 
                     # Process solution file for additional context
                     solution_result = claude_service.process_course_material(
                         class_code=class_code,
                         assignment_id=f"{assignment_id}_solution",
-                        pdf_path=solution_temp.name
+                        pdf_path=solution_path,
+                        file_blob=store_upload(solution_file),
+                        file_name=solution_file.name
                     )
 
                     if material_result.get("success") and solution_result.get("success"):
@@ -432,9 +445,9 @@ def upload(request, class_code, assignment_id):
             submission_temp.flush()
 
             with open(submission_temp.name, 'rb') as submission_pdf:
-                encoded_pdf = base64.b64encode(submission_pdf.read()).decode('utf-8')
+                submission_blob = get_blob_store().put_file(submission_pdf)
 
-            err = db_add_submission(user_id, class_code, assignment_id, encoded_pdf, file_name)
+            err = db_add_submission(user_id, class_code, assignment_id, submission_blob, file_name)
             if err:
                 if 'flash_error' not in request.session:
                     request.session['flash_error'] = []
@@ -515,7 +528,16 @@ def upload(request, class_code, assignment_id):
     else:
         return redirect('/')
     
+@csrf_exempt
 def upload(request, class_code, assignment_id):
+    # The PDF is staged while Django parses the body, so the handler has to
+    # be installed before the CSRF check reads it
+    request.upload_handlers.insert(0, BlobUploadHandler(request))
+    return _upload(request, class_code, assignment_id)
+
+
+@csrf_protect
+def _upload(request, class_code, assignment_id):
     if request.method == "POST":
         submission = request.FILES.get('file_input')
         user_id = request.session.get('user_id')
@@ -534,245 +556,56 @@ def upload(request, class_code, assignment_id):
         
         template = loader.get_template("aniTA_app/upload.html")
 
-        with tempfile.NamedTemporaryFile(suffix='.pdf') as submission_temp:
-            for chunk in submission.chunks():
-                submission_temp.write(chunk)
-            submission_temp.flush()
-
-            with open(submission_temp.name, 'rb') as submission_pdf:
-                encoded_pdf = base64.b64encode(submission_pdf.read()).decode('utf-8')
-
-            # Add submission to DB
-            err = db_add_submission(user_id, class_code, assignment_id, encoded_pdf, submission.name)
-            if err:
-                if 'flash_error' not in request.session:
-                    request.session['flash_error'] = []
-                request.session['flash_error'].append(f"Could not add submission: {err}")
-                return redirect('/dashboard')
-
-            # Grade the submission using Claude
-            try:
-                claude_service = ClaudeGradingService()
-                grading_result = claude_service.grade_from_pdf_data(
-                    student_pdf_path=submission_temp.name,
-                    class_code=class_code,
-                    assignment_id=assignment_id
-                )
+        # The PDF is only staged so far; store it once the submission is allowed
+        if not user_id:
+            return redirect('/')
+        err = db_check_submission_allowed(user_id, class_code, assignment_id)
+        if err:
+            if 'flash_error' not in request.session:
+                request.session['flash_error'] = []
+            request.session['flash_error'].append(f"Could not add submission: {err}")
+            return redirect('/dashboard')
 
-                # Add student_id manually
-                grading_result["student_id"] = str(user_id)
+        submission_blob = store_upload(submission)
 
-                # Check for valid API response - even if there's an error, we'll still use the default values
-                # provided by the API
-                print(f"Grading result received: {grading_result.keys()}", flush=True)
-                
-                # Extract the score and feedback, with defaults if missing
-                print(f"******* DEBUGGING API RESULT *******", flush=True)
-                print(f"Raw grading_result: {grading_result}", flush=True)
-                print(f"Type of grading_result: {type(grading_result)}", flush=True)
-                print(f"Keys in grading_result: {grading_result.keys()}", flush=True)
-                
-                ai_score = grading_result.get("total_score", 70.0)  # Default to passing if missing
-                print(f"Raw ai_score value: {ai_score}", flush=True)
-                print(f"Type of ai_score: {type(ai_score)}", flush=True)
-                
-                ai_feedback = grading_result.get("results", [])
-                print(f"Raw ai_feedback value: {ai_feedback}", flush=True)
-                print(f"Type of ai_feedback: {type(ai_feedback)}", flush=True)
-                
-                # Ensure ai_score is a number
-                try:
-                    ai_score = float(ai_score)
-                    print(f"AI Score (converted to float): {ai_score}", flush=True)
-                    
-                    # If the score is 0, something might be wrong - use a default
-                    if ai_score == 0.0:
-                        print("WARNING: Score is 0, which is unusual. Using default passing score.", flush=True)
-                        ai_score = 70.0  # Default passing score
-                except (ValueError, TypeError):
-                    print(f"Invalid AI score: {ai_score}, using default", flush=True)
-                    ai_score = 70.0  # Default passing score
-                
-                # Ensure ai_feedback is a list
-                if not isinstance(ai_feedback, list):
-                    print(f"AI feedback is not a list, using default", flush=True)
-                    ai_feedback = [{
-                        "question": "Submission",
-                        "score": ai_score,
-                        "justification": "Feedback format was invalid. A default score has been assigned."
-                    }]
-                    
-                print(f"AI Feedback items: {len(ai_feedback)}", flush=True)
-                
-                # Update submission with AI feedback
-                print(f"Calling db_put_ai_feedback with score: {ai_score}", flush=True)
-                feedback_result = db_put_ai_feedback(user_id, class_code, assignment_id, ai_score, ai_feedback)
-                print(f"Result from db_put_ai_feedback: {feedback_result}", flush=True)
-
-                # Now also store Mistake nodes and edges
-                # Build rubric mapping
-                rubrics = db.collection('rubrics')
-                rubric_docs = list(rubrics.find({"assignment_id": assignment_id}))
-                rubric_mapping = {}
-                if rubric_docs:
-                    for item in rubric_docs[0].get("items", []):
-                        rubric_mapping[item["criteria"]] = rubric_docs[0]["_id"]
-
-                # Get submission numeric id
-                user_sub = db_get_submission(user_id, class_code, assignment_id)
-                if user_sub:
-                    submission_id = user_sub["_id"].split('/')[-1]
-                    
-                    # Prepare context data for display template
-                    full_id = user_sub.get("_id")
-                    numeric_id = full_id.split('/')[1] if '/' in full_id else full_id
-                    context["submission_id"] = numeric_id
-                    context["file_name"] = user_sub.get("file_name")
-                    
-                    # Force these values to ensure feedback is displayed immediately
-                    context["graded"] = True
-                    context["grade"] = ai_score
-                    
-                    # Make sure we're using the latest feedback data from the database
-                    # First check if the submission has been updated with AI feedback
-                    updated_submission = db_get_submission(user_id, class_code, assignment_id)
-                    if updated_submission and updated_submission.get("feedback"):
-                        context["feedback"] = updated_submission.get("feedback")
-                    # If not available in the updated submission, format the raw AI feedback
-                    elif isinstance(ai_feedback, list):
-                        feedback_text = ""
-                        for item in ai_feedback:
-                            question = item.get("question", "")
-                            score = item.get("score", 0)
-                            justification = item.get("justification", "")
-                            feedback_text += f"{question}\nScore: {score:.2f}\n{justification}\n\n"
-                        context["feedback"] = feedback_text.strip()
-                    else:
-                        context["feedback"] = user_sub.get("feedback")
-
-                    # Store mistake nodes and edges for analytics
-                    try:
-                        for result_item in grading_result.get("results", []):
-                            # Check that result_item has the required rubric_criteria field or provide a default
-                            if "rubric_criteria" not in result_item:
-                                result_item["rubric_criteria"] = []  # Empty list as default
-                                
-                            store_mistake_and_edges(
-                                student_id=f"users/{user_id}",
-                                submission_id=submission_id,
-                                assignment_id=assignment_id,
-                                result_item=result_item,
-                                relevant_chunks=grading_result.get("relevant_chunks", []),
-                                rubric_mapping=rubric_mapping
-                            )
-                    except Exception as e:
-                        print(f"Error storing mistake edges (non-critical): {e}", flush=True)
-                        # Continue with displaying feedback even if this fails
-                    
-                    # Return the upload page with the graded results instead of redirecting
-                    # Add a success message with score
-                    if 'flash_success' not in request.session:
-                        request.session['flash_success'] = []
-                    request.session['flash_success'].append(f"Assignment submitted and automatically graded by AI. Your score: {ai_score:.2f}")
-                    
-                    # Debug the final context values before rendering
-                    print("***************************************", flush=True)
-                    print("FINAL CONTEXT VALUES BEFORE RENDERING:", flush=True)
-                    print(f"graded: {context.get('graded')}", flush=True)
-                    print(f"grade: {context.get('grade')}", flush=True)
-                    print(f"feedback length: {len(context.get('feedback', ''))}", flush=True)
-                    print(f"feedback preview: {context.get('feedback', '')[:100]}...", flush=True)
-                    print("***************************************", flush=True)
-                    
-                    return HttpResponse(template.render(context, request))
+        # Add submission to DB
+        err = db_add_submission(user_id, class_code, assignment_id, submission_blob, submission.name)
+        if err:
+            if 'flash_error' not in request.session:
+                request.session['flash_error'] = []
+            request.session['flash_error'].append(f"Could not add submission: {err}")
+            return redirect('/dashboard')
 
-                else:
-                    print("Error in Claude grading:", grading_result["error"], flush=True)
-                    
-                    # Even if there's an error, we still want to provide feedback
-                    # Use the default values that should be in the result
-                    ai_score = grading_result.get("total_score", 70.0)
-                    ai_feedback = grading_result.get("results", [])
-                    
-                    if not ai_feedback:
-                        ai_feedback = [{
-                            "question": "Assignment Review",
-                            "score": ai_score,
-                            "justification": "The grading system encountered an issue. A default score has been assigned."
-                        }]
-                    
-                    # Update submission with fallback feedback
-                    db_put_ai_feedback(user_id, class_code, assignment_id, ai_score, ai_feedback)
-                    
-                    # Get updated submission for display
-                    user_sub = db_get_submission(user_id, class_code, assignment_id)
-                    if user_sub:
-                        full_id = user_sub.get("_id")
-                        numeric_id = full_id.split('/')[1] if '/' in full_id else full_id
-                        
-                        # Prepare context
-                        context = {
-                            "class_code": class_code,
-                            "assignment_id": assignment_id,
-                            "has_previous_submission": True,
-                            "submission_id": numeric_id,
-                            "file_name": user_sub.get("file_name"),
-                            "graded": True,
-                            "grade": ai_score,
-                            "feedback": user_sub.get("feedback")
-                        }
-                        
-                        # Add message
-                        if 'flash_success' not in request.session:
-                            request.session['flash_success'] = []
-                        request.session['flash_success'].append(f"Assignment submitted and graded with a default score of {ai_score:.2f}")
-                        
-                        return HttpResponse(template.render(context, request))
+        # Grading runs in the grading_worker processes; the page polls
+        # grading_status until the feedback is stored.
+        try:
+            job_status = enqueue_grading(user_id, class_code, assignment_id)
+        except Exception as e:
+            print(f"Could not queue grading: {e}", flush=True)
+            if 'flash_error' not in request.session:
+                request.session['flash_error'] = []
+            request.session['flash_error'].append("Submission saved, but AI grading could not be queued. Your instructor will grade it.")
+            return redirect('/dashboard')
 
-            except Exception as e:
-                print(f"API Error: {str(e)}", flush=True)
-                
-                # Create a default AI feedback response for the student
-                ai_score = 70.0  # Default passing grade
-                ai_feedback = [{
-                    "question": "Assignment Submission",
-                    "score": 70.0,
-                    "justification": "There was an issue with the AI grading system. A default score has been assigned. Your instructor will review this submission."
-                }]
-                
-                # Update the submission with default feedback
-                db_put_ai_feedback(user_id, class_code, assignment_id, ai_score, ai_feedback)
-                
-                # Get the submission for display
-                user_sub = db_get_submission(user_id, class_code, assignment_id)
-                if user_sub:
-                    full_id = user_sub.get("_id")
-                    numeric_id = full_id.split('/')[1] if '/' in full_id else full_id
-                    
-                    # Prepare context for template
-                    context = {
-                        "class_code": class_code,
-                        "assignment_id": assignment_id,
-                        "has_previous_submission": True,
-                        "submission_id": numeric_id,
-                        "file_name": user_sub.get("file_name"),
-                        "graded": True,
-                        "grade": ai_score,
-                        "feedback": "There was an issue with the AI grading system. A default score has been assigned. Your instructor will review this submission."
-                    }
-                    
-                    # Add message and render the template
-                    if 'flash_success' not in request.session:
-                        request.session['flash_success'] = []
-                    request.session['flash_success'].append(f"Assignment submitted! Your score: {ai_score:.2f} (default score due to grading issue)")
-                    
-                    return HttpResponse(loader.get_template("aniTA_app/upload.html").render(context, request))
+        user_sub = db_get_submission(user_id, class_code, assignment_id)
+        if user_sub:
+            full_id = user_sub.get("_id")
+            context["submission_id"] = full_id.split('/')[1] if '/' in full_id else full_id
+            context["file_name"] = user_sub.get("file_name")
+            context["graded"] = user_sub.get("graded")
+            context["grade"] = user_sub.get("grade")
+            context["feedback"] = user_sub.get("feedback")
+        context["grading_pending"] = job_status in (QUEUED, RUNNING)
 
-        # If we get here, something went wrong, but we still want to provide feedback
         if 'flash_success' not in request.session:
             request.session['flash_success'] = []
-        request.session['flash_success'].append("Submitted assignment successfully.")
-        return redirect('/dashboard')
+        if context["grading_pending"]:
+            request.session['flash_success'].append("Assignment submitted. AI feedback will appear here shortly.")
+        elif context.get("grade") is not None:
+            request.session['flash_success'].append(f"Assignment submitted and automatically graded by AI. Your score: {context['grade']:.2f}")
+        else:
+            request.session['flash_success'].append("Submitted assignment successfully.")
+        return HttpResponse(template.render(context, request))
 
     elif request.method == "GET":
         template = loader.get_template("aniTA_app/upload.html")
@@ -793,6 +626,9 @@ def upload(request, class_code, assignment_id):
             context["graded"] = previous_submission.get("graded")
             context["grade"] = previous_submission.get("grade")
             context["feedback"] = previous_submission.get("feedback")
+            if not previous_submission.get("graded"):
+                job = get_grading_queue().latest_for(submission_ref(user_id, class_code, assignment_id))
+                context["grading_pending"] = bool(job) and job["status"] in (QUEUED, RUNNING)
 
         return HttpResponse(template.render(context, request))
 
@@ -800,7 +636,122 @@ def upload(request, class_code, assignment_id):
         return redirect('/')
 
 
+def enqueue_grading(user_id, class_code, assignment_id):
+    """
+    Queue AI grading of a submission, or grade it inline when
+    GRADING_QUEUE["EAGER"] is set (development without a worker).
+
+    Returns the job's status.
+    """
+    queue = get_grading_queue()
+    ref = submission_ref(user_id, class_code, assignment_id)
+    job_id = queue.enqueue(ref, {
+        "user_id": user_id,
+        "class_code": class_code,
+        "assignment_id": assignment_id
+    })
+    if getattr(settings, 'GRADING_QUEUE', {}).get('EAGER'):
+        # Only this submission's job, never whichever is oldest
+        worker_id = f"eager:{os.getpid()}:{threading.get_ident()}"
+        job = queue.claim(worker_id, ref=ref)
+        if job:
+            try:
+                with queue.heartbeating(job["id"], worker_id):
+                    result = run_grading_job(job)
+                queue.complete(job["id"], worker_id, result)
+            except Exception as e:
+                print(f"API Error: {str(e)}", flush=True)
+                status = queue.fail(job["id"], worker_id, e)
+                # A re-queued job is retried later; default feedback only
+                # once it is out of attempts
+                if status == FAILED:
+                    apply_default_feedback(user_id, class_code, assignment_id)
+                return status
+    return queue.get(job_id)["status"]
+
+
+def grading_status(request, class_code, assignment_id):
+    """JSON status of the latest grading job of the signed-in student's submission."""
+    user_id = request.session.get('user_id')
+    if not user_id:
+        return JsonResponse({"error": "Not signed in"}, status=403)
+
+    job = get_grading_queue().latest_for(submission_ref(user_id, class_code, assignment_id))
+    if not job:
+        return JsonResponse({"status": None})
+
+    response = {"status": job["status"], "attempts": job["attempts"]}
+    if job["status"] == DONE and job["result"]:
+        response["score"] = job["result"].get("score")
+    elif job["status"] == QUEUED and job["error"]:
+        response["retrying"] = True
+    return JsonResponse(response)
+
+
+def _sse(event, data, event_id=None):
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def grading_stream(request, class_code, assignment_id):
+    """
+    Server-sent events for the signed-in student's queued grading job.
+
+    Only relays what the grading worker records in the job's event log (see
+    GradingQueue.events): "status" when the job starts, is retried or
+    fails, "question" as each question's feedback is graded and "done" once
+    the feedback is stored. Nothing is graded in this request. Each
+    connection ends after STREAM_SECONDS; the browser reconnects with
+    Last-Event-ID and the stream resumes after the last event it saw.
+    """
+    user_id = request.session.get('user_id')
+    if not user_id:
+        return JsonResponse({"error": "Not signed in"}, status=403)
+
+    config = getattr(settings, 'GRADING_QUEUE', {})
+    queue = get_grading_queue()
+    ref = submission_ref(user_id, class_code, assignment_id)
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_event_id = 0
+
+    def events():
+        after = last_event_id
+        deadline = time.monotonic() + config.get('STREAM_SECONDS', 60)
+        while True:
+            # Status before events, so a job finishing in between still
+            # has its last events sent on the next pass
+            job = queue.latest_for(ref)
+            if job is None:
+                yield _sse("status", {"status": None})
+                return
+            for event in queue.events(job["id"], after=after):
+                after = event["id"]
+                data = event["data"]
+                if event["event"] == "done":
+                    data = {"score": data.get("score")}
+                yield _sse(event["event"], data, event_id=event["id"])
+            if job["status"] in (DONE, FAILED):
+                return
+            if time.monotonic() > deadline:
+                return
+            time.sleep(config.get('STREAM_POLL_SECONDS', 0.5))
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Let nginx pass events through unbuffered
+    return response
+
+
 def view_pdf(request, submission_id):
+    # Answer revalidation from the cached file reference without a DB read
+    cached_ref = get_cached_file_ref("submission", submission_id)
+    if cached_ref:
+        not_modified = not_modified_response(request, cached_ref)
+        if not_modified:
+            return not_modified
+
     try:
         # Get submission from DB
         submission = db_get_submission_by_numeric_id(submission_id)
@@ -828,7 +779,7 @@ def view_pdf(request, submission_id):
             return HttpResponse(html_content, content_type='text/html')
         
         # If we have a submission but no file content
-        if not submission.get("file_content"):
+        if not (submission.get("file_blob") or submission.get("file_content")):
             file_name = submission.get("file_name", "submission")
             html_content = f"""
             <html>
@@ -852,18 +803,14 @@ def view_pdf(request, submission_id):
             """
             return HttpResponse(html_content, content_type='text/html')
 
-        # Try to decode the PDF data
+        # Stream the PDF, honouring conditional and range requests
         try:
-            pdf_data = base64.b64decode(submission.get("file_content"))
-            if not pdf_data:
+            file_ref, legacy_bytes = document_file_ref(submission, submission.get("submission_date"))
+            if not file_ref:
                 raise ValueError("No PDF data")
-                
-            # Return the PDF with proper content type
-            response = HttpResponse(pdf_data, content_type='application/pdf')
-            response['X-Frame-Options'] = 'SAMEORIGIN'
-            response['Content-Disposition'] = 'inline; filename="document.pdf"'
-            return response
-        except (TypeError, ValueError, base64.Error) as e:
+            cache_file_ref("submission", submission_id, file_ref)
+            return file_ref_response(request, file_ref, legacy_bytes)
+        except (TypeError, ValueError, BlobNotFound) as e:
             # If PDF decoding fails, return an HTML page
             file_name = submission.get("file_name", "submission")
             html_content = f"""
@@ -911,10 +858,16 @@ def view_pdf(request, submission_id):
         return HttpResponse(html_content, content_type='text/html')
 
 def view_assignment_instructions(request, assignment_id):
-    print("assignment_id:", assignment_id, flush=True)
+    # Instructions never change once an assignment is created
+    cached_ref = get_cached_file_ref("instructions", assignment_id)
+    if cached_ref:
+        not_modified = not_modified_response(request, cached_ref)
+        if not_modified:
+            return not_modified
+
     try:
-        file_content = db_get_assignment_instructions_file_content(assignment_id)
-        if not file_content:
+        assignment = db_get_assignment_instructions(assignment_id)
+        if not assignment or not (assignment.get("file_blob") or assignment.get("file_content")):
             # If no file content, return a readable error page instead of PDF
             html_content = f"""
             <html>
@@ -939,13 +892,12 @@ def view_assignment_instructions(request, assignment_id):
             
         # If we have file content, try to show the PDF
         try:
-            pdf_data = base64.b64decode(file_content)
-            # Return the PDF with proper content type
-            response = HttpResponse(pdf_data, content_type='application/pdf')
-            response['X-Frame-Options'] = 'SAMEORIGIN'
-            response['Content-Disposition'] = 'inline; filename="document.pdf"'
-            return response
-        except (TypeError, base64.Error):
+            file_ref, legacy_bytes = document_file_ref(assignment, assignment.get("created_at"))
+            if not file_ref:
+                raise ValueError("No PDF data")
+            cache_file_ref("instructions", assignment_id, file_ref)
+            return file_ref_response(request, file_ref, legacy_bytes)
+        except (TypeError, ValueError, BlobNotFound):
             # If PDF decoding fails, show a message
             html_content = f"""
             <html>
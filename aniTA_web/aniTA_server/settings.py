@@ -52,6 +52,115 @@ ARANGO_DB = {
     'DATABASE': os.getenv("ARANGO_DB_NAME", "aita_db")
 }
 
+# Listing queries log a warning when a returned document exceeds this size
+ARANGO_DOCUMENT_SIZE_WARN_BYTES = int(os.getenv("ARANGO_DOCUMENT_SIZE_WARN_BYTES", str(64 * 1024)))
+
+# File storage for PDFs. Documents keep only a sha256 blob reference.
+# BACKEND is "local" (content-addressed files under ROOT) or "s3" (needs boto3).
+BLOB_STORE = {
+    'BACKEND': os.getenv("BLOB_STORE_BACKEND", "local"),
+    'ROOT': os.getenv("BLOB_STORE_ROOT", str(BASE_DIR / "blob_data")),
+    'BUCKET': os.getenv("BLOB_STORE_BUCKET", ""),
+    'PREFIX': os.getenv("BLOB_STORE_PREFIX", "blobs"),
+}
+
+# Seconds a PDF's ETag/size stays cached so revalidation skips ArangoDB
+PDF_REF_CACHE_TIMEOUT = int(os.getenv("PDF_REF_CACHE_TIMEOUT", "300"))
+
+# Per-assignment section indexes used to map chunks to sections; each lookup
+# checks a sections stamp in ArangoDB, so no expiry is needed
+SECTION_INDEX_CACHE_SIZE = int(os.getenv("SECTION_INDEX_CACHE_SIZE", "64"))
+
+# Memory-mapped embedding matrices shared by the workers of one host.
+# CACHE_SIZE is the number of assignments each process keeps open.
+VECTOR_INDEX = {
+    'DIR': os.getenv("VECTOR_INDEX_DIR", str(BASE_DIR / "vector_index")),
+    'CACHE_SIZE': int(os.getenv("VECTOR_INDEX_CACHE_SIZE", "32")),
+}
+
+# PDF text extraction. With STORE, text is kept in the pdf_texts collection
+# under the PDF's sha256, shared by every host; CACHE_DIR optionally caches it
+# locally as well (empty disables it, and nothing evicts it). PDFs with at
+# least PARALLEL_MIN_PAGES pages are split across PROCESSES worker processes.
+# BACKEND "auto" tries pypdf first and falls back to pdfplumber per page (or
+# for the whole file if pypdf cannot open it); "pdfplumber" always uses pdfplumber.
+PDF_TEXT = {
+    'STORE': os.getenv("PDF_TEXT_STORE", "true").lower() == "true",
+    'CACHE_DIR': os.getenv("PDF_TEXT_CACHE_DIR", ""),
+    'PROCESSES': int(os.getenv("PDF_TEXT_PROCESSES", "1")),
+    'PARALLEL_MIN_PAGES': int(os.getenv("PDF_TEXT_PARALLEL_MIN_PAGES", "16")),
+    'BACKEND': os.getenv("PDF_TEXT_BACKEND", "auto"),
+}
+
+# Sentence embedding model shared by the whole process. WARM_UP loads it
+# when Django starts instead of on the first request that needs it.
+EMBEDDING_SERVICE = {
+    'MODEL': os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    'BATCH_SIZE': int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+    'NUM_THREADS': int(os.getenv("EMBEDDING_NUM_THREADS", "0")) or None,
+    'WARM_UP': os.getenv("EMBEDDING_WARM_UP", "false").lower() == "true",
+    # Persistent vector cache keyed by model + text hash (empty disables it)
+    'CACHE_PATH': os.getenv("EMBEDDING_CACHE_PATH", str(BASE_DIR / "embedding_cache" / "embeddings.sqlite3")),
+    'CACHE_MAX_BYTES': int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+}
+
+# Durable local queue for AI grading jobs, processed by `manage.py grading_worker`.
+# EAGER grades inside the upload request instead (development without a worker).
+# The upload page's event stream relays worker progress for up to STREAM_SECONDS
+# per connection, checking every STREAM_POLL_SECONDS, and the browser reconnects.
+# Running jobs heartbeat three times per STALE_AFTER; one that misses it is retried
+# (or failed after MAX_ATTEMPTS) by the next worker.
+GRADING_QUEUE = {
+    'PATH': os.getenv("GRADING_QUEUE_PATH", str(BASE_DIR / "grading_queue" / "jobs.sqlite3")),
+    'MAX_ATTEMPTS': int(os.getenv("GRADING_MAX_ATTEMPTS", "3")),
+    'BACKOFF_SECONDS': int(os.getenv("GRADING_BACKOFF_SECONDS", "30")),
+    'STALE_AFTER': int(os.getenv("GRADING_STALE_AFTER", "900")),
+    'EAGER': os.getenv("GRADING_EAGER", "false").lower() == "true",
+    'STREAM_SECONDS': int(os.getenv("GRADING_STREAM_SECONDS", "60")),
+    'STREAM_POLL_SECONDS': float(os.getenv("GRADING_STREAM_POLL_SECONDS", "0.5")),
+}
+
+# Reuse of Claude grading results for identical answers (same rubric and
+# questions). NEAR_DUPLICATE_THRESHOLD (e.g. 0.9) also reuses results for
+# answers whose estimated Jaccard similarity reaches it; None disables that.
+GRADING_CACHE = {
+    'ENABLED': os.getenv("GRADING_CACHE_ENABLED", "true").lower() == "true",
+    'NEAR_DUPLICATE_THRESHOLD': float(os.environ["GRADING_CACHE_NEAR_DUPLICATE_THRESHOLD"])
+        if os.getenv("GRADING_CACHE_NEAR_DUPLICATE_THRESHOLD") else None,
+}
+
+# Claude grading. PER_QUESTION grades each extracted question as its own
+# concurrent request, retrying only the questions that fail.
+CLAUDE_GRADING = {
+    'PER_QUESTION': os.getenv("GRADING_PER_QUESTION", "false").lower() == "true",
+    'PER_QUESTION_CONCURRENCY': int(os.getenv("GRADING_PER_QUESTION_CONCURRENCY", "4")),
+    'QUESTION_RETRIES': int(os.getenv("GRADING_QUESTION_RETRIES", "2")),
+    # Course material included in the cached static prompt prefix
+    'STATIC_MATERIAL_CHARS': int(os.getenv("GRADING_STATIC_MATERIAL_CHARS", "20000")),
+}
+
+# Mistake similarity graph used for clustering. METHOD is "stored" (edges kept
+# up to date in the similar_mistake collection as mistakes are graded; see
+# the rebuild_mistake_graph command), "index" (inverted index over criteria)
+# or "bitset" (vectorised all-pairs Jaccard over packed criteria), the last
+# two recomputing the graph on every request. MAX_POSTINGS makes "index" skip
+# rubric criteria shared by more mistakes than this (faster, but no longer
+# exact); 0 keeps every criterion.
+MISTAKE_GRAPH = {
+    'METHOD': os.getenv("MISTAKE_GRAPH_METHOD", "stored"),
+    'MAX_POSTINGS': int(os.getenv("MISTAKE_GRAPH_MAX_POSTINGS", "0")) or None,
+}
+
+# Louvain clusters and PageRank over the mistake graph, materialised by the
+# materialize_mistake_clusters command. With SERVE_SNAPSHOTS, cluster views
+# read the latest snapshot instead of recomputing; only the KEEP_SNAPSHOTS
+# most recent snapshots are kept.
+MISTAKE_CLUSTERS = {
+    'SERVE_SNAPSHOTS': os.getenv("MISTAKE_CLUSTERS_SERVE_SNAPSHOTS", "true").lower() == "true",
+    'KEEP_SNAPSHOTS': int(os.getenv("MISTAKE_CLUSTERS_KEEP_SNAPSHOTS", "5")),
+    'REFRESH_INTERVAL': int(os.getenv("MISTAKE_CLUSTERS_REFRESH_INTERVAL", "300")),
+}
+
 # Claude API settings
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 
@@ -63,6 +172,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'users.identity_map.IdentityMapMiddleware',
 ]
 
 ROOT_URLCONF = 'aniTA_server.urls'
@@ -12,13 +12,14 @@ from users.arangodb import db
 collections = [
     'users', 'sections', 'mistakes', 'relevant_chunks', 'submission', 
     'courses', 'course_materials', 'rubrics', 'material_vectors', 
-    'material_questions', 'NetworkData'
+    'material_questions', 'NetworkData', 'graph_versions', 'mistake_cluster_snapshots',
+    'pdf_texts'
 ]
 
 # Edge collections to clear
 edge_collections = [
     'has_feedback_on', 'affects_criteria', 'made_mistake', 'related_to',
-    'has_rubric', 'has_material', 'has_question'
+    'has_rubric', 'has_material', 'has_question', 'similar_mistake'
 ]
 
 # Clear all collections
@@ -11,7 +11,9 @@ import random
 import re
 from datetime import datetime
 from users.arangodb import db
+from .pagerank import SparseGraph, pagerank_dict
 from aniTA_app.claude_service import get_claude_response
+from aniTA_app.services.embedding_service import get_embedding_service
 
 # Sample rubric structure for simulated assignments
 SAMPLE_RUBRICS = {
@@ -517,23 +519,22 @@ def store_source_material(source_material):
         
         section_id = sections_collection.insert(section_data)["_id"]
         section_ids[section_name] = section_id
+    
+    # Create vector embeddings for the section contents for better search,
+    # encoded in one batch
+    try:
+        contents = [content for content in source_material["sections"].values()]
+        vectors = get_embedding_service().embed_many([content[:1000] for content in contents])  # Use first 1000 chars
         
-        # Create vector embeddings for the section content for better search
-        try:
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer('all-MiniLM-L6-v2')
-            vector = model.encode(content[:1000]).tolist()  # Use first 1000 chars
-            
-            # Store vector in a separate collection
-            material_vectors = db.collection('material_vectors')
-            material_vectors.insert({
-                "section_id": section_id,
-                "vector": vector,
-                "content_preview": content[:200],
-                "created_at": datetime.utcnow().isoformat()
-            })
-        except Exception as e:
-            print(f"Error creating vector embedding: {e}")
+        # Store vectors in a separate collection
+        db.collection('material_vectors').insert_many([{
+            "section_id": section_ids[section_name],
+            "vector": vector,
+            "content_preview": content[:200],
+            "created_at": datetime.utcnow().isoformat()
+        } for section_name, content, vector in zip(source_material["sections"].keys(), contents, vectors)])
+    except Exception as e:
+        print(f"Error creating vector embedding: {e}")
     
     return {
         "material_id": material_id,
@@ -759,9 +760,7 @@ def process_student_submission(student_id, course_id, assignment_id, submission_
         if not matching_sections:
             try:
                 # Get the vector for the mistake
-                from sentence_transformers import SentenceTransformer
-                model = SentenceTransformer('all-MiniLM-L6-v2')
-                mistake_vector = model.encode(mistake_data["mistake"] + " " + mistake_data["correction"]).tolist()
+                mistake_vector = get_embedding_service().embed_one(mistake_data["mistake"] + " " + mistake_data["correction"])
                 
                 # Find similar section vectors
                 material_vectors = db.collection('material_vectors')
@@ -940,57 +939,37 @@ def rank_sections_by_pagerank():
     Returns:
         Dictionary mapping section IDs to their PageRank scores
     """
-    # Query to build a directed graph connecting sections through mistakes
+    # Query to build a directed graph connecting sections through mistakes,
+    # exported as [mistake, section, weight] triples for a sparse matrix
     query = """
-    LET sections = (
+    LET section_ids = (
         FOR s IN sections
         FILTER s.is_simulated == true
-        RETURN s
+        RETURN s._id
     )
     
     LET edges = (
         FOR m IN mistakes
         FILTER m.is_simulated == true
         FOR e1 IN related_to
-            FILTER e1._from == m._id
-            FOR s IN sections
-                FILTER s._id == e1._to
-                RETURN {
-                    source: m._id,
-                    target: s._id,
-                    weight: e1.strength ? e1.strength : 1.0
-                }
+            FILTER e1._from == m._id AND e1._to IN section_ids
+            RETURN [m._id, e1._to, e1.strength ? e1.strength : 1.0]
     )
     
-    RETURN { sections: sections, edges: edges }
+    RETURN { sections: section_ids, edges: edges }
     """
     
     graph_data = list(db.aql.execute(query))[0]
     
-    # Build NetworkX graph
-    import networkx as nx
-    G = nx.DiGraph()
-    
-    # Add all section nodes
-    for section in graph_data["sections"]:
-        G.add_node(section["_id"], title=section["title"], content=section.get("content", ""))
-    
-    # Add edges
-    for edge in graph_data["edges"]:
-        G.add_edge(edge["source"], edge["target"], weight=edge["weight"])
-    
     # Apply PageRank
-    pagerank = nx.pagerank(G, weight='weight')
-    
-    # Update sections with PageRank scores
-    sections_collection = db.collection('sections')
-    for section_id, score in pagerank.items():
-        # Only update sections, not mistakes
-        if section_id.startswith("sections/"):
-            section = sections_collection.get(section_id)
-            if section:
-                section["pagerank_score"] = score
-                sections_collection.update(section)
+    graph = SparseGraph.from_edges(graph_data["edges"], nodes=graph_data["sections"])
+    pagerank = pagerank_dict(graph)
+    
+    # Update sections with PageRank scores, in one batch; only sections, not mistakes
+    updates = [{"_key": node_id.split("/", 1)[1], "pagerank_score": score}
+               for node_id, score in pagerank.items() if node_id.startswith("sections/")]
+    if updates:
+        db.collection('sections').update_many(updates, silent=True)
     
     return pagerank
 
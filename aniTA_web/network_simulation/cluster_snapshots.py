@@ -0,0 +1,122 @@
+"""
+Materialised mistake clusters and PageRank.
+
+Louvain clustering and PageRank over the whole mistake similarity graph
+are too slow to run per request, and Louvain is randomised, so clusters
+used to shift between page loads. Here they are computed by a background
+job (the `materialize_mistake_clusters` management command) and stored as
+numbered snapshots in `mistake_cluster_snapshots`. Each snapshot records
+the similarity graph version it was computed from (see
+users/mistake_similarity.py), so the job only recomputes when the graph has
+changed. A recomputation starts Louvain from the previous snapshot's
+partition and PageRank from its scores, which converges faster and keeps
+cluster labels stable.
+
+Reads go through `latest_snapshot()`: one document lookup for the pointer
+in `graph_versions`, and the snapshot itself comes from a per-process cache
+until a newer one is written.
+"""
+
+import threading
+import time
+from datetime import datetime
+from django.conf import settings
+from users.arangodb import db
+from users.mistake_similarity import VERSIONS_COLLECTION, graph_version
+from .graph_analysis import (build_mistake_similarity_graph, get_louvain_clusters, get_pagerank_scores,
+                             summarize_mistake_clusters)
+
+COLLECTION = 'mistake_cluster_snapshots'
+# Pointer document in graph_versions naming the latest snapshot
+POINTER_KEY = 'mistake_clusters'
+
+_cache_lock = threading.Lock()
+_cached_snapshot = None
+
+
+def _config():
+    return getattr(settings, 'MISTAKE_CLUSTERS', {})
+
+
+def latest_snapshot():
+    """
+    Returns:
+        dict: The latest snapshot (`version`, `graph_version`, `created_at`,
+        `seconds`, `warm_start`, `partition`, `pagerank`, `summary`), or
+        None if none has been materialised yet
+    """
+    global _cached_snapshot
+    pointer = db.collection(VERSIONS_COLLECTION).get(POINTER_KEY)
+    if not pointer:
+        return None
+    with _cache_lock:
+        if _cached_snapshot and _cached_snapshot['version'] == pointer['version']:
+            return _cached_snapshot
+    snapshot = db.collection(COLLECTION).get(str(pointer['version']))
+    if snapshot:
+        with _cache_lock:
+            _cached_snapshot = snapshot
+    return snapshot
+
+
+def _store_snapshot(snapshot, keep):
+    db.collection(COLLECTION).insert(snapshot, overwrite=True)
+    # Move the pointer forward only, in case an older run finishes last
+    db.aql.execute(
+        f"""
+        UPSERT {{_key: @key}}
+            INSERT {{_key: @key, version: @version}}
+            UPDATE {{version: MAX([OLD.version, @version])}}
+            IN {VERSIONS_COLLECTION}
+        """,
+        bind_vars={"key": POINTER_KEY, "version": snapshot['version']}
+    )
+    if keep:
+        db.aql.execute(
+            f"FOR s IN {COLLECTION} FILTER s.version <= @oldest REMOVE s IN {COLLECTION}",
+            bind_vars={"oldest": snapshot['version'] - keep}
+        )
+
+
+def materialize_mistake_clusters(force=False, warm_start=True):
+    """
+    Compute clusters and PageRank and store them as a new snapshot, unless
+    the latest snapshot already describes the current graph.
+
+    Args:
+        force (bool): Recompute even if the graph version is unchanged
+        warm_start (bool): Seed Louvain and PageRank from the latest snapshot
+
+    Returns:
+        tuple: (snapshot, created) where created is False if the latest
+        snapshot was still current
+    """
+    previous = latest_snapshot()
+    # Read before the graph, so changes made while computing leave this
+    # snapshot looking stale rather than current
+    version = graph_version()
+    if previous and previous['graph_version'] == version and not force:
+        return previous, False
+
+    start = time.perf_counter()
+    G = build_mistake_similarity_graph()
+    seed = previous if warm_start and previous else None
+    partition = get_louvain_clusters(G, previous=seed['partition'] if seed else None)
+    pagerank = get_pagerank_scores(G, previous=seed['pagerank'] if seed else None)
+    summary = (summarize_mistake_clusters(G, partition, pagerank) if len(G.nodes)
+               else {'clusters': [], 'stats': {}})
+
+    number = (previous['version'] if previous else 0) + 1
+    snapshot = {
+        "_key": str(number),
+        "version": number,
+        "graph_version": version,
+        "created_at": datetime.utcnow().isoformat(),
+        "seconds": time.perf_counter() - start,
+        "warm_start": seed is not None,
+        "partition": partition,
+        "pagerank": pagerank,
+        "summary": summary,
+    }
+    _store_snapshot(snapshot, _config().get('KEEP_SNAPSHOTS', 5))
+    return snapshot, True
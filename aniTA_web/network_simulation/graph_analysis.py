@@ -7,8 +7,11 @@ using various network analysis algorithms.
 
 import networkx as nx
 import numpy as np
-from users.arangodb import db
-from collections import defaultdict
+from users.arangodb import db, find_projected
+from users.mistake_similarity import SIMILARITY_THRESHOLD, has_similarity_edges, stored_similarity_edges
+from .mistake_matrix import MistakeMatrix
+from .pagerank import SparseGraph, pagerank_dict
+from collections import Counter, defaultdict
 # Handle community detection with fallback
 try:
     import community as community_louvain
@@ -17,60 +20,192 @@ except ImportError:
     community_louvain = None
 import itertools
 import json
+import math
+from django.conf import settings
 
-def build_mistake_similarity_graph():
+# Attributes of a mistake the similarity graph needs
+MISTAKE_GRAPH_FIELDS = ["question", "score_awarded", "rubric_criteria_names"]
+
+
+def similar_mistake_pairs(mistakes, threshold=SIMILARITY_THRESHOLD, max_postings=None):
+    """
+    Find every pair of mistakes whose criteria have Jaccard similarity above
+    `threshold`, without comparing every pair.
+
+    Criteria are ordered from rarest to most common, and only a prefix of
+    each mistake's criteria goes into an inverted index (criterion ->
+    mistakes). A pair with Jaccard >= t always shares a criterion within
+    both prefixes, where the prefix of a set of size n is its first
+    n - ceil(t * n) + 1 criteria. So probing the index with each
+    mistake's prefix yields all qualifying pairs, and common criteria
+    rarely generate candidates.
+
+    Args:
+        mistakes (list): Documents with `_id` and `rubric_criteria_names`
+        max_postings (int): Skip criteria shared by more mistakes than this
+            when generating candidates. Bounds the work for ubiquitous
+            criteria, but pairs linked only through them are then missed;
+            None (the default) keeps the result exact.
+
+    Yields:
+        tuple: (id1, id2, similarity) with id1 the earlier mistake in `mistakes`
+    """
+    criteria_sets = [(m['_id'], set(m.get('rubric_criteria_names') or [])) for m in mistakes]
+
+    frequency = defaultdict(int)
+    for _, criteria in criteria_sets:
+        for criterion in criteria:
+            frequency[criterion] += 1
+    # Rarest first; ties by name so every mistake uses the same order
+    rank = {c: i for i, c in enumerate(sorted(frequency, key=lambda c: (frequency[c], c)))}
+
+    index = defaultdict(list)  # criterion -> positions in criteria_sets
+    for position, (mistake_id, criteria) in enumerate(criteria_sets):
+        if not criteria:
+            continue
+        ordered = sorted(criteria, key=rank.__getitem__)
+        # The epsilon keeps float error (0.3 * 10 > 3) from shortening the prefix
+        prefix = ordered[:len(ordered) - math.ceil(threshold * len(ordered) - 1e-9) + 1]
+        if max_postings is not None:
+            prefix = [c for c in prefix if frequency[c] <= max_postings]
+
+        candidates = set()
+        for criterion in prefix:
+            candidates.update(index[criterion])
+        for other in sorted(candidates):
+            other_id, other_criteria = criteria_sets[other]
+            similarity = len(criteria & other_criteria) / len(criteria | other_criteria)
+            if similarity > threshold:
+                yield other_id, mistake_id, similarity
+
+        for criterion in prefix:
+            index[criterion].append(position)
+
+
+def similar_mistake_pairs_bitset(mistakes, threshold=SIMILARITY_THRESHOLD, block_rows=1024):
+    """
+    Same pairs as similar_mistake_pairs(), scored in bulk with the packed
+    bitset Jaccard kernel of MistakeMatrix. Compares every pair, but
+    vectorised, so it wins when most mistakes share criteria anyway.
+    """
+    return MistakeMatrix.from_mistakes(mistakes).similar_pairs(threshold, block_rows=block_rows)
+
+
+def build_mistake_similarity_graph(mistakes=None, max_postings=None, method=None):
     """
     Build a graph of mistakes where edges represent similarity.
     Uses Jaccard similarity to determine if two mistakes are related.
-    
+
+    Args:
+        mistakes (list, optional): Mistake documents; all stored mistakes by default
+        max_postings (int, optional): See similar_mistake_pairs(); defaults
+            to MISTAKE_GRAPH["MAX_POSTINGS"]
+        method (str, optional): "stored" (the persisted similar_mistake
+            edges), "index" (similar_mistake_pairs) or "bitset"
+            (similar_mistake_pairs_bitset); defaults to MISTAKE_GRAPH["METHOD"]
+
     Returns:
         networkx.Graph: Graph with mistakes as nodes and similarity as edges
     """
+    config = getattr(settings, 'MISTAKE_GRAPH', {})
+    if max_postings is None:
+        max_postings = config.get('MAX_POSTINGS')
+    method = method or config.get('METHOD', 'stored')
     try:
-        # Get all mistakes
-        mistakes = list(db.collection('mistakes').all())
+        if mistakes is None:
+            mistakes = find_projected('mistakes', {}, keep=MISTAKE_GRAPH_FIELDS)
         if not mistakes:
             return nx.Graph()
-            
+
         G = nx.Graph()
-        
+
         # Add nodes
         for mistake in mistakes:
-            G.add_node(mistake['_id'], 
+            G.add_node(mistake['_id'],
                        id=mistake['_id'],
                        label=mistake.get('question', 'Unknown'),
                        score=mistake.get('score_awarded', 0),
                        criteria=mistake.get('rubric_criteria_names', []))
-        
-        # Calculate Jaccard similarity between mistakes
-        for i, m1 in enumerate(mistakes):
-            criteria1 = set(m1.get('rubric_criteria_names', []))
-            if not criteria1:
-                continue
-                
-            for j, m2 in enumerate(mistakes[i+1:], i+1):
-                criteria2 = set(m2.get('rubric_criteria_names', []))
-                if not criteria2:
-                    continue
-                
-                # Calculate Jaccard similarity: |intersection| / |union|
-                similarity = len(criteria1.intersection(criteria2)) / len(criteria1.union(criteria2))
-                
-                # Add edge if similarity is above threshold
-                if similarity > 0.3:  # Threshold can be adjusted
-                    G.add_edge(m1['_id'], m2['_id'], weight=similarity)
-        
+
+        # Until rebuild_mistake_graph has run once there is nothing stored
+        if method == 'stored' and not has_similarity_edges():
+            method = 'index'
+        if method == 'stored':
+            # Only edges between the requested mistakes
+            pairs = ((id1, id2, weight) for id1, id2, weight in stored_similarity_edges()
+                     if id1 in G and id2 in G)
+        elif method == 'bitset':
+            pairs = similar_mistake_pairs_bitset(mistakes)
+        else:
+            pairs = similar_mistake_pairs(mistakes, max_postings=max_postings)
+        G.add_weighted_edges_from(pairs)
         return G
     except Exception as e:
         print(f"Error building similarity graph: {e}")
         return nx.Graph()
 
-def get_louvain_clusters(G=None):
+def _seed_partition(G, previous):
+    """
+    Starting partition for a warm-started Louvain run: known mistakes keep
+    their previous cluster, new ones join the cluster they are most
+    strongly linked to, or a cluster of their own.
+    """
+    seed = {node: previous[node] for node in G if node in previous}
+    next_label = max(seed.values(), default=-1) + 1
+    for node in G:
+        if node in seed:
+            continue
+        weights = defaultdict(float)
+        for neighbour, data in G[node].items():
+            if neighbour in seed:
+                weights[seed[neighbour]] += data.get('weight', 1)
+        if weights:
+            # Ties go to the lower label so the seed is deterministic
+            seed[node] = max(weights, key=lambda label: (weights[label], -label))
+        else:
+            seed[node] = next_label
+            next_label += 1
+    return seed
+
+
+def _stable_labels(partition, previous):
+    """
+    Renumber clusters so each keeps the label most of its members had in
+    `previous`, biggest clusters choosing first; clusters with no match get
+    labels `previous` never used.
+    """
+    sizes = Counter(partition.values())
+    overlap = defaultdict(Counter)
+    for node, cluster in partition.items():
+        if node in previous:
+            overlap[cluster][previous[node]] += 1
+
+    mapping = {}
+    used = set()
+    for cluster in sorted(sizes, key=lambda c: (-sizes[c], c)):
+        for label, _ in overlap[cluster].most_common():
+            if label not in used:
+                mapping[cluster] = label
+                used.add(label)
+                break
+    next_label = max(previous.values(), default=-1) + 1
+    for cluster in sorted(sizes, key=lambda c: (-sizes[c], c)):
+        if cluster not in mapping:
+            mapping[cluster] = next_label
+            next_label += 1
+    return {node: mapping[cluster] for node, cluster in partition.items()}
+
+
+def get_louvain_clusters(G=None, previous=None):
     """
     Use Louvain community detection to cluster mistakes.
     
     Args:
         G (networkx.Graph, optional): Graph to analyze. If None, builds a new one.
+        previous (dict, optional): Earlier partition (mistake id -> cluster)
+            to warm-start from. Louvain starts from it instead of from
+            singletons, and clusters keep their earlier labels where they
+            can, so results stay comparable between runs.
     
     Returns:
         dict: Dictionary of community assignments
@@ -88,18 +223,23 @@ def get_louvain_clusters(G=None):
         for i, component in enumerate(nx.connected_components(G)):
             for node in component:
                 communities[node] = i
-        return communities
-        
-    # Run Louvain algorithm if available
-    partition = community_louvain.best_partition(G)
-    return partition
+    else:
+        # Run Louvain algorithm if available; a fixed seed makes it repeatable
+        seed = _seed_partition(G, previous) if previous else None
+        communities = community_louvain.best_partition(G, partition=seed, random_state=0)
 
-def get_pagerank_scores(G=None):
+    if previous:
+        communities = _stable_labels(communities, previous)
+    return communities
+
+def get_pagerank_scores(G=None, previous=None):
     """
     Calculate PageRank for each mistake to identify the most critical ones.
     
     Args:
         G (networkx.Graph, optional): Graph to analyze. If None, builds a new one.
+        previous (dict, optional): Earlier scores to start the iteration
+            from; close to the answer when the graph changed little
     
     Returns:
         dict: Dictionary of PageRank scores
@@ -111,23 +251,40 @@ def get_pagerank_scores(G=None):
         return {}
         
     # Calculate PageRank
-    pagerank = nx.pagerank(G)
+    pagerank = pagerank_dict(SparseGraph.from_networkx(G), previous=previous)
     return pagerank
 
 def get_mistake_clusters_with_stats():
     """
     Get mistake clusters along with statistics.
+
+    Served from the latest materialised snapshot when there is one (see
+    cluster_snapshots.py), otherwise computed on the spot.
     
     Returns:
         dict: Dictionary with cluster information and statistics
     """
+    if getattr(settings, 'MISTAKE_CLUSTERS', {}).get('SERVE_SNAPSHOTS', True):
+        from .cluster_snapshots import latest_snapshot
+        snapshot = latest_snapshot()
+        if snapshot:
+            return snapshot['summary']
+
     G = build_mistake_similarity_graph()
     if len(G.nodes) == 0:
         return {'clusters': [], 'stats': {}}
-    
-    partition = get_louvain_clusters(G)
-    pagerank = get_pagerank_scores(G)
-    
+    return summarize_mistake_clusters(G, get_louvain_clusters(G), get_pagerank_scores(G))
+
+def summarize_mistake_clusters(G, partition, pagerank):
+    """
+    Args:
+        G (networkx.Graph): Mistake similarity graph
+        partition (dict): Mistake id -> cluster
+        pagerank (dict): Mistake id -> PageRank score
+
+    Returns:
+        dict: Clusters (largest first, nodes by importance) and overall stats
+    """
     # Group mistakes by cluster
     clusters = defaultdict(list)
     for node, cluster_id in partition.items():
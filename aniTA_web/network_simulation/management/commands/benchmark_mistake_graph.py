@@ -0,0 +1,90 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from network_simulation.graph_analysis import (SIMILARITY_THRESHOLD, similar_mistake_pairs,
+                                               similar_mistake_pairs_bitset)
+
+
+def legacy_similar_mistake_pairs(mistakes, threshold=SIMILARITY_THRESHOLD):
+    """The all-pairs comparison similar_mistake_pairs replaced."""
+    for i, m1 in enumerate(mistakes):
+        criteria1 = set(m1.get('rubric_criteria_names', []))
+        if not criteria1:
+            continue
+        for m2 in mistakes[i + 1:]:
+            criteria2 = set(m2.get('rubric_criteria_names', []))
+            if not criteria2:
+                continue
+            similarity = len(criteria1.intersection(criteria2)) / len(criteria1.union(criteria2))
+            if similarity > threshold:
+                yield m1['_id'], m2['_id'], similarity
+
+
+def make_mistakes(rng, n_mistakes, per_assignment, rubric_size, max_criteria):
+    """
+    Mistakes grouped by assignment, each citing criteria from its
+    assignment's rubric. Rubrics draw from a shared pool, so each criterion
+    appears in a couple of assignments, and each rubric has one of three
+    generic criteria ("Clarity", "Units", ...) shared across courses.
+    """
+    n_assignments = max(1, n_mistakes // per_assignment)
+    pool = [f"criterion {i}" for i in range(n_assignments * rubric_size // 2 + rubric_size)]
+    generic = [f"generic criterion {i}" for i in range(3)]
+    rubrics = [sorted(set(rng.sample(pool, rubric_size - 1) + [rng.choice(generic)]))
+               for _ in range(n_assignments)]
+    mistakes = []
+    for i in range(n_mistakes):
+        rubric = rubrics[i % n_assignments]
+        chosen = rng.sample(rubric, min(len(rubric), rng.randint(1, max_criteria)))
+        mistakes.append({"_id": f"mistakes/{i}", "rubric_criteria_names": sorted(chosen)})
+    return mistakes
+
+
+class Command(BaseCommand):
+    help = 'Compare the inverted-index and bitset mistake similarity searches against all-pairs comparison'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mistakes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Numbers of mistakes to benchmark')
+        parser.add_argument('--per-assignment', type=int, default=50,
+                            help='Mistakes per assignment')
+        parser.add_argument('--rubric-size', type=int, default=8,
+                            help='Criteria per assignment rubric')
+        parser.add_argument('--max-criteria', type=int, default=4,
+                            help='Most criteria per mistake')
+        parser.add_argument('--max-postings', type=int, default=None,
+                            help='Also time the search with this postings cutoff')
+        parser.add_argument('--bitset-max', type=int, default=10000,
+                            help='Largest size to run the bitset kernel on')
+        parser.add_argument('--legacy-max', type=int, default=10000,
+                            help='Largest size to run the all-pairs comparison on')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.stdout.write(f"{'mistakes':>9} {'impl':>10} {'seconds':>9} {'edges':>10} {'identical':>10}")
+        for n_mistakes in options['mistakes']:
+            mistakes = make_mistakes(rng, n_mistakes, options['per_assignment'],
+                                     options['rubric_size'], options['max_criteria'])
+            # Edge sets are only kept for comparison; large graphs just count
+            compare = n_mistakes <= options['legacy_max']
+            collect = set if compare else (lambda pairs: sum(1 for _ in pairs))
+
+            def run(label, pairs, reference=None):
+                start = time.perf_counter()
+                edges = collect(pairs)
+                seconds = time.perf_counter() - start
+                identical = str(edges == reference) if compare and reference is not None else ""
+                count = len(edges) if compare else edges
+                self.stdout.write(f"{n_mistakes:>9} {label:>10} {seconds:>9.2f} {count:>10} {identical:>10}")
+                return edges
+
+            edges = run("index", similar_mistake_pairs(mistakes))
+            if n_mistakes <= options['bitset_max']:
+                run("bitset", similar_mistake_pairs_bitset(mistakes), edges)
+            if options['max_postings']:
+                run("capped", similar_mistake_pairs(mistakes, max_postings=options['max_postings']), edges)
+            if compare:
+                run("all-pairs", legacy_similar_mistake_pairs(mistakes), edges)
+            else:
+                self.stdout.write(f"{n_mistakes:>9} {'all-pairs':>10} {'skipped (--legacy-max)':>22}")
@@ -0,0 +1,91 @@
+import random
+import time
+import networkx as nx
+import numpy as np
+from django.core.management.base import BaseCommand
+from network_simulation.pagerank import SparseGraph, pagerank
+
+
+def make_edges(rng, n_nodes, n_edges):
+    """
+    [source, target, weight] triples as an Arango edge export returns them.
+    Targets are skewed (a few sections attract most mistakes), and about a
+    tenth of the nodes have no out-edges. Repeated pairs are dropped, since
+    NetworkX keeps one of them and SparseGraph would add them up.
+    """
+    nodes = [f"mistakes/{i}" for i in range(n_nodes)]
+    sources = rng.integers(0, int(n_nodes * 0.9), n_edges)
+    targets = np.minimum(rng.zipf(1.5, n_edges) - 1, n_nodes - 1)
+    targets = rng.permutation(n_nodes)[targets]
+    weights = rng.random(n_edges) + 0.1
+    unique = dict(zip(zip(sources.tolist(), targets.tolist()), weights.tolist()))
+    return [[nodes[s], nodes[t], w] for (s, t), w in unique.items()]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Compare the sparse PageRank engine against nx.pagerank on synthetic edge exports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edges', type=int, nargs='+', default=[100000, 1000000],
+                            help='Numbers of edges to benchmark')
+        parser.add_argument('--nodes-per-edge', type=float, default=0.1,
+                            help='Nodes as a fraction of edges')
+        parser.add_argument('--personalized', type=int, default=8,
+                            help='Personalisation vectors ranked in the batch comparison')
+        parser.add_argument('--changed', type=float, default=0.01,
+                            help='Fraction of edges added before the warm-start run')
+        parser.add_argument('--tol', type=float, default=1.0e-6,
+                            help='Tolerance for every run (scaled by the number of nodes, as in NetworkX)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def row(self, edges, label, build, rank, iterations="", error=""):
+        self.stdout.write(f"{edges:>9} {label:>22} {build:>8.2f} {rank:>8.2f} {iterations:>6} {error:>10}")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        tol = options['tol']
+        self.stdout.write(f"{'edges':>9} {'run':>22} {'build s':>8} {'rank s':>8} {'iters':>6} {'max diff':>10}")
+        for n_edges in options['edges']:
+            n_nodes = max(2, int(n_edges * options['nodes_per_edge']))
+            edges = make_edges(rng, n_nodes, n_edges)
+
+            G, nx_build = timed(lambda: nx.DiGraph((s, t, {"weight": w}) for s, t, w in edges))
+            expected, nx_rank = timed(nx.pagerank, G, tol=tol, max_iter=1000)
+            self.row(n_edges, "networkx", nx_build, nx_rank)
+
+            graph, build = timed(SparseGraph.from_edges, edges)
+            result, rank = timed(pagerank, graph, tol=tol, max_iter=1000)
+            error = max(abs(expected[node] - score) for node, score in graph.as_dict(result.scores).items())
+            self.row(n_edges, "sparse", build, rank, result.iterations, f"{error:.1e}")
+
+            # Warm start after a small change to the graph
+            extra = make_edges(rng, n_nodes, int(n_edges * options['changed']))
+            changed, build = timed(SparseGraph.from_edges, edges + extra, nodes=graph.nodes)
+            cold, cold_rank = timed(pagerank, changed, tol=tol, max_iter=1000)
+            warm, warm_rank = timed(pagerank, changed, nstart=changed.vector(graph.as_dict(result.scores)),
+                                    tol=tol, max_iter=1000)
+            self.row(n_edges, f"+{len(extra)} edges cold", build, cold_rank, cold.iterations)
+            self.row(n_edges, f"+{len(extra)} edges warm", 0.0, warm_rank, warm.iterations,
+                     f"{np.abs(cold.scores - warm.scores).max():.1e}")
+
+            # Personalised PageRank for several seed sets at once
+            k = options['personalized']
+            seeds = [random.Random(options['seed'] + i).sample(graph.nodes, 10) for i in range(k)]
+            start = time.perf_counter()
+            nx_scores = [nx.pagerank(G, personalization=dict.fromkeys(nodes, 1.0), tol=tol, max_iter=1000)
+                         for nodes in seeds]
+            self.row(n_edges, f"networkx x{k} personal", 0.0, time.perf_counter() - start)
+
+            matrix = np.zeros((len(graph), k))
+            for j, nodes in enumerate(seeds):
+                matrix[[graph.index[node] for node in nodes], j] = 1.0
+            batch, rank = timed(pagerank, graph, personalization=matrix, tol=tol, max_iter=1000)
+            error = max(abs(scores[node] - batch.scores[graph.index[node], j])
+                        for j, scores in enumerate(nx_scores) for node in scores)
+            self.row(n_edges, f"sparse batch of {k}", 0.0, rank, batch.iterations, f"{error:.1e}")
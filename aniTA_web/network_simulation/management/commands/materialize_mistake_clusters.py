@@ -0,0 +1,44 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from network_simulation.cluster_snapshots import materialize_mistake_clusters
+
+
+class Command(BaseCommand):
+    help = 'Compute mistake clusters and PageRank into a snapshot whenever the similarity graph changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, checking the graph version every --interval seconds')
+        parser.add_argument('--interval', type=float,
+                            default=getattr(settings, 'MISTAKE_CLUSTERS', {}).get('REFRESH_INTERVAL', 300),
+                            help='Seconds between checks with --loop')
+        parser.add_argument('--force', action='store_true',
+                            help='Recompute even if the graph has not changed')
+        parser.add_argument('--cold', action='store_true',
+                            help='Do not seed from the previous snapshot')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        while True:
+            try:
+                snapshot, created = materialize_mistake_clusters(force=force, warm_start=not options['cold'])
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                self.stderr.write(f"Materialisation failed: {e}")
+            else:
+                stats = snapshot['summary'].get('stats', {})
+                if created:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Snapshot {snapshot['version']} of graph version {snapshot['graph_version']}: "
+                        f"{stats.get('total_mistakes', 0)} mistakes in {stats.get('total_clusters', 0)} clusters, "
+                        f"{snapshot['seconds']:.1f}s{' (warm start)' if snapshot['warm_start'] else ''}"))
+                else:
+                    self.stdout.write(f"Snapshot {snapshot['version']} is current "
+                                      f"(graph version {snapshot['graph_version']})")
+            if not options['loop']:
+                return
+            # --force applies to the first run only
+            force = False
+            time.sleep(options['interval'])
@@ -0,0 +1,45 @@
+import time
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from network_simulation.graph_analysis import similar_mistake_pairs
+from users.arangodb import find_projected
+from users.mistake_similarity import compare_similarity_edges, replace_similarity_edges
+
+
+class Command(BaseCommand):
+    help = ('Recompute the stored mistake similarity graph from every mistake, or check it for drift '
+            '(--check exits with status 1 on drift, for scheduled reconciliation)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare the stored edges with a fresh computation')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        # Edges of mistakes stored after this are linked by their graders
+        # and survive the rebuild
+        started = datetime.utcnow().isoformat()
+        mistakes = find_projected('mistakes', {}, keep=["rubric_criteria_names"])
+        # Exact search: a capped index would make the check report false drift
+        pairs = similar_mistake_pairs(mistakes)
+
+        if options['check']:
+            drift = compare_similarity_edges(pairs)
+            for label in ('missing', 'extra', 'changed'):
+                keys = drift[label]
+                line = f"  {label}: {len(keys)}"
+                if keys:
+                    line += f" (e.g. {', '.join(keys[:3])})"
+                self.stdout.write(self.style.WARNING(line) if keys else line)
+            if any(drift.values()):
+                raise CommandError("Stored similarity graph has drifted; run without --check to rebuild it")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Stored similarity graph matches {len(mistakes)} mistakes"))
+            return
+
+        counts = replace_similarity_edges(pairs, started=started)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {counts['written']} similarity edges between {len(mistakes)} mistakes "
+            f"(removed {counts['removed']} stale ones) "
+            f"in {time.perf_counter() - start:.1f}s"))
@@ -50,7 +50,8 @@ class Command(BaseCommand):
             collections_to_clear = [
                 'submission', 'mistakes', 'made_mistake', 'affects_criteria', 
                 'related_to', 'has_feedback_on', 'course_materials', 'rubrics',
-                'has_rubric', 'has_material'
+                'has_rubric', 'has_material', 'similar_mistake', 'graph_versions',
+                'mistake_cluster_snapshots'
             ]
             
             for collection_name in collections_to_clear:
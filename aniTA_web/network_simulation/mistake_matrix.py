@@ -0,0 +1,130 @@
+"""
+Compact matrix form of mistakes for similarity analytics.
+
+Mistakes carry `rubric_criteria_names` as lists of free-text strings, and
+comparing them as Python sets re-hashes every string for every pair. Here
+each criterion is interned to an integer id once, and each mistake becomes a
+row of packed bits (criterion id -> bit) in a uint64 NumPy array. The
+Jaccard similarity of two rows is then
+
+    popcount(a & b) / (popcount(a) + popcount(b) - popcount(a & b))
+
+computed for whole blocks of rows at a time. Blocks are bounded by
+`block_rows`, so memory stays flat however many mistakes there are.
+"""
+
+import numpy as np
+
+WORD_BITS = 64
+
+if hasattr(np, "bitwise_count"):
+    _bit_count = np.bitwise_count
+else:
+    # NumPy < 2.0: count bits a byte at a time
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _bit_count(words):
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        return _BYTE_BITS[as_bytes].reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def _popcount(rows):
+    """Set bits in each row of a 2-d uint64 array."""
+    return _bit_count(rows).sum(axis=-1, dtype=np.int64)
+
+
+class MistakeMatrix:
+    """
+    Attributes:
+        mistake_ids (list): `_id` of each row
+        criteria (list): Criterion name of each bit
+        criterion_ids (dict): Criterion name -> bit
+        bits (np.ndarray): uint64 array, one row of packed criteria per mistake
+        sizes (np.ndarray): Number of distinct criteria of each mistake
+    """
+
+    def __init__(self, mistake_ids, criteria, bits):
+        self.mistake_ids = mistake_ids
+        self.criteria = criteria
+        self.criterion_ids = {name: i for i, name in enumerate(criteria)}
+        self.bits = bits
+        self.sizes = _popcount(bits) if len(bits) else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_mistakes(cls, mistakes, criteria=None):
+        """
+        Args:
+            mistakes (list): Documents with `_id` and `rubric_criteria_names`
+            criteria (list, optional): Existing criterion order to extend, so
+                bits stay stable across matrices
+        """
+        criteria = list(criteria or [])
+        criterion_ids = {name: i for i, name in enumerate(criteria)}
+        rows = []
+        for mistake in mistakes:
+            row = []
+            for name in mistake.get('rubric_criteria_names') or []:
+                criterion_id = criterion_ids.get(name)
+                if criterion_id is None:
+                    criterion_id = criterion_ids[name] = len(criteria)
+                    criteria.append(name)
+                row.append(criterion_id)
+            rows.append(row)
+
+        words = max(1, -(-len(criteria) // WORD_BITS))
+        bits = np.zeros((len(rows), words), dtype=np.uint64)
+        for i, row in enumerate(rows):
+            for criterion_id in row:
+                bits[i, criterion_id // WORD_BITS] |= np.uint64(1) << np.uint64(criterion_id % WORD_BITS)
+        return cls([m['_id'] for m in mistakes], criteria, bits)
+
+    def __len__(self):
+        return len(self.mistake_ids)
+
+    def jaccard_block(self, rows_a, rows_b):
+        """
+        Jaccard similarity of every row in rows_a with every row in rows_b.
+
+        Args:
+            rows_a, rows_b: Row indices or slices
+
+        Returns:
+            np.ndarray: float64 matrix of shape (len(rows_a), len(rows_b)),
+            0 where either mistake has no criteria
+        """
+        a = self.bits[rows_a]
+        b = self.bits[rows_b]
+        # uint16 holds any intersection of up to 65535 criteria, and keeps the
+        # accumulator a quarter the size of int64
+        intersection = np.zeros((len(a), len(b)), dtype=np.uint16)
+        # A word at a time keeps temporaries at one block and skips words
+        # no mistake on one side uses
+        for word in np.flatnonzero(a.any(axis=0) & b.any(axis=0)):
+            both = np.bitwise_and.outer(a[:, word], b[:, word])
+            np.add(intersection, _bit_count(both), out=intersection, casting="unsafe")
+        union = self.sizes[rows_a][:, None] + self.sizes[rows_b][None, :] - intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = intersection / union
+        similarity[union == 0] = 0.0
+        return similarity
+
+    def similar_pairs(self, threshold, block_rows=1024):
+        """
+        Yield (id1, id2, similarity) for every pair of rows with Jaccard
+        similarity above `threshold`, id1 being the earlier row.
+
+        Rows are compared block by block, so only a few block_rows^2
+        arrays are held at a time.
+        """
+        # Mistakes without criteria never match anything
+        active = np.flatnonzero(self.sizes > 0)
+        for start_a in range(0, len(active), block_rows):
+            rows_a = active[start_a:start_a + block_rows]
+            for start_b in range(start_a, len(active), block_rows):
+                rows_b = active[start_b:start_b + block_rows]
+                similarity = self.jaccard_block(rows_a, rows_b)
+                if start_a == start_b:
+                    # Each pair once, and not a row with itself
+                    similarity = np.triu(similarity, k=1)
+                for i, j in zip(*np.nonzero(similarity > threshold)):
+                    yield self.mistake_ids[rows_a[i]], self.mistake_ids[rows_b[j]], float(similarity[i, j])
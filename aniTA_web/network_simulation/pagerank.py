@@ -0,0 +1,218 @@
+"""
+PageRank over sparse matrices.
+
+`nx.pagerank` needs the graph as NetworkX dicts first, which for graphs
+exported from ArangoDB means building a dict per node and per edge before
+any ranking starts, and it can only rank one personalisation at a time.
+Here edges go straight from an export into a CSR matrix, and PageRank is a
+power iteration on that matrix:
+
+    x <- alpha * (M^T x + (dangling mass) * d) + (1 - alpha) * p
+
+where M is the row-normalised adjacency matrix, p the personalisation and
+d the distribution for rank leaking out of nodes with no out-edges (p by
+default), matching NetworkX's definition.
+
+Several personalisation vectors are ranked together as the columns of one
+matrix, so each iteration is a single sparse-dense product. Every run
+reports its iterations and L1 residuals, and can start from a previous
+score vector, which converges in a few iterations when the graph changed
+little.
+"""
+
+import logging
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+# Edge export for a whole edge collection, as [from, to, weight] triples
+EDGE_EXPORT_QUERY = """
+FOR e IN @@collection
+    RETURN [e._from, e._to, e.@weight]
+"""
+
+
+class SparseGraph:
+    """
+    Weighted graph as a CSR adjacency matrix.
+
+    Attributes:
+        nodes (list): Node id of each row/column
+        index (dict): Node id -> row/column
+        matrix (scipy.sparse.csr_array): matrix[i, j] = weight of edge i -> j;
+            undirected graphs store both directions
+    """
+
+    def __init__(self, nodes, matrix):
+        self.nodes = nodes
+        self.index = {node: i for i, node in enumerate(nodes)}
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @classmethod
+    def from_edges(cls, edges, nodes=None, directed=True):
+        """
+        Args:
+            edges (iterable): (source, target, weight) triples; a missing
+                weight counts as 1, and repeated edges add up
+            nodes (iterable, optional): Nodes to include even without edges;
+                nodes only named by edges are added after them
+            directed (bool): False stores every edge in both directions
+        """
+        index = {}
+        for node in nodes or []:
+            index.setdefault(node, len(index))
+        sources, targets, weights = [], [], []
+        for source, target, weight in edges:
+            sources.append(index.setdefault(source, len(index)))
+            targets.append(index.setdefault(target, len(index)))
+            weights.append(1.0 if weight is None else weight)
+
+        n = len(index)
+        rows = np.asarray(sources, dtype=np.int64)
+        cols = np.asarray(targets, dtype=np.int64)
+        data = np.asarray(weights, dtype=np.float64)
+        if not directed:
+            # Self-loops once, like NetworkX's Graph.to_directed()
+            off_diagonal = rows != cols
+            rows, cols = np.concatenate([rows, cols[off_diagonal]]), np.concatenate([cols, rows[off_diagonal]])
+            data = np.concatenate([data, data[off_diagonal]])
+        matrix = sp.csr_array((data, (rows, cols)), shape=(n, n))
+        matrix.sum_duplicates()
+        return cls(list(index), matrix)
+
+    @classmethod
+    def from_arango(cls, database, query=EDGE_EXPORT_QUERY, bind_vars=None, nodes=None, directed=True,
+                    batch_size=10000):
+        """
+        Build from an AQL query returning [from, to, weight] triples,
+        streamed in batches; by default EDGE_EXPORT_QUERY, which needs
+        `@collection` and `weight` bind variables.
+        """
+        cursor = database.aql.execute(query, bind_vars=bind_vars or {}, batch_size=batch_size, stream=True)
+        return cls.from_edges(cursor, nodes=nodes, directed=directed)
+
+    @classmethod
+    def from_networkx(cls, G, weight='weight'):
+        return cls.from_edges(G.edges(data=weight, default=1.0), nodes=G.nodes, directed=G.is_directed())
+
+    def vector(self, values, default=0.0):
+        """Dense vector over the nodes from a node -> value dict."""
+        vector = np.full(len(self.nodes), default, dtype=np.float64)
+        for node, value in values.items():
+            i = self.index.get(node)
+            if i is not None:
+                vector[i] = value
+        return vector
+
+    def as_dict(self, vector):
+        return dict(zip(self.nodes, vector.tolist()))
+
+
+class PageRankResult:
+    """
+    Attributes:
+        scores (np.ndarray): One score per node, or one column per
+            personalisation vector when ranked in a batch
+        iterations (int): Power iterations run
+        residuals (list): L1 change of each iteration (the largest over
+            the batch's columns)
+        converged (bool): Whether every column got below the tolerance
+    """
+
+    def __init__(self, scores, iterations, residuals, converged):
+        self.scores = scores
+        self.iterations = iterations
+        self.residuals = residuals
+        self.converged = converged
+
+
+def _normalise_columns(matrix):
+    totals = matrix.sum(axis=0)
+    if np.any(totals <= 0):
+        raise ValueError("Personalisation and start vectors need a positive sum")
+    return matrix / totals
+
+
+def pagerank(graph, alpha=0.85, personalization=None, nstart=None, dangling=None, tol=1.0e-6, max_iter=100):
+    """
+    PageRank of every node of a SparseGraph, as nx.pagerank defines it.
+
+    Args:
+        graph (SparseGraph): Graph to rank
+        alpha (float): Damping factor
+        personalization (np.ndarray, optional): Teleport distribution, a
+            vector over the nodes, or an (n, k) matrix to rank k
+            personalisations at once; uniform by default
+        nstart (np.ndarray, optional): Starting scores with the same shape,
+            e.g. a previous result; uniform by default
+        dangling (np.ndarray, optional): Where rank from nodes without
+            out-edges goes; the personalisation by default
+        tol (float): Stop once the L1 change is below n * tol for every column
+        max_iter (int): Give up after this many iterations
+
+    Returns:
+        PageRankResult: scores are a vector, or an (n, k) matrix for a
+        batch; not converged if max_iter ran out
+    """
+    n = len(graph)
+    batched = personalization is not None and np.ndim(personalization) == 2
+    if n == 0:
+        return PageRankResult(np.zeros((0, np.shape(personalization)[1]) if batched else 0), 0, [], True)
+    columns = np.shape(personalization)[1] if batched else 1
+
+    def as_matrix(vector, default):
+        if vector is None:
+            return np.full((n, columns), default)
+        vector = np.asarray(vector, dtype=np.float64)
+        if vector.ndim == 1:
+            vector = np.repeat(vector[:, None], columns, axis=1)
+        return _normalise_columns(vector)
+
+    p = as_matrix(personalization, 1.0 / n)
+    x = as_matrix(nstart, 1.0 / n)
+    d = p if dangling is None else as_matrix(dangling, 1.0 / n)
+
+    # Transpose of the row-normalised adjacency, so x <- M^T x is one
+    # sparse product per iteration
+    out_weight = np.asarray(graph.matrix.sum(axis=1)).ravel()
+    is_dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~is_dangling)
+    transition = (sp.diags_array(inverse) @ graph.matrix).T.tocsr()
+
+    residuals = []
+    converged = False
+    for _ in range(max_iter):
+        previous = x
+        dangling_mass = previous[is_dangling].sum(axis=0)
+        x = alpha * (transition @ previous + d * dangling_mass) + (1 - alpha) * p
+        residual = np.abs(x - previous).sum(axis=0)
+        residuals.append(float(residual.max()))
+        if np.all(residual < n * tol):
+            converged = True
+            break
+
+    if not converged:
+        logger.warning(f"PageRank did not converge in {max_iter} iterations (residual {residuals[-1]:.3g})")
+    return PageRankResult(x if batched else x[:, 0], len(residuals), residuals, converged)
+
+
+def pagerank_dict(graph, previous=None, personalization=None, **kwargs):
+    """
+    pagerank() with node -> value dicts in and out, as nx.pagerank takes
+    and returns them.
+
+    Args:
+        previous (dict, optional): Earlier scores to warm-start from; nodes
+            missing from it start at 0
+        personalization (dict, optional): Node -> teleport weight
+    """
+    nstart = graph.vector(previous) if previous else None
+    if nstart is not None and nstart.sum() <= 0:
+        nstart = None
+    p = graph.vector(personalization) if personalization else None
+    result = pagerank(graph, nstart=nstart, personalization=p, **kwargs)
+    return graph.as_dict(result.scores)
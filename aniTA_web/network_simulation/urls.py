@@ -24,6 +24,7 @@ urlpatterns = [
     path('api/student-instructor-network/', views_visualization.api_student_instructor_network, name='api_student_instructor_network'),
     path('api/student-performance/', views_visualization.api_student_performance, name='api_student_performance'),
     path('api/section/<str:section_id>/', views_visualization.api_section_detail, name='api_section_detail'),
+    path('api/mistake-clusters/', views_visualization.api_mistake_clusters, name='api_mistake_clusters'),
     
     # Source material and section views
     path('source-materials/', views.source_materials_list, name='source_materials_list'),
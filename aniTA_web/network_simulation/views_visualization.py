@@ -646,4 +646,24 @@ def api_student_performance(request):
                 'data': [78.5, 81.2, 83.7, 79.8, 85.6, 87.3]
             }
         }
-        return JsonResponse(mock_data)
\ No newline at end of file
+        return JsonResponse(mock_data)
+
+
+def api_mistake_clusters(request):
+    """API endpoint for mistake clusters, served from the latest materialised snapshot"""
+    try:
+        from .cluster_snapshots import latest_snapshot
+        snapshot = latest_snapshot()
+        if snapshot is None:
+            return JsonResponse({'error': 'No cluster snapshot yet; run materialize_mistake_clusters'}, status=503)
+        return JsonResponse({
+            'snapshot': {
+                'version': snapshot['version'],
+                'graph_version': snapshot['graph_version'],
+                'created_at': snapshot['created_at']
+            },
+            **snapshot['summary']
+        })
+    except Exception as e:
+        logging.error(f"Error in api_mistake_clusters: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,294 @@
+"""
+Secondary index catalogue for the ArangoDB collections used by the app.
+
+Collections are created at import time in `users/arangodb.py`, but without
+secondary indexes every `find()` on `submission`, `users` or `courses` (and
+every `FILTER` in the analytics AQL) is a full collection scan. This module
+declares the indexes each collection needs, applies them idempotently, and
+can `EXPLAIN` the registered hot-path queries to report which ones still
+enumerate a whole collection.
+"""
+
+import re
+from .arangodb import db, STUDENT_OVERVIEW_QUERY
+from .mistake_similarity import CANDIDATES_QUERY
+
+# Persistent indexes keyed by collection. Each entry is passed straight to
+# ArangoDB, so `fields` order matters: equality filters on a prefix of the
+# fields can use the index.
+INDEX_CATALOGUE = {
+    "submission": [
+        {"fields": ["user_id", "class_code", "assignment_id"]},
+        {"fields": ["class_code", "assignment_id"]},
+    ],
+    "users": [
+        {"fields": ["email"]},
+        {"fields": ["role"]},
+        {"fields": ["is_simulated"], "sparse": True},
+    ],
+    "courses": [
+        {"fields": ["class_code"]},
+        {"fields": ["instructor_id"]},
+    ],
+    "sections": [
+        {"fields": ["assignment_id"]},
+        {"fields": ["material_id"], "sparse": True},
+    ],
+    "material_vectors": [
+        {"fields": ["class_code", "assignment_id"]},
+    ],
+    "course_materials": [
+        {"fields": ["class_code", "assignment_id"]},
+    ],
+    "rubrics": [
+        {"fields": ["class_code", "assignment_id"]},
+        {"fields": ["assignment_id"]},
+    ],
+    "material_questions": [
+        {"fields": ["class_code", "assignment_id"]},
+    ],
+    # Candidate lookup when linking a new mistake into the similarity graph
+    "mistakes": [
+        {"fields": ["rubric_criteria_names[*]"]},
+    ],
+    # Pruning old snapshots; reads go by key
+    "mistake_cluster_snapshots": [
+        {"fields": ["version"]},
+    ],
+    # Exact hits use the document key; the array index serves MinHash
+    # band lookups of the near-duplicate tier.
+    "grading_cache": [
+        {"fields": ["bands[*]"], "sparse": True},
+    ],
+}
+
+# Edge collections get a unique index on their endpoints so the same
+# relationship cannot be stored twice. `affects_criteria` stores one edge per
+# criterion of a rubric document, so the criterion name is part of its key.
+EDGE_UNIQUE_FIELDS = {
+    "has_feedback_on": ["_from", "_to"],
+    "made_mistake": ["_from", "_to"],
+    "related_to": ["_from", "_to"],
+    "affects_criteria": ["_from", "_to", "criterion_name"],
+    "has_rubric": ["_from", "_to"],
+    "has_material": ["_from", "_to"],
+    "has_question": ["_from", "_to"],
+    "similar_mistake": ["_from", "_to"],
+}
+
+# Hot-path queries, written with bind variables so they can be explained.
+# Add new entries here when a view starts issuing a new kind of query.
+REGISTERED_QUERIES = {
+    "submission_by_student_assignment": (
+        """
+        FOR s IN submission
+            FILTER s.user_id == @user_id AND s.class_code == @class_code
+                AND s.assignment_id == @assignment_id
+            RETURN s._id
+        """,
+        {"user_id": "users/0", "class_code": "", "assignment_id": ""},
+    ),
+    "submissions_by_assignment": (
+        """
+        FOR s IN submission
+            FILTER s.class_code == @class_code AND s.assignment_id == @assignment_id
+            RETURN s._id
+        """,
+        {"class_code": "", "assignment_id": ""},
+    ),
+    "submission_count_by_class": (
+        """
+        FOR submission IN submission
+            FILTER submission.class_code == @class_code
+            COLLECT WITH COUNT INTO count
+            RETURN count
+        """,
+        {"class_code": ""},
+    ),
+    "user_by_email": (
+        """
+        FOR u IN users
+            FILTER u.email == @email
+            RETURN u._id
+        """,
+        {"email": ""},
+    ),
+    "course_by_class_code": (
+        """
+        FOR c IN courses
+            FILTER c.class_code == @class_code
+            RETURN c._id
+        """,
+        {"class_code": ""},
+    ),
+    "courses_by_instructor": (
+        """
+        FOR course IN courses
+            FILTER course.instructor_id == @instructor_id
+            RETURN course.class_code
+        """,
+        {"instructor_id": ""},
+    ),
+    "sections_by_assignment": (
+        """
+        FOR s IN sections
+            FILTER s.assignment_id == @assignment_id
+            RETURN s._id
+        """,
+        {"assignment_id": ""},
+    ),
+    "sections_stamp": (
+        """
+        FOR s IN sections
+            FILTER s.assignment_id == @assignment_id
+            COLLECT AGGREGATE count = COUNT(1), latest = MAX(s.created_at)
+            RETURN [count, latest]
+        """,
+        {"assignment_id": ""},
+    ),
+    "vectors_by_assignment": (
+        """
+        FOR v IN material_vectors
+            FILTER v.class_code == @class_code AND v.assignment_id == @assignment_id
+            RETURN v._id
+        """,
+        {"class_code": "", "assignment_id": ""},
+    ),
+    "student_overview": (
+        STUDENT_OVERVIEW_QUERY,
+        {"user_id": "users/0", "class_code": None},
+    ),
+    "mistakes_by_student": (
+        """
+        FOR edge IN made_mistake
+            FILTER edge._from == @student_id
+            RETURN edge._to
+        """,
+        {"student_id": "users/0"},
+    ),
+    "feedback_by_submission": (
+        """
+        FOR edge IN has_feedback_on
+            FILTER edge._from == @submission_id
+            RETURN edge._to
+        """,
+        {"submission_id": "submission/0"},
+    ),
+    "similar_mistake_candidates": (
+        CANDIDATES_QUERY,
+        {"criteria": [""]},
+    ),
+}
+
+
+def _index_matches(existing, fields, unique, sparse):
+    return (existing.get("type") == "persistent"
+            and list(existing.get("fields", [])) == list(fields)
+            and bool(existing.get("unique", False)) == bool(unique)
+            and bool(existing.get("sparse", False)) == bool(sparse))
+
+
+def _ensure_index(collection_name, fields, unique=False, sparse=False):
+    """
+    Create a persistent index on a collection unless an equivalent exists.
+
+    Returns:
+    - One of "exists", "created" or "error: <message>"
+    """
+    if not db.has_collection(collection_name):
+        return "error: collection does not exist"
+
+    collection = db.collection(collection_name)
+    try:
+        for existing in collection.indexes():
+            if _index_matches(existing, fields, unique, sparse):
+                return "exists"
+
+        collection.add_persistent_index(
+            fields=fields,
+            unique=unique,
+            sparse=sparse,
+            # Index names only allow letters, digits, "_" and "-"; a sparse
+            # index must not collide with a dense one on the same fields
+            name=f"idx_{collection_name}_{'_'.join(re.sub(r'[^A-Za-z0-9]', '', f) for f in fields)}"
+                 f"{'_sparse' if sparse else ''}"
+        )
+        return "created"
+    except Exception as e:
+        # Typically a unique constraint violated by existing duplicate edges.
+        return f"error: {str(e)}"
+
+
+def ensure_indexes(dry_run=False):
+    """
+    Apply the whole index catalogue.
+
+    Parameters:
+    - dry_run: Only report what would be created
+
+    Returns:
+    - List of dicts with collection, fields, unique and status keys
+    """
+    planned = []
+    for collection_name, specs in INDEX_CATALOGUE.items():
+        for spec in specs:
+            planned.append((collection_name, spec["fields"], False, spec.get("sparse", False)))
+    for collection_name, fields in EDGE_UNIQUE_FIELDS.items():
+        planned.append((collection_name, fields, True, False))
+
+    report = []
+    for collection_name, fields, unique, sparse in planned:
+        if dry_run:
+            status = "planned"
+        else:
+            status = _ensure_index(collection_name, fields, unique=unique, sparse=sparse)
+        report.append({
+            "collection": collection_name,
+            "fields": fields,
+            "unique": unique,
+            "status": status
+        })
+    return report
+
+
+def _plan_nodes(plan):
+    nodes = list(plan.get("nodes", []))
+    # Subqueries carry their own node lists
+    for node in plan.get("nodes", []):
+        subquery = node.get("subquery")
+        if subquery:
+            nodes.extend(_plan_nodes(subquery))
+    return nodes
+
+
+def explain_queries(queries=None):
+    """
+    Run EXPLAIN on registered queries and flag full collection scans.
+
+    Parameters:
+    - queries: Optional mapping of name -> (aql, bind_vars); defaults to
+      REGISTERED_QUERIES
+
+    Returns:
+    - List of dicts with name, full_scans (collection names), indexes
+      (index names used), estimated_cost and error keys
+    """
+    queries = queries or REGISTERED_QUERIES
+    report = []
+    for name, (query, bind_vars) in queries.items():
+        entry = {"name": name, "full_scans": [], "indexes": [], "estimated_cost": None, "error": None}
+        try:
+            plan = db.aql.explain(query, bind_vars=bind_vars)
+            if isinstance(plan, list):
+                plan = plan[0]
+            entry["estimated_cost"] = plan.get("estimatedCost")
+            for node in _plan_nodes(plan):
+                if node.get("type") == "EnumerateCollectionNode":
+                    entry["full_scans"].append(node.get("collection"))
+                elif node.get("type") == "IndexNode":
+                    for index in node.get("indexes", []):
+                        entry["indexes"].append(f"{node.get('collection')}.{index.get('name', index.get('id'))}")
+        except Exception as e:
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
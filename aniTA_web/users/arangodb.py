@@ -2,7 +2,11 @@
 from arango import ArangoClient
 from django.conf import settings
 import bcrypt
+import json
+import logging
 from datetime import datetime
+from .blob_store import invalidate_cached_file_ref
+from .identity_map import cached_lookup, invalidate
 
 # Construct the full ArangoDB connection URL
 arangodb_url = f"{settings.ARANGO_DB['HOST']}:{settings.ARANGO_DB['PORT']}"
@@ -58,6 +62,18 @@ if not db.has_collection('material_vectors'):
 if not db.has_collection('material_questions'):
     db.create_collection('material_questions')
 
+if not db.has_collection('grading_cache'):
+    db.create_collection('grading_cache')
+
+if not db.has_collection('graph_versions'):
+    db.create_collection('graph_versions')
+
+if not db.has_collection('mistake_cluster_snapshots'):
+    db.create_collection('mistake_cluster_snapshots')
+
+if not db.has_collection('pdf_texts'):
+    db.create_collection('pdf_texts')
+
 # Edges
 if not db.has_collection('has_feedback_on'):
     db.create_collection('has_feedback_on', edge=True)
@@ -79,6 +95,101 @@ if not db.has_collection('has_material'):
 
 if not db.has_collection('has_question'):
     db.create_collection('has_question', edge=True)
+
+if not db.has_collection('similar_mistake'):
+    db.create_collection('similar_mistake', edge=True)
+# ┌────────────────────┐
+# │ Projected Queries  │
+# └────────────────────┘
+logger = logging.getLogger(__name__)
+
+# Listing queries warn when a returned document is larger than this many
+# bytes (serialised), which usually means a file payload slipped through.
+DOCUMENT_SIZE_WARN_BYTES = getattr(settings, 'ARANGO_DOCUMENT_SIZE_WARN_BYTES', 64 * 1024)
+
+# Attributes that hold file payloads and never belong in a listing
+PAYLOAD_FIELDS = ["file_content", "extracted_text"]
+
+def find_projected(collection_name, filters, keep=None, unset=None, unset_nested=None, limit=None):
+    """
+    Like `collection.find()`, but shapes documents server-side so only the
+    needed attributes travel over the wire.
+
+    Parameters:
+    - collection_name: Collection to query
+    - filters: Dict of attribute -> value equality filters
+    - keep: Attributes to return (AQL KEEP); `_id` and `_key` are always kept
+    - unset: Attributes to drop (AQL UNSET); ignored when `keep` is given
+    - unset_nested: Dict of array attribute -> attributes to drop from each
+      element, e.g. {"assignments": ["file_content"]}
+    - limit: Optional maximum number of documents
+
+    Returns:
+    - List of projected documents
+    """
+    bind_vars = {"@collection": collection_name}
+    conditions = []
+    for i, (attribute, value) in enumerate(filters.items()):
+        bind_vars[f"attr{i}"] = attribute
+        bind_vars[f"value{i}"] = value
+        conditions.append(f"doc.@attr{i} == @value{i}")
+
+    if keep is not None:
+        bind_vars["keep"] = list(dict.fromkeys(["_id", "_key"] + list(keep)))
+        projection = "KEEP(doc, @keep)"
+    elif unset:
+        bind_vars["unset"] = list(unset)
+        projection = "UNSET(doc, @unset)"
+    else:
+        projection = "doc"
+
+    for i, (attribute, nested) in enumerate((unset_nested or {}).items()):
+        if keep is not None and attribute not in keep:
+            continue
+        bind_vars[f"nested_attr{i}"] = attribute
+        bind_vars[f"nested_unset{i}"] = list(nested)
+        projection = (f"MERGE({projection}, {{ [@nested_attr{i}]: "
+                      f"(FOR item IN doc.@nested_attr{i} || [] RETURN UNSET(item, @nested_unset{i})) }})")
+
+    query = f"FOR doc IN @@collection"
+    if conditions:
+        query += f" FILTER {' AND '.join(conditions)}"
+    if limit is not None:
+        query += " LIMIT @limit"
+        bind_vars["limit"] = limit
+    query += f" RETURN {projection}"
+
+    documents = list(db.aql.execute(query, bind_vars=bind_vars))
+    _warn_oversized(collection_name, documents)
+    return documents
+
+def find_one_projected(collection_name, filters, keep=None, unset=None, unset_nested=None):
+    """Return the first matching projected document, or None."""
+    documents = find_projected(collection_name, filters, keep=keep, unset=unset,
+                               unset_nested=unset_nested, limit=1)
+    return documents[0] if documents else None
+
+def _warn_oversized(collection_name, documents):
+    if not DOCUMENT_SIZE_WARN_BYTES:
+        return
+    for doc in documents:
+        size = len(json.dumps(doc, default=str))
+        if size > DOCUMENT_SIZE_WARN_BYTES:
+            logger.warning("Query on %s returned %s (%d bytes > %d); add a projection",
+                           collection_name, doc.get("_id"), size, DOCUMENT_SIZE_WARN_BYTES)
+
+def get_user(user_id):
+    """Fetch a user document, at most once per request."""
+    return cached_lookup('users', {"_id": user_id},
+                         lambda: find_one_projected('users', {"_id": user_id}))
+
+def get_course(class_code):
+    """Fetch a course document without file payloads, at most once per request."""
+    return cached_lookup('courses', {"class_code": class_code},
+                         lambda: find_one_projected('courses', {"class_code": class_code},
+                                                    unset=PAYLOAD_FIELDS,
+                                                    unset_nested={"assignments": PAYLOAD_FIELDS}))
+
 # ┌───────────────────┐
 # │ Updates & Queries │
 # └───────────────────┘
@@ -87,7 +198,7 @@ def register_user(username, email, password, role="student"):
     users = db.collection('users')
 
     # Check if the email already exists
-    existing_user = list(users.find({"email": email}))
+    existing_user = find_one_projected('users', {"email": email}, keep=[])
     if existing_user:
         return {"error": "User already exists"}
 
@@ -132,7 +243,7 @@ def db_add_course(class_code, class_title, instructor_id):
     """
     print(instructor_id, flush=True)
     courses = db.collection('courses')
-    existing_course = list(courses.find({"class_code": class_code}))
+    existing_course = get_course(class_code)
     if existing_course:
         return "Course already exists."
     courses.insert({
@@ -141,38 +252,34 @@ def db_add_course(class_code, class_title, instructor_id):
         "instructor_id": instructor_id,
         "assignments": []
     })
+    invalidate('courses')
 
 def db_get_course_assignments(class_code):
     """
     Returns info for course, and an indicator of whether there was an error.
     """
     # Get the course with its assignments
-    courses = db.collection('courses')
-    course_list = list(courses.find({"class_code": class_code}))
-    if not course_list:
+    course = get_course(class_code)
+    if not course:
         return []
 
-    course = course_list[0]
     assignments = course.get('assignments', [])
-    # print(assignments, flush=True)
 
     return { "code": class_code, "assignments": assignments }, None
 
 def db_instructor_courses(instructor_id):
-    courses = db.collection('courses')
-    courses_list = list(courses.find({"instructor_id": instructor_id}))
-    return courses_list
+    return find_projected('courses', {"instructor_id": instructor_id},
+                          keep=["class_code", "class_title", "instructor_id", "schedule", "is_simulated"])
 
 def db_enroll_student_in_course(user_id, class_code):
     users = db.collection('users')
 
     try:
-        user = users.get(user_id)
+        user = get_user(user_id)
         if not user:
             return "User not found."
 
-        courses = db.collection('courses')
-        course = list(courses.find({"class_code": class_code}))
+        course = get_course(class_code)
         if not course:
             return "Course not found."
 
@@ -183,46 +290,97 @@ def db_enroll_student_in_course(user_id, class_code):
             return "Student has already added this course."
 
         user["courses"].append(class_code)
-        users.update(user)
+        users.update({"_id": user["_id"], "courses": user["courses"]})
+        invalidate('users')
 
         return None # success
     except Exception as e:
         return f"Error: {str(e)}"
 
+STUDENT_OVERVIEW_QUERY = """
+LET user = DOCUMENT(@user_id)
+FILTER user != null
+LET enrolled = user.courses || []
+RETURN {
+    role: user.role,
+    enrolled: enrolled,
+    courses: (
+        FOR code IN (@class_code == null ? enrolled : INTERSECTION(enrolled, [@class_code]))
+            LET course = FIRST(
+                FOR c IN courses
+                    FILTER c.class_code == code
+                    LIMIT 1
+                    RETURN c
+            )
+            FILTER course != null
+            LET submissions = (
+                FOR s IN submission
+                    FILTER s.user_id == @user_id AND s.class_code == code
+                    RETURN KEEP(s, "assignment_id", "grade", "feedback")
+            )
+            RETURN {
+                id: course._id,
+                class_code: course.class_code,
+                class_title: course.class_title,
+                schedule: course.schedule,
+                instructor_name: DOCUMENT(course.instructor_id).username,
+                assignments: (
+                    FOR a IN course.assignments || []
+                        RETURN {
+                            id: a.id,
+                            name: a.name,
+                            description: a.description,
+                            due_date: a.due_date,
+                            total_points: a.total_points,
+                            submission: FIRST(
+                                FOR s IN submissions
+                                    FILTER s.assignment_id == a.id
+                                    RETURN s
+                            )
+                        }
+                )
+            }
+    )
+}
+"""
+
+def db_get_student_overview(user_id, class_code=None):
+    """
+    Fetch a student's courses, assignments, submission status, grades and
+    instructor names in a single AQL round trip.
+
+    Parameters:
+    - user_id: The ID of the student
+    - class_code: Optional class code to restrict the result to one course
+
+    Returns:
+    - Dict with role, enrolled (class codes) and courses keys, or None if
+      the user does not exist. Each assignment carries a `submission` dict
+      (assignment_id, grade, feedback) or None.
+    """
+    result = list(db.aql.execute(STUDENT_OVERVIEW_QUERY, bind_vars={
+        "user_id": user_id,
+        "class_code": class_code
+    }))
+    return result[0] if result else None
+
 def student_courses_overview(user_id) -> dict:
-    print("HYAR", flush=True)
-    users = db.collection('users')
-    user_list = list(users.find({"_id": user_id}))
-    print("user_list", user_list, flush=True)
-    if not user_list:
+    overview = db_get_student_overview(user_id)
+    if not overview:
         return {"courses": []}
 
-    user_info = user_list[0]
-    course_codes = user_info.get("courses", [])
-    print("course_codes", course_codes, flush=True)
-    courses = db.collection('courses')
     courses_data = []
-    # user_list [{'_key': '20773', '_id': 'users/20773', '_rev': '_jcfHWsq---', 'username': 'Bobo Fish', 'email': 'bobofish@fish.com', 'password_hash': '$2b$12$dsrSPntSWEQCYkQQeR6uWep0pIxZwkpgou4clr0b1v726N7SKhLTu', 'role': 'student', 'created_at': '2025-03-30T18:21:18.442794'}]
-    for code in course_codes:
-        course_list = list(courses.find({"class_code": code}))
-        print("course_list:", course_list, flush=True)
-        if course_list:
-            course = course_list[0]
-
-            # Find pending assignments
-            pending_assignments = get_pending_assignments(code, user_id)
-
-            courses_data.append({
-                "code": course["class_code"],
-                "title": course["class_title"],
-                "instructor": get_instructor_name(course["instructor_id"]),
-                "schedule": course.get("schedule", "Not specified"),
-                "n_pending_assignments": len(pending_assignments),
-                "next_due_date": get_next_due_date(pending_assignments),
-                "id": course["_id"]
-            })
-        else:
-            print("no course_list", flush=True)
+    for course in overview["courses"]:
+        pending_assignments = [a for a in course["assignments"] if a["submission"] is None]
+        courses_data.append({
+            "code": course["class_code"],
+            "title": course["class_title"],
+            "instructor": course.get("instructor_name") or "Unknown",
+            "schedule": course.get("schedule") or "Not specified",
+            "n_pending_assignments": len(pending_assignments),
+            "next_due_date": get_next_due_date(pending_assignments),
+            "id": course["id"]
+        })
 
     return {"courses": courses_data}
 
@@ -239,21 +397,18 @@ def get_pending_assignments(class_code, user_id):
     - List of pending assignment objects
     """
     # Get the course with its assignments
-    courses = db.collection('courses')
-    course_list = list(courses.find({"class_code": class_code}))
+    course = get_course(class_code)
 
-    if not course_list:
+    if not course:
         return []
 
-    course = course_list[0]
     assignments = course.get('assignments', [])
 
     # Get the student's submissions for this course
-    submissions = db.collection('submission')
-    student_submissions = list(submissions.find({
+    student_submissions = find_projected('submission', {
         "user_id": user_id,
         "class_code": class_code
-    }))
+    }, keep=["assignment_id"])
 
     # Create a set of submitted assignment IDs for quick lookup
     submitted_assignment_ids = {sub.get("assignment_id") for sub in student_submissions}
@@ -276,9 +431,9 @@ def get_next_due_date(pending_assignments):
     return None
 
 def get_instructor_name(instructor_id):
-    instructor = list(db.collection('users').find({"_id": instructor_id}))
+    instructor = get_user(instructor_id)
     if instructor:
-        return instructor[0].get("username", "Unknown")
+        return instructor.get("username", "Unknown")
     return "Unknown"
 
 def db_get_class_assignment_submissions_metadata(class_code, assignment_id):
@@ -293,17 +448,15 @@ def db_get_class_assignment_submissions_metadata(class_code, assignment_id):
     - List of submission documents with student info
     """
     try:
-        submissions = db.collection('submission')
-        submission_list = list(submissions.find({
+        submission_list = find_projected('submission', {
             "class_code": class_code,
             "assignment_id": assignment_id
-        }))
+        }, keep=["user_id", "file_name", "submission_date", "grade", "feedback", "graded"])
 
         # Add student names to each submission
-        users = db.collection('users')
         result = []
         for sub in submission_list:
-            user = users.get(sub["user_id"])
+            user = get_user(sub["user_id"])
             if user:
                 metadata = {
                     "_id": sub.get("_id"),
@@ -324,7 +477,7 @@ def db_get_class_assignment_submissions_metadata(class_code, assignment_id):
         print(f"Error retrieving submissions: {str(e)}")
         return []
 
-def db_create_assignment(class_code, assignment_name, description, due_date, total_points, instructions_encoded_pdf, instructions_file_name):
+def db_create_assignment(class_code, assignment_name, description, due_date, total_points, instructions_blob, instructions_file_name):
     """
     Add a new assignment to a course.
 
@@ -334,59 +487,56 @@ def db_create_assignment(class_code, assignment_name, description, due_date, tot
     - description: Detailed description of the assignment
     - due_date: Due date for the assignment (ISO format string)
     - total_points: Maximum points for the assignment
-    - instructions_encoded_pdf
+    - instructions_blob: Blob reference of the instructions PDF (see users/blob_store.py)
     - instructions_file_name
 
     Returns:
     - None if successful, otherwise an error message string
     """
     try:
-        courses = db.collection('courses')
-        course_list = list(courses.find({"class_code": class_code}))
-
-        if not course_list:
-            return "Course not found."
-
-        course = course_list[0]
-
-        # Create a unique assignment ID within the course
-        assignment_id = f"{class_code}_{len(course.get('assignments', []))}"
-
-        # Create the assignment object
         new_assignment = {
-            "id": assignment_id,
             "name": assignment_name,
             "file_name": instructions_file_name,
-            "file_content": instructions_encoded_pdf,
+            "file_blob": instructions_blob,
             "description": description,
             "due_date": due_date,
             "total_points": total_points,
             "created_at": datetime.utcnow().isoformat()
         }
 
-        # Add the assignment to the course's assignments array
-        if "assignments" not in course:
-            course["assignments"] = []
-
-        course["assignments"].append(new_assignment)
+        # Append server-side so the existing assignments never travel over
+        # the wire. The assignment ID is unique within the course.
+        query = """
+        FOR course IN courses
+            FILTER course.class_code == @class_code
+            LIMIT 1
+            LET existing = course.assignments || []
+            LET assignment = MERGE(@assignment, {
+                id: CONCAT(@class_code, "_", LENGTH(existing))
+            })
+            UPDATE course WITH { assignments: PUSH(existing, assignment) } IN courses
+            RETURN assignment.id
+        """
+        created = list(db.aql.execute(query, bind_vars={
+            "class_code": class_code,
+            "assignment": new_assignment
+        }))
 
-        # Update the course in the database
-        courses.update(course)
+        if not created:
+            return "Course not found."
 
+        invalidate('courses')
         return None  # Success
     except Exception as e:
         return f"Error creating assignment: {str(e)}"
 
 def db_get_assignment_id(class_code, assignment_name):
     try:
-        courses = db.collection('courses')
-        course_list = list(courses.find({"class_code": class_code}))
+        course = get_course(class_code)
 
-        if not course_list:
+        if not course:
             return None  # Course not found
 
-        course = course_list[0]
-
         # Check if assignments exist in the course
         if "assignments" not in course or not course["assignments"]:
             return None  # No assignments in this course
@@ -415,51 +565,25 @@ def db_get_student_assignments(user_id, class_code=None):
     - Dictionary containing assignments grouped by course, with submission status
     """
     try:
-        # Verify user exists and is a student
-        users = db.collection('users')
-        user = users.get(user_id)
+        overview = db_get_student_overview(user_id, class_code)
 
-        if not user or user.get('role') != 'student':
+        # Verify user exists and is a student
+        if not overview or overview.get('role') != 'student':
             return {"error": "Invalid student ID"}
 
         # Get courses the student is enrolled in
-        enrolled_courses = user.get('courses', [])
-        if not enrolled_courses:
+        if not overview['enrolled']:
             return {"assignments": []}
 
-        # Filter by specific class if provided
-        if class_code:
-            if class_code not in enrolled_courses:
-                return {"error": "Student not enrolled in this course"}
-            enrolled_courses = [class_code]
-
-        # Get course data including assignments
-        courses = db.collection('courses')
-        submissions = db.collection('submission')
+        if class_code and class_code not in overview['enrolled']:
+            return {"error": "Student not enrolled in this course"}
 
         result = []
 
-        for code in enrolled_courses:
-            course_list = list(courses.find({"class_code": code}))
-            if not course_list:
-                continue
-
-            course = course_list[0]
-            assignments = course.get('assignments', [])
-
-            # Get student's submissions for this course
-            student_submissions = list(submissions.find({
-                "user_id": user_id,
-                "class_code": code
-            }))
-
-            # Create a map of assignment ID to submission for quick lookup
-            submission_map = {sub.get('assignment_id'): sub for sub in student_submissions}
-
+        for course in overview['courses']:
             course_assignments = []
-            for assignment in assignments:
-                assignment_id = assignment.get('id')
-                submission = submission_map.get(assignment_id)
+            for assignment in course['assignments']:
+                submission = assignment['submission']
 
                 # Determine status and grade
                 status = "Not Submitted"
@@ -474,11 +598,11 @@ def db_get_student_assignments(user_id, class_code=None):
                         status = "Graded"
 
                 course_assignments.append({
-                    "id": assignment_id,
+                    "id": assignment['id'],
                     "name": assignment.get('name'),
                     "description": assignment.get('description'),
                     "due_date": assignment.get('due_date'),
-                    "total_points": assignment.get('total_points', 100),
+                    "total_points": 100 if assignment.get('total_points') is None else assignment['total_points'],
                     "status": status,
                     "grade": grade,
                     "feedback": feedback
@@ -487,7 +611,7 @@ def db_get_student_assignments(user_id, class_code=None):
             # Add course with its assignments to the result
             if course_assignments:
                 result.append({
-                    "class_code": code,
+                    "class_code": course['class_code'],
                     "class_title": course.get('class_title'),
                     "assignments": course_assignments
                 })
@@ -497,7 +621,26 @@ def db_get_student_assignments(user_id, class_code=None):
     except Exception as e:
         return {"error": f"Error retrieving assignments: {str(e)}"}
 
-def db_add_submission(user_id, class_code, assignment_id, file_content, file_name):
+def db_check_submission_allowed(user_id, class_code, assignment_id):
+    """
+    Check that a student may submit to an assignment, before anything is stored.
+
+    Returns:
+    - None if allowed, otherwise an error message string
+    """
+    course = get_course(class_code)
+    if not course:
+        return "Course not found."
+
+    if not any(assignment.get('id') == assignment_id for assignment in course.get('assignments', [])):
+        return "Assignment not found."
+
+    user = get_user(user_id)
+    if not user or class_code not in user.get('courses', []):
+        return "Student is not enrolled in this course."
+    return None
+
+def db_add_submission(user_id, class_code, assignment_id, file_blob, file_name):
     """
     Add a new submission for an assignment.
 
@@ -505,52 +648,31 @@ def db_add_submission(user_id, class_code, assignment_id, file_content, file_nam
     - user_id: The ID of the student submitting the assignment
     - class_code: The code of the class the assignment belongs to
     - assignment_id: The ID of the assignment
-    - file_content: The binary content of the PDF file
+    - file_blob: Blob reference of the submitted PDF (see users/blob_store.py)
     - file_name: The name of the uploaded file
 
     Returns:
     - None if successful, otherwise an error message string
     """
     try:
-        # Verify the assignment exists
-        courses = db.collection('courses')
-        course_list = list(courses.find({"class_code": class_code}))
-
-        if not course_list:
-            return "Course not found."
-
-        course = course_list[0]
-        assignment_exists = False
-
-        for assignment in course.get('assignments', []):
-            if assignment.get('id') == assignment_id:
-                assignment_exists = True
-                break
-
-        if not assignment_exists:
-            return "Assignment not found."
-
-        # Check if the student is enrolled in this course
-        users = db.collection('users')
-        user = users.get(user_id)
-
-        if not user or class_code not in user.get('courses', []):
-            return "Student is not enrolled in this course."
+        err = db_check_submission_allowed(user_id, class_code, assignment_id)
+        if err:
+            return err
 
         # Check if there's an existing submission
         submissions = db.collection('submission')
-        existing_submission = list(submissions.find({
+        existing_submission = find_projected('submission', {
             "user_id": user_id,
             "class_code": class_code,
             "assignment_id": assignment_id
-        }))
+        }, unset=PAYLOAD_FIELDS, limit=1)
 
         submission_data = {
             "user_id": user_id,
             "class_code": class_code,
             "assignment_id": assignment_id,
             "file_name": file_name,
-            "file_content": file_content,  # Store binary content
+            "file_blob": file_blob,
             "submission_date": datetime.now().isoformat(),
             "grade": None,
             "feedback": None,
@@ -560,10 +682,11 @@ def db_add_submission(user_id, class_code, assignment_id, file_content, file_nam
         }
 
         if existing_submission:
-            # Update existing submission
+            # Replace the existing submission, dropping any legacy inline payload
             submission_doc = existing_submission[0]
             submission_doc.update(submission_data)
-            submissions.update(submission_doc)
+            submissions.replace(submission_doc)
+            invalidate_cached_file_ref("submission", submission_doc["_key"])
             return None  # Success
         else:
             # Create new submission
@@ -586,17 +709,11 @@ def db_get_submission(user_id, class_code, assignment_id):
     - The submission document if found, otherwise None
     """
     try:
-        submissions = db.collection('submission')
-        submission_list = list(submissions.find({
+        return find_one_projected('submission', {
             "user_id": user_id,
             "class_code": class_code,
             "assignment_id": assignment_id
-        }))
-
-        if submission_list:
-            return submission_list[0]
-        else:
-            return None
+        }, unset=PAYLOAD_FIELDS)
 
     except Exception as e:
         print(f"Error retrieving submission: {str(e)}")
@@ -621,15 +738,16 @@ def db_get_submission_by_numeric_id(submission_numeric_id):
         print(f"Error retrieving submission: {str(e)}")
         return None
 
-def db_get_assignment_instructions_file_content(assignment_id):
+def db_get_assignment_instructions(assignment_id):
     """
-    Retrieve the PDF instructions file content for an assignment.
+    Retrieve the assignment entry holding the PDF instructions.
 
     Parameters:
     - assignment_id: The assignment's unique ID (format: "classCode_index")
 
     Returns:
-    - Tuple of (file_content, file_name) if found, (None, None) otherwise
+    - The assignment dict (with `file_blob`, or a legacy `file_content`) if
+      found, None otherwise
     """
     try:
         # Extract class code from assignment_id (format: "classCode_index")
@@ -639,19 +757,19 @@ def db_get_assignment_instructions_file_content(assignment_id):
         course_list = list(courses.find({"class_code": class_code}))
 
         if not course_list:
-            return None, None
+            return None
 
         course = course_list[0]
 
         for assignment in course.get('assignments', []):
             if assignment.get('id') == assignment_id:
-                return assignment.get('file_content') # , assignment.get('file_name')
+                return assignment
 
-        return None, None
+        return None
 
     except Exception as e:
         print(f"Error retrieving instructions: {str(e)}")
-        return None, None
+        return None
 
 def db_put_ai_feedback(user_id, class_code, assignment_id, ai_score, ai_feedback):
     """
@@ -670,16 +788,15 @@ def db_put_ai_feedback(user_id, class_code, assignment_id, ai_score, ai_feedback
     """
     try:
         submissions = db.collection('submission')
-        submission_list = list(submissions.find({
+        submission = find_one_projected('submission', {
             "user_id": user_id,
             "class_code": class_code,
             "assignment_id": assignment_id
-        }))
+        }, keep=[])
 
-        if not submission_list:
+        if not submission:
             return "Submission not found"
 
-        submission = submission_list[0]
         submission["ai_score"] = ai_score
         submission["ai_feedback"] = ai_feedback
         
@@ -722,12 +839,12 @@ def db_put_submission_grade(numeric_submission_id, grade, feedback):
     """
     try:
         full_id = f"submission/{numeric_submission_id}"
-        submissions = db.collection('submission')
-        submission = submissions.get(full_id)
+        submission = find_one_projected('submission', {"_id": full_id}, keep=[])
 
         if not submission:
             return "Submission not found"
 
+        submissions = db.collection('submission')
         submission["grade"] = grade
         submission["feedback"] = feedback
         submission["graded"] = True
@@ -0,0 +1,301 @@
+"""
+Content-addressed storage for uploaded files (assignment instructions,
+course materials and student submissions).
+
+Documents in ArangoDB only hold a small blob reference:
+
+    {"sha256": "<hex digest>", "size": <bytes>, "content_type": "application/pdf"}
+
+The bytes themselves live in a blob store addressed by their sha256, so the
+same PDF uploaded twice is stored once and listing queries never carry file
+payloads. The backend is selected by `settings.BLOB_STORE`.
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.cache import cache
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+def make_blob_ref(sha256, size, content_type="application/pdf"):
+    return {"sha256": sha256, "size": size, "content_type": content_type}
+
+
+class BlobWriter:
+    """
+    Stores a stream in one pass: chunks are hashed while being written to a
+    staging file, and commit() moves that file into the store. `path` stays
+    readable after commit (the stored blob for local stores, the staging
+    file for remote ones) until close(), so the same bytes can be handed to
+    text extraction without another copy.
+    """
+
+    def __init__(self, store, tmp_dir=None, content_type="application/pdf"):
+        self.store = store
+        self.content_type = content_type
+        self.size = 0
+        self.ref = None
+        self._digest = hashlib.sha256()
+        fd, self._staging_path = tempfile.mkstemp(dir=tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+        self.path = self._staging_path
+
+    def write(self, chunk):
+        self._digest.update(chunk)
+        self.size += len(chunk)
+        self._file.write(chunk)
+
+    def finish(self):
+        """Close the staging file so `path` can be read before commit()."""
+        self._file.close()
+
+    def commit(self):
+        """Store the written bytes and return their blob reference."""
+        self._file.close()
+        sha256 = self._digest.hexdigest()
+        self.path = self.store._commit_staged(self._staging_path, sha256, self.content_type)
+        self.ref = make_blob_ref(sha256, self.size, self.content_type)
+        return self.ref
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._staging_path):
+            os.remove(self._staging_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class BlobStore:
+    """
+    Interface every backend implements. Blobs are immutable: `put_*` returns
+    the reference of the stored content and is a no-op if it already exists.
+    """
+
+    def put_stream(self, chunks, content_type="application/pdf"):
+        """Store an iterable of byte chunks and return its blob reference."""
+        raise NotImplementedError
+
+    def open(self, sha256):
+        """Return a readable binary file object for a blob."""
+        raise NotImplementedError
+
+    def exists(self, sha256):
+        raise NotImplementedError
+
+    def delete(self, sha256):
+        raise NotImplementedError
+
+    def local_path(self, sha256):
+        """Filesystem path of a blob, or None if the backend is remote."""
+        return None
+
+    def writer(self, content_type="application/pdf"):
+        """Return a BlobWriter for storing a stream that is also read locally."""
+        return BlobWriter(self, content_type=content_type)
+
+    def _commit_staged(self, staging_path, sha256, content_type):
+        """Store a BlobWriter's staging file; return the path to read it from."""
+        with open(staging_path, "rb") as staged:
+            self.put_file(staged, content_type=content_type)
+        return staging_path
+
+    def put_bytes(self, data, content_type="application/pdf"):
+        return self.put_stream([data], content_type=content_type)
+
+    def put_file(self, fileobj, content_type="application/pdf"):
+        return self.put_stream(iter(lambda: fileobj.read(CHUNK_SIZE), b""), content_type=content_type)
+
+    def read(self, sha256):
+        with self.open(sha256) as f:
+            return f.read()
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Filesystem backend. Blobs are stored at ROOT/ab/cd/<sha256>; writes go to
+    a temporary file in the same filesystem and are renamed into place once
+    the digest is known, so readers never see partial files.
+    """
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def local_path(self, sha256):
+        return self._path(sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self._path(sha256))
+
+    def writer(self, content_type="application/pdf"):
+        return BlobWriter(self, tmp_dir=self.tmp_dir, content_type=content_type)
+
+    def _commit_staged(self, staging_path, sha256, content_type):
+        final_path = self._path(sha256)
+        if os.path.exists(final_path):
+            os.remove(staging_path)  # Deduplicated
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(staging_path, final_path)
+        return final_path
+
+    def put_stream(self, chunks, content_type="application/pdf"):
+        with self.writer(content_type) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+            return writer.commit()
+
+    def open(self, sha256):
+        try:
+            return open(self._path(sha256), "rb")
+        except FileNotFoundError:
+            raise BlobNotFound(sha256)
+
+    def delete(self, sha256):
+        try:
+            os.remove(self._path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore(BlobStore):
+    """
+    Stand-in for S3-compatible object stores. Objects are keyed by
+    PREFIX/<sha256>; requires boto3, which is not a default dependency.
+    """
+
+    def __init__(self, bucket, prefix="blobs", **client_kwargs):
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError("S3BlobStore requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", **client_kwargs)
+
+    def _key(self, sha256):
+        return f"{self.prefix}/{sha256}"
+
+    def exists(self, sha256):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(sha256))
+            return True
+        except Exception:
+            return False
+
+    def put_stream(self, chunks, content_type="application/pdf"):
+        # The key depends on the digest, so spool locally before uploading.
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                spool.write(chunk)
+            sha256 = digest.hexdigest()
+            if not self.exists(sha256):
+                spool.seek(0)
+                self.client.upload_fileobj(spool, self.bucket, self._key(sha256),
+                                           ExtraArgs={"ContentType": content_type})
+        return make_blob_ref(sha256, size, content_type)
+
+    def _commit_staged(self, staging_path, sha256, content_type):
+        if not self.exists(sha256):
+            self.client.upload_file(staging_path, self.bucket, self._key(sha256),
+                                    ExtraArgs={"ContentType": content_type})
+        return staging_path
+
+    def open(self, sha256):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(sha256))["Body"]
+        except Exception:
+            raise BlobNotFound(sha256)
+
+    def delete(self, sha256):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(sha256))
+
+
+_blob_store = None
+
+
+def get_blob_store():
+    """Return the process-wide blob store configured in settings.BLOB_STORE."""
+    global _blob_store
+    if _blob_store is None:
+        config = getattr(settings, "BLOB_STORE", {})
+        backend = config.get("BACKEND", "local")
+        if backend == "local":
+            _blob_store = LocalBlobStore(config.get("ROOT", os.path.join(settings.BASE_DIR, "blob_data")))
+        elif backend == "s3":
+            _blob_store = S3BlobStore(config["BUCKET"], prefix=config.get("PREFIX", "blobs"),
+                                      **config.get("CLIENT_OPTIONS", {}))
+        else:
+            raise ValueError(f"Unknown blob store backend: {backend}")
+    return _blob_store
+
+
+def decode_legacy_content(file_content):
+    """
+    Decode a base64 `file_content` payload stored by older versions.
+    Returns None if the value is not valid base64 (e.g. simulated plain text).
+    """
+    if not file_content or not isinstance(file_content, str):
+        return None
+    try:
+        return base64.b64decode(file_content, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def load_document_file(doc):
+    """
+    Return the file bytes attached to a submission, assignment or material
+    document, reading either its blob reference or a legacy base64 payload.
+    Returns None if the document has no file.
+    """
+    blob = doc.get("file_blob")
+    if blob:
+        return get_blob_store().read(blob["sha256"])
+    return decode_legacy_content(doc.get("file_content"))
+
+
+
+# File references (sha256, size, last modified) are cached per document so
+# conditional PDF requests can be answered without reading ArangoDB. With
+# the default per-process cache, other workers may serve a replaced
+# submission's old reference until PDF_REF_CACHE_TIMEOUT expires; configure
+# a shared CACHES backend to make invalidation immediate everywhere.
+def _file_ref_cache_key(kind, ident):
+    return f"file-ref:{kind}:{ident}"
+
+
+def get_cached_file_ref(kind, ident):
+    return cache.get(_file_ref_cache_key(kind, ident))
+
+
+def cache_file_ref(kind, ident, file_ref):
+    timeout = getattr(settings, "PDF_REF_CACHE_TIMEOUT", 300)
+    cache.set(_file_ref_cache_key(kind, ident), file_ref, timeout)
+
+
+def invalidate_cached_file_ref(kind, ident):
+    cache.delete(_file_ref_cache_key(kind, ident))
@@ -1,82 +1,233 @@
 from users.arangodb import db
+from users.section_index import get_section_index
+from users.mistake_similarity import bump_graph_version, link_new_mistakes, unlink_mistakes
 from datetime import datetime
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+def rank_sections_for_chunk(assignment_id, chunk_text, top_k=5):
+    """
+    Rank an assignment's Sections by relevance to a chunk of text.
+
+    Returns a list of (section_id, score) tuples, best match first.
+    """
+    return get_section_index(assignment_id).rank(chunk_text, top_k=top_k)
 
 def find_section_for_chunk(assignment_id, chunk_text):
     """
     Given a chunk of text, find the best matching Section from the DB.
     """
-    sections = list(db.collection('sections').find({
-        "assignment_id": assignment_id
-    }))
+    ranked = rank_sections_for_chunk(assignment_id, chunk_text, top_k=1)
+    if ranked:
+        return ranked[0][0]
+    else:
+        return None
 
-    best_match = None
-    max_overlap = 0
+class GradingGraphBatch:
+    """
+    Collects the Mistake nodes and edges of a whole grading result and
+    writes them in one stream transaction with one batch insert per
+    collection, so the graph write is atomic and costs a constant number
+    of round trips regardless of how many questions were graded. The new
+    mistakes are linked into the similarity graph right after the commit
+    (see users/mistake_similarity.py for why not inside the transaction).
+    """
 
-    chunk_words = set(chunk_text.lower().split())
+    COLLECTIONS = ['mistakes', 'has_feedback_on', 'made_mistake', 'affects_criteria', 'related_to']
+    # Deleting mistakes also removes their similarity edges
+    DELETE_COLLECTIONS = COLLECTIONS + ['similar_mistake']
 
-    for section in sections:
-        section_words = set(section["content"].lower().split())
-        overlap = len(chunk_words.intersection(section_words))
-        
-        if overlap > max_overlap:
-            max_overlap = overlap
-            best_match = section
+    def __init__(self, student_id, submission_id, assignment_id, rubric_mapping):
+        self.student_id = student_id
+        self.submission_id = submission_id
+        self.assignment_id = assignment_id
+        self.rubric_mapping = rubric_mapping
+        self.documents = {name: [] for name in self.COLLECTIONS}
+        self._section_cache = {}
 
-    if best_match:
-        return best_match["_id"]
-    else:
-        return None
+    def _sections_for_chunk(self, chunk_text):
+        if chunk_text not in self._section_cache:
+            self._section_cache[chunk_text] = find_section_for_chunk(self.assignment_id, chunk_text)
+        return self._section_cache[chunk_text]
+
+    def add_result_item(self, result_item, relevant_chunks):
+        """
+        Queue a Mistake node for one graded question plus its edges.
+
+        Returns:
+            str: The _id the mistake will have once committed
+        """
+        # Keys are generated client-side so edges can reference the node
+        # before it exists.
+        mistake_key = uuid.uuid4().hex
+        mistake_id = f"mistakes/{mistake_key}"
+
+        # 1. Mistake node
+        mistake_doc = {
+            "_key": mistake_key,
+            "assignment_id": self.assignment_id,
+            "question": result_item.get("question", ""),
+            "justification": result_item.get("justification", ""),
+            "score_awarded": result_item.get("score", 0),
+            "rubric_criteria_names": [rc["criteria"] for rc in result_item.get("rubric_criteria", [])],
+            "created_at": datetime.utcnow().isoformat()
+        }
+        self.documents['mistakes'].append(mistake_doc)
+
+        # 2. Edge: Submission --> Mistake
+        self.documents['has_feedback_on'].append({
+            "_from": f"submission/{self.submission_id}",
+            "_to": mistake_id
+        })
+
+        # 3. Edge: Student --> Mistake
+        self.documents['made_mistake'].append({
+            "_from": self.student_id,
+            "_to": mistake_id
+        })
+
+        # 4. Edge: Mistake --> Rubric
+        for rubric_name in dict.fromkeys(mistake_doc["rubric_criteria_names"]):
+            rubric_id = self.rubric_mapping.get(rubric_name)
+            if rubric_id:
+                self.documents['affects_criteria'].append({
+                    "_from": mistake_id,
+                    "_to": rubric_id,
+                    "criterion_name": rubric_name
+                })
+
+        # 5. 🔥 Edge: Mistake --> Section (several chunks may map to one section)
+        linked_sections = set()
+        for chunk_text in relevant_chunks:
+            section_id = self._sections_for_chunk(chunk_text)
+            if section_id and section_id not in linked_sections:
+                linked_sections.add(section_id)
+                self.documents['related_to'].append({
+                    "_from": mistake_id,
+                    "_to": section_id
+                })
+
+        return mistake_id
+
+    def commit(self, replace_previous=False):
+        """
+        Write everything queued so far atomically.
+
+        Args:
+            replace_previous: Also delete, in the same transaction, the
+                mistakes stored by an earlier grading of the submission
+
+        Returns:
+            list: The _ids of the stored mistakes
+        """
+        if not self.documents['mistakes'] and not replace_previous:
+            return []
+
+        write = self.DELETE_COLLECTIONS if replace_previous else self.COLLECTIONS
+        txn_db = db.begin_transaction(read=['sections'], write=write)
+        try:
+            if replace_previous:
+                _remove_mistakes(txn_db, submission_mistake_ids(self.submission_id, database=txn_db))
+            for name in self.COLLECTIONS:
+                if not self.documents[name]:
+                    continue
+                # The batch document API reports failures per document
+                # instead of raising, so check and abort explicitly.
+                results = txn_db.collection(name).insert_many(self.documents[name], silent=False)
+                errors = [r for r in results if isinstance(r, Exception)]
+                if errors:
+                    raise errors[0]
+            txn_db.commit_transaction()
+        except Exception:
+            txn_db.abort_transaction()
+            raise
+
+        # Outside the transaction, so mistakes committed concurrently are
+        # seen; the mistakes are stored either way
+        try:
+            link_new_mistakes(self.documents['mistakes'])
+        except Exception as e:
+            logger.warning(f"Could not link new mistakes into the similarity graph "
+                           f"(rebuild_mistake_graph --check will report it): {e}")
+        # New nodes change the graph even when they link to nothing
+        bump_graph_version()
+
+        mistake_ids = [f"mistakes/{doc['_key']}" for doc in self.documents['mistakes']]
+        self.documents = {name: [] for name in self.COLLECTIONS}
+        return mistake_ids
+
+def submission_mistake_ids(submission_id, database=None):
+    """_ids of the Mistake nodes stored for a submission's feedback."""
+    database = database or db
+    return list(database.aql.execute(
+        """
+        FOR edge IN has_feedback_on
+            FILTER edge._from == @submission_id
+            RETURN edge._to
+        """,
+        bind_vars={"submission_id": f"submission/{submission_id}"}
+    ))
+
+def store_grading_result(student_id, submission_id, assignment_id, grading_result, rubric_mapping):
+    """
+    Store Mistake nodes and edges for every result item of a grading result
+    in a single transaction. Mistakes from an earlier grading of the same
+    submission are deleted in that transaction too, so a regrade replaces
+    them instead of adding a second set, and a failed write keeps them.
+
+    Returns:
+        list: The _ids of the stored mistakes
+    """
+    batch = GradingGraphBatch(student_id, submission_id, assignment_id, rubric_mapping)
+    relevant_chunks = grading_result.get("relevant_chunks", [])
+    for result_item in grading_result.get("results", []):
+        # Per-question grading attaches the chunks retrieved for each question
+        batch.add_result_item(result_item, result_item.get("relevant_chunks", relevant_chunks))
+    return batch.commit(replace_previous=True)
 
 def store_mistake_and_edges(student_id, submission_id, assignment_id, result_item, relevant_chunks, rubric_mapping):
     """
     Store a Mistake node and link it to the appropriate Section based on relevant chunks.
     """
-    mistakes = db.collection('mistakes')
-    has_feedback_on = db.collection('has_feedback_on')
-    made_mistake = db.collection('made_mistake')
-    affects_criteria = db.collection('affects_criteria')
-    related_to = db.collection('related_to')
-
-    # 1. Create mistake node
-    mistake_doc = {
-        "assignment_id": assignment_id,
-        "question": result_item.get("question", ""),
-        "justification": result_item.get("justification", ""),
-        "score_awarded": result_item.get("score", 0),
-        "rubric_criteria_names": [rc["criteria"] for rc in result_item.get("rubric_criteria", [])],
-        "created_at": datetime.utcnow().isoformat()
-    }
-    mistake_meta = mistakes.insert(mistake_doc)
-    mistake_id = mistake_meta["_id"]
-
-    # 2. Edge: Submission --> Mistake
-    has_feedback_on.insert({
-        "_from": f"submission/{submission_id}",
-        "_to": mistake_id
-    })
-
-    # 3. Edge: Student --> Mistake
-    made_mistake.insert({
-        "_from": student_id,
-        "_to": mistake_id
-    })
-
-    # 4. Edge: Mistake --> Rubric
-    for rubric_name in mistake_doc["rubric_criteria_names"]:
-        rubric_id = rubric_mapping.get(rubric_name)
-        if rubric_id:
-            affects_criteria.insert({
-                "_from": mistake_id,
-                "_to": rubric_id
-            })
-
-    # 5. 🔥 Edge: Mistake --> Section
-    for chunk_text in relevant_chunks:
-        section_id = find_section_for_chunk(assignment_id, chunk_text)
-        if section_id:
-            related_to.insert({
-                "_from": mistake_id,
-                "_to": section_id
-            })
-
+    batch = GradingGraphBatch(student_id, submission_id, assignment_id, rubric_mapping)
+    mistake_id = batch.add_result_item(result_item, relevant_chunks)
+    batch.commit()
     return mistake_id
+
+def delete_mistakes(mistake_ids):
+    """
+    Delete Mistake nodes with every edge touching them, including their
+    similarity edges, in a single transaction.
+
+    Returns:
+        int: Number of mistakes deleted
+    """
+    if not mistake_ids:
+        return 0
+
+    txn_db = db.begin_transaction(write=GradingGraphBatch.DELETE_COLLECTIONS)
+    try:
+        deleted = _remove_mistakes(txn_db, mistake_ids)
+        txn_db.commit_transaction()
+    except Exception:
+        txn_db.abort_transaction()
+        raise
+    bump_graph_version()
+    return deleted
+
+def _remove_mistakes(txn_db, mistake_ids):
+    """Remove Mistake nodes and every edge touching them inside a transaction."""
+    if not mistake_ids:
+        return 0
+    for name in GradingGraphBatch.COLLECTIONS[1:]:
+        txn_db.aql.execute(
+            f"FOR e IN {name} FILTER e._from IN @ids OR e._to IN @ids REMOVE e IN {name}",
+            bind_vars={"ids": list(mistake_ids)}
+        )
+    unlink_mistakes(mistake_ids, database=txn_db)
+    return sum(txn_db.aql.execute(
+        "FOR m IN mistakes FILTER m._id IN @ids REMOVE m IN mistakes RETURN 1",
+        bind_vars={"ids": list(mistake_ids)}
+    ))
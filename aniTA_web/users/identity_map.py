@@ -0,0 +1,89 @@
+"""
+Request-scoped identity map for the ArangoDB access layer.
+
+Within one request the same `users` and `courses` documents are looked up
+many times (an instructor name per course, the same course from several
+helpers). `IdentityMapMiddleware` opens a map for each request; the lookup
+helpers in `users/arangodb.py` and `users/material_db.py` consult it before
+going to ArangoDB. Outside a request (management commands, shells) no map
+is active and every lookup goes straight to the database.
+"""
+
+import contextvars
+import copy
+from django.conf import settings
+
+_current_map = contextvars.ContextVar("arango_identity_map", default=None)
+
+
+class IdentityMap:
+    def __init__(self):
+        self.documents = {}
+        self.hits = 0
+        self.misses = 0
+
+
+def current_identity_map():
+    return _current_map.get()
+
+
+def _lookup_key(collection_name, filters):
+    return (collection_name, tuple(sorted(filters.items())))
+
+
+def cached_lookup(collection_name, filters, fetch):
+    """
+    Return the document matching `filters`, calling `fetch()` only on the
+    first lookup in the current request. Callers get their own copy, so
+    mutating a returned document does not affect later lookups.
+
+    Args:
+        collection_name (str): Collection the document belongs to
+        filters (dict): Attribute -> value lookup, e.g. {"class_code": "CS101"}
+        fetch (callable): Loads the document (or None) from ArangoDB
+
+    Returns:
+        dict: The document, or None if it does not exist
+    """
+    identity_map = _current_map.get()
+    if identity_map is None:
+        return fetch()
+
+    key = _lookup_key(collection_name, filters)
+    if key in identity_map.documents:
+        identity_map.hits += 1
+    else:
+        identity_map.misses += 1
+        identity_map.documents[key] = fetch()
+    return copy.deepcopy(identity_map.documents[key])
+
+
+def invalidate(collection_name):
+    """Forget every cached document of a collection after a write."""
+    identity_map = _current_map.get()
+    if identity_map is None:
+        return
+    for key in [key for key in identity_map.documents if key[0] == collection_name]:
+        del identity_map.documents[key]
+
+
+class IdentityMapMiddleware:
+    """
+    Installs a fresh identity map for each request. In DEBUG mode the hit
+    and miss counters are reported in an `X-Arango-Identity-Map` header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        identity_map = IdentityMap()
+        token = _current_map.set(identity_map)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_map.reset(token)
+
+        if settings.DEBUG:
+            response["X-Arango-Identity-Map"] = f"hits={identity_map.hits}; misses={identity_map.misses}"
+        return response
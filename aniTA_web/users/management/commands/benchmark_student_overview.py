@@ -0,0 +1,129 @@
+import statistics
+import time
+from arango import ArangoClient
+from arango.http import DefaultHTTPClient
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import users.arangodb as arangodb
+
+class CountingHTTPClient(DefaultHTTPClient):
+    """HTTP client that counts requests sent to ArangoDB."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = 0
+
+    def send_request(self, *args, **kwargs):
+        self.requests += 1
+        return super().send_request(*args, **kwargs)
+
+
+def legacy_student_dashboard(db, user_id):
+    """
+    The per-course implementation the single-query overview replaced:
+    one courses.find and one submission.find per course for the dashboard,
+    plus courses.find, submission.find and an instructor lookup per course
+    for the course overview.
+    """
+    user = db.collection('users').get(user_id)
+    courses = db.collection('courses')
+    submissions = db.collection('submission')
+    for code in user.get('courses', []):
+        list(courses.find({"class_code": code}))
+        list(submissions.find({"user_id": user_id, "class_code": code}))
+
+    user = list(db.collection('users').find({"_id": user_id}))[0]
+    for code in user.get('courses', []):
+        course = list(courses.find({"class_code": code}))[0]
+        list(courses.find({"class_code": code}))
+        list(submissions.find({"user_id": user_id, "class_code": code}))
+        list(db.collection('users').find({"_id": course["instructor_id"]}))
+
+
+def current_student_dashboard(db, user_id):
+    arangodb.db_get_student_assignments(user_id)
+    arangodb.student_courses_overview(user_id)
+
+
+class Command(BaseCommand):
+    help = 'Compare ArangoDB round trips and latency of the student dashboard queries against the per-course implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, nargs='+', default=[5, 20, 50],
+                            help='Numbers of enrolled courses to benchmark')
+        parser.add_argument('--assignments', type=int, default=6,
+                            help='Assignments per course')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per implementation')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the scratch benchmark database afterwards')
+
+    def handle(self, *args, **options):
+        bench_name = f"{settings.ARANGO_DB['DATABASE']}_bench"
+        if not arangodb.sys_db.has_database(bench_name):
+            arangodb.sys_db.create_database(bench_name)
+
+        http_client = CountingHTTPClient()
+        client = ArangoClient(hosts=arangodb.arangodb_url, http_client=http_client)
+        bench_db = client.db(bench_name,
+                             username=settings.ARANGO_DB['USERNAME'],
+                             password=settings.ARANGO_DB['PASSWORD'])
+        for name in ('users', 'courses', 'submission'):
+            if not bench_db.has_collection(name):
+                bench_db.create_collection(name)
+        bench_db.collection('submission').add_persistent_index(fields=["user_id", "class_code", "assignment_id"])
+        bench_db.collection('courses').add_persistent_index(fields=["class_code"])
+
+        original_db = arangodb.db
+        arangodb.db = bench_db
+        try:
+            self.stdout.write(f"{'courses':>8} {'impl':>8} {'round trips':>12} {'p50 ms':>9} {'min ms':>9}")
+            for n_courses in options['courses']:
+                user_id = self.seed(bench_db, n_courses, options['assignments'])
+                for label, impl in (("legacy", legacy_student_dashboard), ("single", current_student_dashboard)):
+                    impl(bench_db, user_id)  # Warm up caches
+                    before = http_client.requests
+                    impl(bench_db, user_id)
+                    round_trips = http_client.requests - before
+
+                    timings = []
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        impl(bench_db, user_id)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    self.stdout.write(f"{n_courses:>8} {label:>8} {round_trips:>12} "
+                                      f"{statistics.median(timings):>9.1f} {min(timings):>9.1f}")
+        finally:
+            arangodb.db = original_db
+            if not options['keep']:
+                arangodb.sys_db.delete_database(bench_name)
+
+    def seed(self, bench_db, n_courses, n_assignments):
+        for name in ('users', 'courses', 'submission'):
+            bench_db.collection(name).truncate()
+
+        users = bench_db.collection('users')
+        instructor_id = users.insert({"username": "Bench Instructor", "role": "instructor"})["_id"]
+        codes = [f"BENCH{i:03d}" for i in range(n_courses)]
+        user_id = users.insert({"username": "Bench Student", "role": "student", "courses": codes})["_id"]
+
+        courses = []
+        submissions = []
+        for code in codes:
+            assignments = [{
+                "id": f"{code}_{j}",
+                "name": f"Assignment {j}",
+                "description": "Benchmark assignment",
+                "due_date": f"2030-01-{j + 1:02d}",
+                "total_points": 100
+            } for j in range(n_assignments)]
+            courses.append({"class_code": code, "class_title": f"Course {code}",
+                            "instructor_id": instructor_id, "assignments": assignments})
+            # Half of the assignments are submitted, half of those graded
+            for j in range(0, n_assignments, 2):
+                submissions.append({"user_id": user_id, "class_code": code,
+                                    "assignment_id": f"{code}_{j}",
+                                    "grade": 90 if j % 4 == 0 else None, "feedback": None})
+        bench_db.collection('courses').import_bulk(courses)
+        bench_db.collection('submission').import_bulk(submissions)
+        return user_id
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from users.arango_indexes import ensure_indexes, explain_queries
+
+class Command(BaseCommand):
+    help = 'Create the secondary indexes declared in users/arango_indexes.py and report full collection scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the catalogue without creating anything')
+        parser.add_argument('--explain', action='store_true',
+                            help='EXPLAIN the registered queries and report which still do full scans')
+
+    def handle(self, *args, **options):
+        report = ensure_indexes(dry_run=options['dry_run'])
+
+        failures = 0
+        for entry in report:
+            label = f"{entry['collection']}({', '.join(entry['fields'])})"
+            if entry['unique']:
+                label += " unique"
+            status = entry['status']
+            if status.startswith('error'):
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"  {label}: {status}"))
+            elif status == 'created':
+                self.stdout.write(self.style.SUCCESS(f"  {label}: created"))
+            else:
+                self.stdout.write(f"  {label}: {status}")
+
+        created = sum(1 for entry in report if entry['status'] == 'created')
+        self.stdout.write(f"{len(report)} indexes in catalogue, {created} created, {failures} failed")
+
+        if not options['explain']:
+            return
+
+        self.stdout.write("\nQuery plans:")
+        for entry in explain_queries():
+            if entry['error']:
+                self.stdout.write(self.style.ERROR(f"  {entry['name']}: {entry['error']}"))
+            elif entry['full_scans']:
+                self.stdout.write(self.style.WARNING(
+                    f"  {entry['name']}: FULL SCAN on {', '.join(entry['full_scans'])} "
+                    f"(cost {entry['estimated_cost']})"))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"  {entry['name']}: uses {', '.join(entry['indexes']) or 'no collection access'} "
+                    f"(cost {entry['estimated_cost']})"))
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from users.arangodb import db
+from users.blob_store import get_blob_store, decode_legacy_content
+
+class Command(BaseCommand):
+    help = 'Move base64 file_content payloads out of submission, course and course material documents into the blob store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the documents that would be migrated without changing anything')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.store = get_blob_store()
+
+        for collection_name in ('submission', 'course_materials'):
+            migrated, skipped = self.migrate_flat_collection(collection_name)
+            self.stdout.write(f"{collection_name}: {migrated} migrated, {skipped} skipped (not base64)")
+
+        migrated, skipped = self.migrate_course_assignments()
+        self.stdout.write(f"courses.assignments: {migrated} migrated, {skipped} skipped (not base64)")
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING("Dry run: no documents were changed"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Migration completed"))
+
+    def to_blob(self, file_content):
+        """Return a blob reference for a legacy payload, or None to skip it."""
+        data = decode_legacy_content(file_content)
+        if data is None:
+            return None
+        if self.dry_run:
+            return {}
+        return self.store.put_bytes(data)
+
+    def migrate_flat_collection(self, collection_name):
+        # Fetch keys first and each payload individually, so the whole
+        # collection's payloads are never materialised in one cursor.
+        keys = list(db.aql.execute(f"""
+        FOR doc IN {collection_name}
+            FILTER doc.file_content != null AND doc.file_blob == null
+            RETURN doc._key
+        """))
+
+        collection = db.collection(collection_name)
+        migrated = skipped = 0
+        for key in keys:
+            doc = collection.get(key)
+            blob = self.to_blob(doc.get("file_content")) if doc else None
+            if blob is None:
+                skipped += 1
+                continue
+            if not self.dry_run:
+                db.aql.execute(f"""
+                UPDATE @key WITH {{ file_blob: @blob, file_content: null }} IN {collection_name}
+                    OPTIONS {{ keepNull: false }}
+                """, bind_vars={"key": key, "blob": blob})
+            migrated += 1
+        return migrated, skipped
+
+    def migrate_course_assignments(self):
+        keys = list(db.aql.execute("""
+        FOR course IN courses
+            FILTER LENGTH((course.assignments || [])[* FILTER CURRENT.file_content != null]) > 0
+            RETURN course._key
+        """))
+
+        courses = db.collection('courses')
+        migrated = skipped = 0
+        for key in keys:
+            course = courses.get(key)
+            if not course:
+                continue
+            assignments = course.get("assignments", [])
+            for assignment in assignments:
+                if not assignment.get("file_content") or assignment.get("file_blob"):
+                    continue
+                blob = self.to_blob(assignment["file_content"])
+                if blob is None:
+                    skipped += 1
+                    continue
+                assignment.pop("file_content")
+                assignment["file_blob"] = blob
+                migrated += 1
+            if not self.dry_run:
+                courses.update({"_key": key, "assignments": assignments})
+        return migrated, skipped
@@ -9,17 +9,24 @@ from datetime import datetime
 import json
 import base64
 import tempfile
+import uuid
 import numpy as np
 from .arangodb import db
+from .identity_map import cached_lookup, invalidate
+from .vector_index import get_vector_index, invalidate_vector_index
 
-def store_course_material(class_code, assignment_id, file_content, file_name, extracted_text):
+def _find_first(collection_name, filters):
+    documents = list(db.collection(collection_name).find(filters, limit=1))
+    return documents[0] if documents else None
+
+def store_course_material(class_code, assignment_id, file_blob, file_name, extracted_text):
     """
     Store course material in ArangoDB.
     
     Args:
         class_code (str): The class code
         assignment_id (str): The assignment ID
-        file_content (str): Base64-encoded file content
+        file_blob (dict): Blob reference of the file (see users/blob_store.py)
         file_name (str): The file name
         extracted_text (str): Text extracted from the file
         
@@ -33,7 +40,7 @@ def store_course_material(class_code, assignment_id, file_content, file_name, ex
             "class_code": class_code,
             "assignment_id": assignment_id,
             "file_name": file_name,
-            "file_content": file_content,
+            "file_blob": file_blob,
             "extracted_text": extracted_text,
             "created_at": datetime.now().isoformat()
         }
@@ -45,14 +52,17 @@ def store_course_material(class_code, assignment_id, file_content, file_name, ex
         }))
         
         if existing:
-            # Update existing material
+            # Update existing material, dropping any legacy inline payload
             existing_doc = existing[0]
+            existing_doc.pop("file_content", None)
             existing_doc.update(material)
-            materials.update(existing_doc)
+            materials.replace(existing_doc)
+            invalidate('course_materials')
             return existing_doc["_id"]
         else:
             # Insert new material
             result = materials.insert(material)
+            invalidate('course_materials')
             return result["_id"]
             
     except Exception as e:
@@ -92,10 +102,12 @@ def store_rubric(class_code, assignment_id, rubric_items):
             existing_doc = existing[0]
             existing_doc.update(rubric)
             rubrics.update(existing_doc)
+            invalidate('rubrics')
             return existing_doc["_id"]
         else:
             # Insert new rubric
             result = rubrics.insert(rubric)
+            invalidate('rubrics')
             return result["_id"]
             
     except Exception as e:
@@ -135,10 +147,12 @@ def store_material_questions(class_code, assignment_id, questions):
             existing_doc = existing[0]
             existing_doc.update(question_doc)
             material_questions.update(existing_doc)
+            invalidate('material_questions')
             return existing_doc["_id"]
         else:
             # Insert new questions
             result = material_questions.insert(question_doc)
+            invalidate('material_questions')
             return result["_id"]
             
     except Exception as e:
@@ -157,36 +171,44 @@ def store_vector_embeddings(class_code, assignment_id, chunk_data):
     Returns:
         bool: True if successful, False otherwise
     """
+    # The old set is replaced in one transaction, so a vector index built
+    # meanwhile sees either set whole. Every document carries the set's
+    # generation, which lets a reader tell that its build went stale before
+    # persisting it (see vector_index.get_vector_index).
+    generation = uuid.uuid4().hex
+    txn_db = db.begin_transaction(write=['material_vectors'])
     try:
-        # Store the vector embeddings
-        vectors = db.collection('material_vectors')
-        
-        # Delete existing vectors for this assignment
-        existing_query = f"""
+        txn_db.aql.execute("""
         FOR v IN material_vectors
-            FILTER v.class_code == "{class_code}" AND v.assignment_id == "{assignment_id}"
+            FILTER v.class_code == @class_code AND v.assignment_id == @assignment_id
             REMOVE v IN material_vectors
-        """
-        db.aql.execute(existing_query)
-        
-        # Insert new vectors
-        for i, chunk in enumerate(chunk_data):
-            vector_doc = {
-                "class_code": class_code,
-                "assignment_id": assignment_id,
-                "chunk_id": i,
-                "text": chunk["text"],
-                "embedding": chunk["embedding"].tolist() if isinstance(chunk["embedding"], np.ndarray) else chunk["embedding"],
-                "created_at": datetime.now().isoformat()
-            }
-            vectors.insert(vector_doc)
-            
+        """, bind_vars={"class_code": class_code, "assignment_id": assignment_id})
+
+        vector_docs = [{
+            "class_code": class_code,
+            "assignment_id": assignment_id,
+            "chunk_id": i,
+            "generation": generation,
+            "text": chunk["text"],
+            "embedding": chunk["embedding"].tolist() if isinstance(chunk["embedding"], np.ndarray) else chunk["embedding"],
+            "created_at": datetime.now().isoformat()
+        } for i, chunk in enumerate(chunk_data)]
+        if vector_docs:
+            results = txn_db.collection('material_vectors').insert_many(vector_docs, silent=False)
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                raise errors[0]
+        txn_db.commit_transaction()
         return True
             
     except Exception as e:
+        txn_db.abort_transaction()
         print(f"Error storing vector embeddings: {e}")
         return False
 
+    finally:
+        invalidate_vector_index(class_code, assignment_id)
+
 def get_course_material(class_code, assignment_id):
     """
     Get course material from ArangoDB.
@@ -199,16 +221,9 @@ def get_course_material(class_code, assignment_id):
         dict: Course material document if found, None otherwise
     """
     try:
-        materials = db.collection('course_materials')
-        material_list = list(materials.find({
-            "class_code": class_code,
-            "assignment_id": assignment_id
-        }))
-        
-        if material_list:
-            return material_list[0]
-        else:
-            return None
+        filters = {"class_code": class_code, "assignment_id": assignment_id}
+        return cached_lookup('course_materials', filters,
+                             lambda: _find_first('course_materials', filters))
             
     except Exception as e:
         print(f"Error retrieving course material: {e}")
@@ -226,16 +241,9 @@ def get_rubric(class_code, assignment_id):
         dict: Rubric document if found, None otherwise
     """
     try:
-        rubrics = db.collection('rubrics')
-        rubric_list = list(rubrics.find({
-            "class_code": class_code,
-            "assignment_id": assignment_id
-        }))
-        
-        if rubric_list:
-            return rubric_list[0]
-        else:
-            return None
+        filters = {"class_code": class_code, "assignment_id": assignment_id}
+        return cached_lookup('rubrics', filters,
+                             lambda: _find_first('rubrics', filters))
             
     except Exception as e:
         print(f"Error retrieving rubric: {e}")
@@ -253,14 +261,12 @@ def get_material_questions(class_code, assignment_id):
         list: List of questions if found, None otherwise
     """
     try:
-        material_questions = db.collection('material_questions')
-        question_list = list(material_questions.find({
-            "class_code": class_code,
-            "assignment_id": assignment_id
-        }))
+        filters = {"class_code": class_code, "assignment_id": assignment_id}
+        question_doc = cached_lookup('material_questions', filters,
+                                     lambda: _find_first('material_questions', filters))
         
-        if question_list:
-            return question_list[0]["questions"]
+        if question_doc:
+            return question_doc["questions"]
         else:
             return None
             
@@ -294,9 +300,8 @@ def get_vector_embeddings(class_code, assignment_id):
 
 def get_similar_chunks(class_code, assignment_id, query_embedding, top_k=3):
     """
-    Get similar chunks using vector search.
-    This is a placeholder - in a real implementation, you would use ArangoDB's
-    vector search capabilities or implement cosine similarity.
+    Get similar chunks using cosine similarity against the assignment's
+    vector index (see users/vector_index.py).
     
     Args:
         class_code (str): The class code
@@ -308,34 +313,7 @@ def get_similar_chunks(class_code, assignment_id, query_embedding, top_k=3):
         list: List of similar chunks if found, empty list otherwise
     """
     try:
-        vector_docs = get_vector_embeddings(class_code, assignment_id)
-        
-        if not vector_docs:
-            return []
-            
-        # Convert query embedding to numpy array for calculations
-        query_embedding_np = np.array(query_embedding)
-        
-        # Calculate cosine similarity for each vector
-        results = []
-        for doc in vector_docs:
-            # Convert stored embedding back to numpy array
-            doc_embedding = np.array(doc["embedding"])
-            
-            # Calculate cosine similarity
-            similarity = np.dot(query_embedding_np, doc_embedding) / (
-                np.linalg.norm(query_embedding_np) * np.linalg.norm(doc_embedding)
-            )
-            
-            results.append({
-                "chunk_id": doc["chunk_id"],
-                "text": doc["text"],
-                "similarity": float(similarity)
-            })
-        
-        # Sort by similarity (highest first) and take top k
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        return results[:top_k]
+        return get_vector_index(class_code, assignment_id).search(query_embedding, top_k)
             
     except Exception as e:
         print(f"Error performing vector search: {e}")
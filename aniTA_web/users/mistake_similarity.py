@@ -0,0 +1,298 @@
+"""
+Persistent mistake similarity graph.
+
+Clustering used to rebuild the whole similarity graph from every stored
+mistake on each request. Instead, similarity is stored as edges in the
+`similar_mistake` collection and kept current as mistakes come and go:
+
+- Once a grading result's transaction has committed, each new mistake is
+  scored only against the mistakes that share at least one rubric
+  criterion with it (found through the array index on
+  `rubric_criteria_names`). Linking inside the transaction would only see
+  its snapshot, so two gradings committing at the same time would miss
+  each other's mistakes. After the commit, whichever grading links last
+  sees both and links the pair.
+- When mistakes are deleted, their similarity edges go with them.
+
+Each pair is stored once, under a key made from both mistake keys, so
+writing an edge again replaces it instead of duplicating it, and linking
+the same mistakes twice is harmless.
+
+Edges can still go missing, e.g. if a worker dies between the commit and
+the linking. `rebuild_mistake_graph --check` reports drift and exits with
+an error when there is any, so it can be scheduled (e.g. nightly from
+cron) and followed by `rebuild_mistake_graph`, which recomputes every edge
+and applies the difference in bounded batches (see replace_similarity_edges).
+
+Every change bumps a version counter in `graph_versions`, so results
+computed from the graph (see network_simulation/cluster_snapshots.py) can
+record which graph they describe and tell when they are stale. The bump
+happens after the change has committed, never inside a grading
+transaction: every grader would write the same counter document, so
+concurrent transactions would abort on the write-write conflict and lose
+their mistakes. The bump is best effort; a missed one only delays the next
+snapshot until the following change.
+"""
+
+import logging
+import uuid
+from datetime import datetime
+from .arangodb import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'similar_mistake'
+VERSIONS_COLLECTION = 'graph_versions'
+
+# Mistakes are linked when the Jaccard similarity of their rubric criteria
+# exceeds this
+SIMILARITY_THRESHOLD = 0.3
+
+# Stored mistakes sharing any of @criteria; uses the rubric_criteria_names[*] index
+CANDIDATES_QUERY = """
+FOR criterion IN @criteria
+    FOR m IN mistakes
+        FILTER criterion IN m.rubric_criteria_names[*]
+        RETURN DISTINCT KEEP(m, "_id", "rubric_criteria_names")
+"""
+
+
+def bump_graph_version(database=None, attempts=3):
+    """
+    Record that the graph changed. Call it after the change has committed,
+    outside any transaction. Concurrent bumps of the counter can conflict,
+    so each is retried a few times and then given up with a warning.
+
+    Returns:
+        int: The new version, or None if it could not be bumped
+    """
+    database = database or db
+    for attempt in range(attempts):
+        try:
+            versions = database.aql.execute(
+                f"""
+                UPSERT {{_key: @key}}
+                    INSERT {{_key: @key, version: 1}}
+                    UPDATE {{version: OLD.version + 1}}
+                    IN {VERSIONS_COLLECTION}
+                    RETURN NEW.version
+                """,
+                bind_vars={"key": COLLECTION}
+            )
+            return next(iter(versions))
+        except Exception as e:
+            if attempt == attempts - 1:
+                logger.warning(f"Could not bump the similarity graph version: {e}")
+    return None
+
+
+def graph_version(database=None):
+    """Current version of the similarity graph; 0 if it never changed."""
+    database = database or db
+    document = database.collection(VERSIONS_COLLECTION).get(COLLECTION)
+    return document['version'] if document else 0
+
+
+def jaccard(criteria1, criteria2):
+    """Jaccard similarity of two sets of criteria; 0 if either is empty."""
+    if not criteria1 or not criteria2:
+        return 0.0
+    return len(criteria1 & criteria2) / len(criteria1 | criteria2)
+
+
+def similarity_edge(mistake_id1, mistake_id2, weight):
+    """
+    The stored edge for a pair of mistakes, the same whichever order they
+    are given in.
+    """
+    id1, id2 = sorted((mistake_id1, mistake_id2))
+    key1, key2 = id1.split('/', 1)[1], id2.split('/', 1)[1]
+    return {"_key": f"{key1}-{key2}", "_from": id1, "_to": id2, "weight": weight}
+
+
+def link_new_mistakes(mistakes, database=None, threshold=SIMILARITY_THRESHOLD):
+    """
+    Store the similarity edges of newly inserted mistakes.
+
+    The mistakes must already be visible to `database`; call it after their
+    transaction has committed, so mistakes committed concurrently are
+    among the candidates. Only stored mistakes sharing a criterion with one
+    of them are fetched and scored. The graph version is left to the
+    caller (see bump_graph_version).
+
+    Args:
+        mistakes (list): The new mistake documents (`_key` or `_id`, and
+            `rubric_criteria_names`)
+        database: Database or transaction to use; the default connection
+            if omitted
+
+    Returns:
+        int: Number of edges written
+    """
+    database = database or db
+    new_mistakes = [(m.get('_id') or f"mistakes/{m['_key']}", set(m.get('rubric_criteria_names') or []))
+                    for m in mistakes]
+    if not new_mistakes:
+        return 0
+    criteria = set().union(*(criteria for _, criteria in new_mistakes))
+    if not criteria:
+        return 0
+
+    # One round trip for the whole batch; the new mistakes are among the
+    # candidates, so pairs within the batch are found too
+    candidates = [(m['_id'], set(m.get('rubric_criteria_names') or []))
+                  for m in database.aql.execute(CANDIDATES_QUERY, bind_vars={"criteria": sorted(criteria)})]
+
+    edges = {}
+    for mistake_id, mistake_criteria in new_mistakes:
+        for other_id, other_criteria in candidates:
+            if other_id == mistake_id:
+                continue
+            similarity = jaccard(mistake_criteria, other_criteria)
+            if similarity > threshold:
+                edge = similarity_edge(mistake_id, other_id, similarity)
+                edges[edge['_key']] = edge
+
+    if edges:
+        results = database.collection(COLLECTION).insert_many(list(edges.values()), overwrite=True, silent=False)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+    return len(edges)
+
+
+def unlink_mistakes(mistake_ids, database=None):
+    """
+    Remove every similarity edge touching the given mistakes. Safe inside a
+    transaction; the caller bumps the graph version once it has committed.
+
+    Returns:
+        int: Number of edges removed
+    """
+    database = database or db
+    if not mistake_ids:
+        return 0
+    removed = database.aql.execute(
+        f"""
+        FOR e IN {COLLECTION}
+            FILTER e._from IN @ids OR e._to IN @ids
+            REMOVE e IN {COLLECTION}
+            RETURN 1
+        """,
+        bind_vars={"ids": list(mistake_ids)}
+    )
+    return sum(removed)
+
+
+def stored_similarity_edges(database=None):
+    """
+    Yields:
+        tuple: (id1, id2, weight) for every stored edge
+    """
+    database = database or db
+    return database.aql.execute(f"FOR e IN {COLLECTION} RETURN [e._from, e._to, e.weight]",
+                                batch_size=10000)
+
+
+def has_similarity_edges(database=None):
+    database = database or db
+    return database.collection(COLLECTION).count() > 0
+
+
+# One page of a sweep over the stored edges in key order, removing edges
+# the rebuild did not write whose mistakes both predate it, or whose
+# mistakes are gone
+SWEEP_QUERY = f"""
+LET page = (
+    FOR e IN {COLLECTION}
+        FILTER e._key > @after
+        SORT e._key
+        LIMIT @batch_size
+        RETURN e
+)
+LET removed = (
+    FOR e IN page
+        FILTER e.rebuild != @token
+        LET m1 = DOCUMENT(e._from)
+        LET m2 = DOCUMENT(e._to)
+        FILTER m1 == null OR m2 == null OR (m1.created_at < @started AND m2.created_at < @started)
+        REMOVE e IN {COLLECTION}
+        RETURN 1
+)
+RETURN {{last: LAST(page)._key, removed: LENGTH(removed)}}
+"""
+
+
+def replace_similarity_edges(pairs, database=None, batch_size=10000, started=None):
+    """
+    Make the stored graph match the given pairs, in bounded batches that
+    each commit on their own, so graphs of millions of edges stay within
+    ArangoDB's transaction limits and the graph is never empty meanwhile.
+
+    Every computed edge is written (replacing the stored one) with a
+    marker for this rebuild, then one sweep over the stored edges removes
+    the unmarked ones. Edges linked while the rebuild ran are kept when
+    one of their mistakes is newer than `started`; edges of mistakes
+    deleted meanwhile are dropped.
+
+    Args:
+        pairs (iterable): (id1, id2, weight) tuples, each pair once
+        started (str): ISO time (UTC) before the mistakes the pairs were
+            computed from were read; now if omitted
+
+    Returns:
+        dict: Numbers of edges `written` and `removed`
+    """
+    database = database or db
+    started = started or datetime.utcnow().isoformat()
+    token = uuid.uuid4().hex
+    collection = database.collection(COLLECTION)
+
+    written = 0
+    batch = []
+    for id1, id2, weight in pairs:
+        batch.append(dict(similarity_edge(id1, id2, weight), rebuild=token))
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, overwrite=True)
+            written += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, overwrite=True)
+        written += len(batch)
+
+    removed = 0
+    after = ""
+    while True:
+        page = next(iter(database.aql.execute(SWEEP_QUERY, bind_vars={
+            "after": after, "batch_size": batch_size, "token": token, "started": started})))
+        removed += page["removed"]
+        if page["last"] is None:
+            break
+        after = page["last"]
+
+    bump_graph_version(database)
+    return {"written": written, "removed": removed}
+
+
+def compare_similarity_edges(pairs, database=None, tolerance=1e-9):
+    """
+    Compare freshly computed pairs with the stored graph.
+
+    Returns:
+        dict: `missing` (computed but not stored), `extra` (stored but not
+        computed) and `changed` (stored with a different weight) edge keys
+    """
+    expected = {}
+    for id1, id2, weight in pairs:
+        edge = similarity_edge(id1, id2, weight)
+        expected[edge['_key']] = weight
+
+    extra, changed = [], []
+    for id1, id2, weight in stored_similarity_edges(database):
+        key = similarity_edge(id1, id2, weight)['_key']
+        want = expected.pop(key, None)
+        if want is None:
+            extra.append(key)
+        elif abs(want - (weight or 0)) > tolerance:
+            changed.append(key)
+    return {"missing": sorted(expected), "extra": extra, "changed": changed}
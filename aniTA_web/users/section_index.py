@@ -0,0 +1,154 @@
+"""
+Per-assignment inverted index over course material sections.
+
+Matching a text chunk to the section it came from used to reload every
+section of the assignment and rebuild its word set on each call. A
+`SectionIndex` is built once per assignment (token -> postings with BM25
+weights), kept in a process-wide LRU, and ranks sections for a chunk by
+touching only the postings of the chunk's tokens.
+
+Grading runs in several worker processes, so a cached index is checked
+against a stamp read from the database (the number of sections and the
+newest `created_at`) before it is reused: sections written by another
+process are picked up on the next lookup. Assignments without sections
+are not cached at all.
+"""
+
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from django.conf import settings
+from .arangodb import db
+
+TOKEN_RE = re.compile(r"\w+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SectionIndex:
+    """
+    BM25 index over one assignment's sections.
+
+    Args:
+        sections (list): (section_id, content) pairs
+    """
+
+    def __init__(self, sections):
+        self.section_ids = []
+        self.postings = {}
+        doc_lengths = []
+
+        for doc_index, (section_id, content) in enumerate(sections):
+            tokens = tokenize(content or "")
+            self.section_ids.append(section_id)
+            doc_lengths.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                self.postings.setdefault(token, []).append((doc_index, tf))
+
+        n_docs = len(self.section_ids)
+        avg_length = (sum(doc_lengths) / n_docs) if n_docs else 0.0
+
+        # Precompute each posting's full BM25 contribution so a query is
+        # just a sum over the postings of its tokens.
+        for token, postings in self.postings.items():
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            weighted = []
+            for doc_index, tf in postings:
+                norm = K1 * (1 - B + B * doc_lengths[doc_index] / avg_length) if avg_length else K1
+                weighted.append((doc_index, idf * tf * (K1 + 1) / (tf + norm)))
+            self.postings[token] = weighted
+
+    def __len__(self):
+        return len(self.section_ids)
+
+    def rank(self, text, top_k=None):
+        """
+        Rank sections by BM25 relevance to a text chunk.
+
+        Args:
+            text (str): The chunk to match
+            top_k (int): Maximum number of results (all matches if None)
+
+        Returns:
+            list: (section_id, score) tuples, best first; sections sharing no
+            token with the chunk are omitted
+        """
+        scores = {}
+        for token in set(tokenize(text)):
+            for doc_index, weight in self.postings.get(token, ()):
+                scores[doc_index] = scores.get(doc_index, 0.0) + weight
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if top_k is not None:
+            ranked = ranked[:top_k]
+        return [(self.section_ids[doc_index], score) for doc_index, score in ranked]
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _sections_stamp(assignment_id):
+    """(count, newest created_at) of an assignment's sections, from the assignment_id index."""
+    return tuple(next(iter(db.aql.execute("""
+        FOR s IN sections
+            FILTER s.assignment_id == @assignment_id
+            COLLECT AGGREGATE count = COUNT(1), latest = MAX(s.created_at)
+            RETURN [count, latest]
+        """, bind_vars={"assignment_id": assignment_id}), [0, None])))
+
+
+def _load_sections(assignment_id):
+    return [
+        (section["_id"], section.get("content", ""))
+        for section in db.aql.execute("""
+        FOR s IN sections
+            FILTER s.assignment_id == @assignment_id
+            RETURN KEEP(s, "_id", "content")
+        """, bind_vars={"assignment_id": assignment_id})
+    ]
+
+
+def get_section_index(assignment_id):
+    """
+    Return the section index of an assignment, building it on first use.
+
+    Entries are evicted least-recently-used beyond SECTION_INDEX_CACHE_SIZE
+    assignments, and rebuilt when the assignment's sections stamp changes.
+    """
+    max_entries = getattr(settings, "SECTION_INDEX_CACHE_SIZE", 64)
+    stamp = _sections_stamp(assignment_id)
+    if not stamp[0]:
+        # Sections may not have been stored yet; do not cache an empty index
+        return SectionIndex([])
+
+    with _cache_lock:
+        entry = _cache.get(assignment_id)
+        if entry and entry[0] == stamp:
+            _cache.move_to_end(assignment_id)
+            return entry[1]
+
+    index = SectionIndex(_load_sections(assignment_id))
+
+    with _cache_lock:
+        _cache[assignment_id] = (stamp, index)
+        _cache.move_to_end(assignment_id)
+        while len(_cache) > max_entries:
+            _cache.popitem(last=False)
+    return index
+
+
+def invalidate_section_index(assignment_id=None):
+    """Drop the cached index of an assignment (or of all assignments)."""
+    with _cache_lock:
+        if assignment_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(assignment_id, None)
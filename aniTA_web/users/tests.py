@@ -1,3 +1,159 @@
-from django.test import TestCase
+import threading
+import uuid
+from unittest import mock
+from django.test import SimpleTestCase
+from users import graph_ops, mistake_similarity
+from users.graph_ops import GradingGraphBatch
 
-# Create your tests here.
+
+class WriteConflict(Exception):
+    """What ArangoDB raises when two transactions write the same document."""
+
+
+class FakeArango:
+    """
+    Just enough of an ArangoDB database for GradingGraphBatch: documents
+    by collection, stream transactions that only see committed writes and
+    their own, and write-write conflicts when an open transaction holds a
+    document someone else writes.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.documents = {}
+        self.locks = {}
+        self.transactions = []
+        self.aql = FakeAQL(self, None)
+
+    def collection(self, name):
+        return FakeCollection(self, None, name)
+
+    def begin_transaction(self, read=None, write=None):
+        txn = FakeTransaction(self, write or [])
+        self.transactions.append(txn)
+        return txn
+
+    def write(self, txn, name, key, document):
+        with self.lock:
+            holder = self.locks.get((name, key))
+            if holder is not None and holder is not txn:
+                raise WriteConflict(f"write-write conflict on {name}/{key}")
+            if txn is None:
+                self.documents.setdefault(name, {})[key] = document
+            else:
+                if name not in txn.write_collections:
+                    raise ValueError(f"{name} is not in the transaction's write collections")
+                self.locks[(name, key)] = txn
+                txn.pending[(name, key)] = document
+
+    def read(self, txn, name):
+        with self.lock:
+            documents = dict(self.documents.get(name, {}))
+            if txn is not None:
+                documents.update({key: doc for (collection, key), doc in txn.pending.items() if collection == name})
+            return list(documents.values())
+
+
+class FakeCollection:
+    def __init__(self, database, txn, name):
+        self.database, self.txn, self.name = database, txn, name
+
+    def insert_many(self, documents, silent=False, overwrite=False):
+        for document in documents:
+            key = document.get('_key') or uuid.uuid4().hex
+            self.database.write(self.txn, self.name, key, dict(document, _id=f"{self.name}/{key}"))
+        return [{} for _ in documents]
+
+    def get(self, key):
+        return {d['_key']: d for d in self.database.read(self.txn, self.name)}.get(key)
+
+
+class FakeAQL:
+    def __init__(self, database, txn):
+        self.database, self.txn = database, txn
+
+    def execute(self, query, bind_vars=None, **kwargs):
+        bind_vars = bind_vars or {}
+        if 'UPSERT' in query:
+            name = mistake_similarity.VERSIONS_COLLECTION
+            with self.database.lock:
+                current = FakeCollection(self.database, self.txn, name).get(bind_vars['key'])
+                version = (current['version'] if current else 0) + 1
+                self.database.write(self.txn, name, bind_vars['key'], {"_key": bind_vars['key'], "version": version})
+            return iter([version])
+        if query == mistake_similarity.CANDIDATES_QUERY:
+            criteria = set(bind_vars['criteria'])
+            return iter([m for m in self.database.read(self.txn, 'mistakes')
+                         if criteria & set(m.get('rubric_criteria_names') or [])])
+        raise NotImplementedError(query)
+
+
+class FakeTransaction:
+    # Both transactions reach their commit before either commits
+    overlap = None
+
+    def __init__(self, database, write_collections):
+        self.database = database
+        self.write_collections = list(write_collections)
+        self.pending = {}
+        self.aql = FakeAQL(database, self)
+
+    def collection(self, name):
+        return FakeCollection(self.database, self, name)
+
+    def commit_transaction(self):
+        if self.overlap is not None:
+            self.overlap.wait(timeout=5)
+        with self.database.lock:
+            for (name, key), document in self.pending.items():
+                self.database.documents.setdefault(name, {})[key] = document
+                del self.database.locks[(name, key)]
+
+    def abort_transaction(self):
+        if self.overlap is not None:
+            self.overlap.abort()
+        with self.database.lock:
+            for name_key in self.pending:
+                self.database.locks.pop(name_key, None)
+
+
+class OverlappingGradingCommitTests(SimpleTestCase):
+    def setUp(self):
+        self.database = FakeArango()
+        for module in (graph_ops, mistake_similarity):
+            patcher = mock.patch.object(module, 'db', self.database)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def batch(self, submission_id):
+        batch = GradingGraphBatch(f"users/{submission_id}", submission_id, "a1", {})
+        batch.add_result_item({"question": "Q1", "score": 50,
+                               "rubric_criteria": [{"criteria": "Units"}, {"criteria": "Method"}]}, [])
+        return batch
+
+    def test_overlapping_commits_both_store_their_mistakes(self):
+        batches = [self.batch("1"), self.batch("2")]
+        results, errors = {}, []
+        FakeTransaction.overlap = threading.Barrier(len(batches))
+        self.addCleanup(setattr, FakeTransaction, 'overlap', None)
+
+        def commit(batch):
+            try:
+                results[batch.submission_id] = batch.commit()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=commit, args=(batch,)) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([len(results[batch.submission_id]) for batch in batches], [1, 1])
+        self.assertEqual(len(self.database.documents['mistakes']), 2)
+        for txn in self.database.transactions:
+            self.assertNotIn(mistake_similarity.VERSIONS_COLLECTION, txn.write_collections)
+        # Linked after commit, so the two mistakes found each other
+        self.assertEqual(len(self.database.documents[mistake_similarity.COLLECTION]), 1)
+        self.assertEqual(mistake_similarity.graph_version(), 2)
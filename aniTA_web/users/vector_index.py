@@ -0,0 +1,233 @@
+"""
+In-memory vector index over `material_vectors`.
+
+Each (class_code, assignment_id) gets one float32 matrix of L2-normalised
+chunk embeddings, so a similarity search is a single matrix-vector product
+followed by `argpartition` for the top k. Matrices are persisted as `.npy`
+files under VECTOR_INDEX["DIR"] and opened with `mmap_mode="r"`, so the
+gunicorn workers on a host share the same pages instead of each holding a
+copy. A process-wide LRU keeps the opened indexes; `store_vector_embeddings`
+invalidates them.
+
+`store_vector_embeddings` replaces an assignment's vectors in one
+transaction and tags them with a generation. A rebuild that raced with it
+(read the old set, then persisted after the invalidation) would leave the
+old set on disk for every process, so a rebuild checks the generation
+again after persisting and removes its files if the vectors were replaced.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+from .arangodb import db
+
+
+class VectorIndex:
+    """
+    Normalised embedding matrix of one assignment plus its chunk metadata.
+
+    Args:
+        chunk_ids (list): chunk_id of each matrix row
+        texts (list): Chunk text of each matrix row
+        matrix (np.ndarray): (n_chunks, dim) float32, rows L2-normalised
+        mtime (float): Modification time of the backing .npy file, if any
+    """
+
+    def __init__(self, chunk_ids, texts, matrix, mtime=None):
+        self.chunk_ids = chunk_ids
+        self.texts = texts
+        self.matrix = matrix
+        self.mtime = mtime
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def search(self, query_embedding, top_k=3):
+        """
+        Return the top_k chunks by cosine similarity to a query embedding.
+
+        Returns:
+            list: Dicts with chunk_id, text and similarity, best first
+        """
+        if not len(self) or top_k <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        if query.shape[0] != self.matrix.shape[1]:
+            print(f"Query embedding has dimension {query.shape[0]}, index has {self.matrix.shape[1]}")
+            return []
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        scores = self.matrix @ (query / norm)
+        k = min(top_k, len(scores))
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        return [{
+            "chunk_id": self.chunk_ids[i],
+            "text": self.texts[i],
+            "similarity": float(scores[i])
+        } for i in top]
+
+
+def normalise_rows(embeddings):
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2:
+        return np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _index_dir():
+    return getattr(settings, "VECTOR_INDEX", {}).get("DIR")
+
+
+def _paths(class_code, assignment_id):
+    directory = _index_dir()
+    if not directory:
+        return None, None
+    key = hashlib.sha1(f"{class_code}\x00{assignment_id}".encode("utf-8")).hexdigest()
+    return os.path.join(directory, f"{key}.npy"), os.path.join(directory, f"{key}.json")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+def _current_generation(class_code, assignment_id):
+    """Generation of the stored vectors of an assignment (None if it has none)."""
+    return next(iter(db.aql.execute("""
+        FOR v IN material_vectors
+            FILTER v.class_code == @class_code AND v.assignment_id == @assignment_id
+            LIMIT 1
+            RETURN v.generation
+        """, bind_vars={"class_code": class_code, "assignment_id": assignment_id})), None)
+
+
+def _build_from_db(class_code, assignment_id):
+    chunk_ids, texts, embeddings = [], [], []
+    generation = None
+    for doc in db.aql.execute("""
+        FOR v IN material_vectors
+            FILTER v.class_code == @class_code AND v.assignment_id == @assignment_id
+            SORT v.chunk_id
+            RETURN KEEP(v, "chunk_id", "text", "embedding", "generation")
+        """, bind_vars={"class_code": class_code, "assignment_id": assignment_id}):
+        chunk_ids.append(doc.get("chunk_id"))
+        texts.append(doc.get("text", ""))
+        embeddings.append(doc.get("embedding") or [])
+        generation = doc.get("generation")
+    matrix = normalise_rows(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    return chunk_ids, texts, matrix, generation
+
+
+def _persist(class_code, assignment_id, chunk_ids, texts, matrix):
+    """Write the index files atomically (metadata first, matrix last)."""
+    npy_path, meta_path = _paths(class_code, assignment_id)
+    if not npy_path or not len(chunk_ids):
+        return
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+    pid = os.getpid()
+
+    tmp_meta = f"{meta_path}.{pid}.tmp"
+    with open(tmp_meta, "w") as f:
+        json.dump({"chunk_ids": chunk_ids, "texts": texts}, f)
+    os.replace(tmp_meta, meta_path)
+
+    tmp_npy = f"{npy_path}.{pid}.tmp"
+    with open(tmp_npy, "wb") as f:
+        np.save(f, matrix)
+    os.replace(tmp_npy, npy_path)
+
+
+def _load_persisted(class_code, assignment_id):
+    npy_path, meta_path = _paths(class_code, assignment_id)
+    mtime = _mtime(npy_path)
+    if mtime is None:
+        return None
+    try:
+        matrix = np.load(npy_path, mmap_mode="r")
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if len(meta["chunk_ids"]) != matrix.shape[0]:
+        # Caught between another worker's metadata and matrix writes
+        return None
+    return VectorIndex(meta["chunk_ids"], meta["texts"], matrix, mtime)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_vector_index(class_code, assignment_id):
+    """
+    Return the vector index of an assignment.
+
+    Lookup order: this process's LRU (if its backing file is unchanged), the
+    persisted .npy, then a rebuild from `material_vectors` which is written
+    back to disk for the other workers. Indexes with no file behind them
+    (e.g. an assignment with no material yet) are not cached.
+    """
+    key = (class_code, assignment_id)
+    npy_path, _ = _paths(class_code, assignment_id)
+
+    with _cache_lock:
+        index = _cache.get(key)
+        if index is not None and (npy_path is None or index.mtime == _mtime(npy_path)):
+            _cache.move_to_end(key)
+            return index
+
+    index = _load_persisted(class_code, assignment_id)
+    if index is None:
+        chunk_ids, texts, matrix, generation = _build_from_db(class_code, assignment_id)
+        try:
+            _persist(class_code, assignment_id, chunk_ids, texts, matrix)
+        except OSError as e:
+            print(f"Could not persist vector index for {class_code}/{assignment_id}: {e}")
+        if _current_generation(class_code, assignment_id) != generation:
+            # Replaced while building; the writer's invalidation may have run
+            # before the files above were written, so remove them here
+            invalidate_vector_index(class_code, assignment_id)
+            return VectorIndex(chunk_ids, texts, matrix)
+        index = _load_persisted(class_code, assignment_id) or VectorIndex(chunk_ids, texts, matrix)
+
+    if index.mtime is None and npy_path is not None:
+        # Not on disk (empty, or the write failed), so the freshness check
+        # above could never notice another worker persisting the real
+        # index; rebuild on the next call instead of caching
+        return index
+
+    max_entries = getattr(settings, "VECTOR_INDEX", {}).get("CACHE_SIZE", 32)
+    with _cache_lock:
+        _cache[key] = index
+        _cache.move_to_end(key)
+        while len(_cache) > max_entries:
+            _cache.popitem(last=False)
+    return index
+
+
+def invalidate_vector_index(class_code, assignment_id):
+    """Drop the cached and persisted index of an assignment."""
+    with _cache_lock:
+        _cache.pop((class_code, assignment_id), None)
+    for path in _paths(class_code, assignment_id):
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass